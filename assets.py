@@ -0,0 +1,226 @@
+import os
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pygame
+import numpy as np
+
+from meshes import Mesh, MeshData, mesh_data_cache, load_materials, read_obj_cached, read_obj_file
+from textures import Atlas
+
+
+class AssetLoader:
+    """
+    Loads obj files (with their textures) and textures in the background, on a pool of worker threads.\n
+    Workers read obj and mtl files, decode textures and build mesh data (and levels of detail).
+    Anything shared (the atlas, the mesh data cache, the renderer) is only modified on the main thread,
+    by poll(), which registers the assets that finished since it was last called.\n
+    Every request returns a Future, resolved by poll() (so its callbacks run on the main thread).
+    Requests for the same file share one load, textures are decoded once per file.
+    Registering may need more work on the workers (ex: levels of detail missing from an already loaded file),
+    the request is then registered once that work is done.\n
+    Typical use: make requests (or load_manifest), then call poll() every frame,
+    showing `progress` while `pending`
+    """
+
+    __slots__ = [
+        'atlas',
+        'renderer',
+        'cache',
+        'total',
+        'finished',
+        '__pool',
+        '__jobs',
+        '__textures',
+        '__lock',
+        '__requests',
+    ]
+
+    def __init__(self, atlas: Atlas, renderer = None, workers: int = None, cache: bool = True):
+        """atlas:    textures of loaded assets are added to it
+        renderer: if given, meshes requested with positions are added to it when loaded
+        workers:  amount of worker threads (None for ThreadPoolExecutor's default)
+        cache:    whether obj files are read through their binary cache (see read_obj_cached)"""
+        self.atlas: Atlas = atlas
+        self.renderer = renderer
+        self.cache: bool = cache
+
+        # amount of requests made, and registered (loaded or failed)
+        self.total: int = 0
+        self.finished: int = 0
+
+        self.__pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='assets')
+        # work being done on the pool, shared by requests for the same asset:
+        #   jobs:     {(kind, absolute path, scale or alias): future of the worker's result}
+        #   textures: {absolute path: future of decoded pixels}, shared by every job using the texture
+        self.__jobs: dict[tuple, Future] = {}
+        self.__textures: dict[str, Future] = {}
+        self.__lock: threading.Lock = threading.Lock()
+        # requests not registered yet, in order: (future of the work they wait for, future returned to caller, register function)
+        #   register is called with the work's result, and returns the request's result,
+        #   or a future of more work (submitted to the pool), register is then called again with its result
+        self.__requests: list[tuple] = []
+
+    @property
+    def pending(self) -> int:
+        "Amount of requests not registered yet"
+        return self.total - self.finished
+
+    @property
+    def progress(self) -> float:
+        "Fraction of requests registered (1 if none were made)"
+        return self.finished/self.total if (self.total) else 1.0
+
+    def load(self, filepath: str, scale = 0, positions = (), lods: int = 0) -> Future:
+        """Request an obj file (see parse_obj_file for scale). The future's result is its MeshData
+        (shared with load_mesh_data, the file is only loaded once).\n
+        A mesh is placed at each of positions, and added to the renderer, once loaded.
+        If lods is set, up to that many levels of detail are generated (on the workers)"""
+        key = ('obj', os.path.abspath(filepath), scale)
+        cache_key = (id(self.atlas), key[1], scale)
+
+        def register(result):
+            if (isinstance(result, list)):
+                # levels of detail generated on the workers (see below)
+                data = mesh_data_cache[cache_key]
+                if (len(result) > len(data.lods)):
+                    data.lods = result
+            else:
+                data, materials, decoded = result
+                if (cache_key not in mesh_data_cache):
+                    # textures of the data are material indexes until materials are added to the atlas
+                    lookup = load_materials(self.atlas, materials, os.path.dirname(filepath), decoded)
+                    for level in (data, *data.lods):
+                        level.textures = lookup[level.textures]
+                    mesh_data_cache[cache_key] = data
+                data = mesh_data_cache[cache_key]
+                if (len(data.lods) < lods):
+                    # the file was loaded with fewer levels before, generate them on the workers
+                    #   (from a copy, so the data in use isn't modified until they are all done)
+                    return self.__pool.submit(lambda: MeshData.from_indexed(
+                        data.vertices, data.indices, data.uvs, data.uv_indices, data.textures,
+                    ).generate_lods(lods))
+
+            if (self.renderer is not None):
+                for position in positions:
+                    self.renderer.add_mesh(Mesh.from_data(data, position))
+            return data
+
+        return self.__request(key, lambda: self.__read_obj(filepath, scale, lods), register)
+
+    def load_texture(self, filepath: str, alias: str = None) -> Future:
+        """Request a texture, added to the atlas under alias (defaults to filepath).
+        The future's result is its index in the atlas"""
+        alias = filepath if (alias is None) else alias
+        key = ('texture', os.path.abspath(filepath), alias)
+
+        def register(pixels) -> int:
+            self.atlas.add_tex(alias, pixels)
+            return self.atlas[alias]
+
+        return self.__request(key, lambda: self.__decode(os.path.abspath(filepath)), register)
+
+    def load_manifest(self, manifest) -> list[Future]:
+        """Request every asset of a manifest: a list of entries (or the path of a json file holding one).
+        Entries are dicts, either
+            {"obj": path, "scale": 0, "positions": [], "lods": 0}   (see load, only "obj" is required)
+            {"texture": path, "alias": path}                        (see load_texture, only "texture" is required)
+        Paths in a manifest file are relative to its directory. Returns futures, in order of entries"""
+        dirpath = ''
+        if (isinstance(manifest, str)):
+            dirpath = os.path.dirname(manifest)
+            with open(manifest) as file:
+                manifest = json.load(file)
+
+        futures = []
+        for entry in manifest:
+            if ('obj' in entry):
+                futures.append(self.load(
+                    os.path.join(dirpath, entry['obj']), entry.get('scale', 0),
+                    [tuple(position) for position in entry.get('positions', ())], entry.get('lods', 0),
+                ))
+            elif ('texture' in entry):
+                futures.append(self.load_texture(os.path.join(dirpath, entry['texture']), entry.get('alias')))
+            else:
+                raise ValueError(f"manifest entry must have an 'obj' or 'texture' key: {entry}")
+        return futures
+
+    def poll(self) -> int:
+        """Register every asset whose loading finished, resolving their futures. Assets are registered
+        as soon as they finish (a slow asset doesn't hold back the ones requested after it),
+        finished requests are registered in the order they were made.
+        Must be called on the main thread. Returns amount of requests registered"""
+        registered = 0
+        # (callbacks of resolved futures may make new requests, which are checked on the next pass)
+        while (True):
+            finished, pending = [], []
+            for request in self.__requests:
+                (finished if (request[0].done()) else pending).append(request)
+            if (not finished):
+                return registered
+            self.__requests = pending
+
+            for work, future, register in finished:
+                try:
+                    result = register(work.result())
+                    if (isinstance(result, Future)):
+                        # more work to do on the workers, register again once it's done
+                        self.__requests.append((result, future, register))
+                        continue
+                    future.set_result(result)
+                except Exception as error:
+                    future.set_exception(error)
+                self.finished += 1
+                registered += 1
+
+    def wait(self) -> None:
+        "Block until every request is registered"
+        while (self.__requests):
+            self.__requests[0][0].exception() # (waits for the oldest request)
+            self.poll()
+
+    def close(self) -> None:
+        "Stop the workers (loads that haven't started are cancelled)"
+        self.__pool.shutdown(wait=False, cancel_futures=True)
+
+    def __request(self, key: tuple, work, register) -> Future:
+        if (key not in self.__jobs):
+            self.__jobs[key] = self.__pool.submit(work)
+        future = Future()
+        self.__requests.append((self.__jobs[key], future, register))
+        self.total += 1
+        return future
+
+    # run on workers
+    def __read_obj(self, filepath: str, scale, lods: int) -> tuple:
+        "Read an obj file, returns (data, materials, decoded textures), textures of data are material indexes"
+        vertices, indices, uvs, uv_indices, face_materials, materials, _ = (
+            read_obj_cached(filepath, scale) if (self.cache) else read_obj_file(filepath, scale)
+        )
+        dirpath = os.path.dirname(filepath)
+        decoded = {
+            os.path.join(dirpath, texture_path): self.__decode(os.path.abspath(os.path.join(dirpath, texture_path)))
+            for _, texture_path in materials if (texture_path is not None)
+        }
+
+        # (levels of detail keep material borders, so they keep texture borders once materials are mapped)
+        data = MeshData.from_indexed(vertices, indices, uvs, uv_indices, face_materials)
+        if (lods):
+            data.generate_lods(lods)
+        return data, materials, decoded
+
+    def __decode(self, path: str) -> np.ndarray:
+        "Pixels of a texture (see array3d), decoded once: the first worker to need it decodes it, others wait for it"
+        with self.__lock:
+            owner = path not in self.__textures
+            if (owner):
+                self.__textures[path] = Future()
+            future = self.__textures[path]
+
+        if (owner):
+            try:
+                future.set_result(pygame.surfarray.array3d(pygame.image.load(path)))
+            except Exception as error:
+                future.set_exception(error)
+        return future.result()
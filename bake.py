@@ -0,0 +1,135 @@
+import numpy as np
+
+from meshes import Mesh
+
+# Baking static geometry: meshes which never move are merged into a few large meshes (one per chunk).
+# Fewer meshes means less per mesh work every frame (reading positions, culling, transforming),
+#   and faces hidden between touching meshes (ex: the shared sides of neighbouring cubes)
+#   are removed once, instead of being transformed, clipped and backface culled every frame.
+
+# decimals points are rounded to when comparing them (points of different meshes,
+#   moved by their position, may not be exactly equal)
+MATCH_DECIMALS = 6
+
+
+def bake_static(meshes: list[Mesh], chunk_size: float = 50, remove_hidden: bool = True) -> list[Mesh]:
+    """
+    Merge meshes into one mesh per chunk (meshes are grouped by position, into cubes of chunk_size).\n
+    If remove_hidden is set, faces of different meshes which coincide with each other and face
+    opposite ways are removed (they are between two meshes that touch, so can never be seen).
+    Note this assumes meshes are closed and opaque.\n
+    Per face textures and uvs are kept. The given meshes aren't modified: add the returned meshes
+    to a renderer instead of them
+    """
+    if (not meshes):
+        return []
+
+    # every triangle, in world space
+    points = np.concatenate([mesh.data.mesh + mesh.position for mesh in meshes])
+    uv_points = np.concatenate([mesh.data.uv_mesh for mesh in meshes])
+    textures = np.concatenate([mesh.data.textures for mesh in meshes])
+    # mesh each triangle came from
+    sources = np.repeat(np.arange(len(meshes)), [len(mesh.data.indices) for mesh in meshes])
+
+    keep = np.ones(len(points), dtype=np.bool_)
+    if (remove_hidden):
+        keep = ~hidden_faces(points, sources)
+
+    chunks = np.floor(np.asarray([mesh.position for mesh in meshes], dtype=np.double)/chunk_size).astype(np.int64)[sources]
+    baked = []
+    for chunk in np.unique(chunks[keep], axis=0):
+        selected = keep & np.all(chunks == chunk, axis=1)
+        # points are stored relative to chunk's corner (its position)
+        origin = chunk*chunk_size
+        baked.append(Mesh(
+            points[selected] - origin, [*uv_points[selected]], textures[selected],
+            position=tuple(float(coord) for coord in origin),
+        ))
+    return baked
+
+
+def hidden_faces(points: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Which triangles are hidden between touching meshes, args:
+        points:  (n, 3, 3) array of triangles (world space)
+        sources: (n,) array, the mesh each triangle belongs to
+    Faces of different meshes with the same corners, facing opposite ways, are hidden.
+    Faces are matched as triangles, then as quads (two triangles of a mesh sharing an edge,
+    in the same plane), so quads split along different diagonals still match
+    """
+    rounded = np.round(points, MATCH_DECIMALS)
+    normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    hidden = np.zeros(len(points), dtype=np.bool_)
+
+    # triangles (each face is a group of 1 triangle)
+    faces = np.arange(len(points))[:, None]
+    hidden[faces[opposite_pairs(rounded, normals, sources)]] = True
+
+    # quads, from triangles left
+    faces = quad_pairs(rounded, normals, sources, np.flatnonzero(~hidden))
+    if (len(faces)):
+        # the 4 corners of each quad (the second triangle's corner that isn't on the shared edge is added)
+        corners = np.concatenate((rounded[faces[:, 0]], rounded[faces[:, 1]]), axis=1)
+        corners = [np.unique(quad, axis=0) for quad in corners]
+        # (pairs that don't have 4 distinct corners aren't quads)
+        faces = faces[[len(quad) == 4 for quad in corners]]
+        corners = np.asarray([quad for quad in corners if (len(quad) == 4)]).reshape(-1, 4, 3)
+        hidden[faces[opposite_pairs(corners, normals[faces[:, 0]], sources[faces[:, 0]])]] = True
+
+    return hidden
+
+def opposite_pairs(corners: np.ndarray, normals: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """Indexes of the faces (given by their corners, (faces, k, 3) array) that have exactly one match:
+    a face of another mesh, with the same corners, facing the opposite way"""
+    if (not len(corners)):
+        return np.empty(0, dtype=np.int64)
+    # corners in a fixed order, so faces with the same corners have the same key
+    order = np.lexsort((corners[..., 2], corners[..., 1], corners[..., 0]), axis=-1)
+    keys = np.take_along_axis(corners, order[..., None], axis=1).reshape(len(corners), -1)
+    _, groups, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    groups = groups.reshape(-1)
+
+    # faces in groups of exactly 2, next to each other
+    paired = np.flatnonzero(counts[groups] == 2)
+    paired = paired[np.argsort(groups[paired], kind='stable')].reshape(-1, 2)
+    first, second = paired[:, 0], paired[:, 1]
+    matches = (sources[first] != sources[second]) & (np.einsum('ij,ij->i', normals[first], normals[second]) < 0)
+    return paired[matches].reshape(-1)
+
+def quad_pairs(rounded: np.ndarray, normals: np.ndarray, sources: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """(quads, 2) array of pairs of candidate triangles forming a quad: they belong to the same mesh,
+    share an edge and lie in the same plane, and neither has another such neighbour"""
+    if (not len(candidates)):
+        return np.empty((0, 2), dtype=np.int64)
+
+    # every edge of every candidate, as (source, both points in a fixed order)
+    starts = rounded[candidates]
+    ends = np.roll(starts, -1, axis=1)
+    forward = point_less(starts, ends)[..., None]
+    lo, hi = np.where(forward, starts, ends), np.where(forward, ends, starts)
+    keys = np.concatenate((
+        np.repeat(sources[candidates], 3)[:, None].astype(np.double), lo.reshape(-1, 3), hi.reshape(-1, 3),
+    ), axis=1)
+    tris = np.repeat(candidates, 3)
+
+    _, groups, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    groups = groups.reshape(-1)
+    shared = np.flatnonzero(counts[groups] == 2)
+    shared = shared[np.argsort(groups[shared], kind='stable')].reshape(-1, 2)
+    pairs = tris[shared]
+
+    # same plane, facing the same way
+    unit = normals/np.maximum(np.linalg.norm(normals, axis=1), 1e-300)[:, None]
+    coplanar = np.einsum('ij,ij->i', unit[pairs[:, 0]], unit[pairs[:, 1]]) > 1 - 1e-9
+    pairs = pairs[coplanar]
+
+    # only triangles with a single coplanar neighbour (so which quad they belong to is clear)
+    neighbours = np.bincount(pairs.reshape(-1), minlength=len(rounded))
+    return pairs[(neighbours[pairs[:, 0]] == 1) & (neighbours[pairs[:, 1]] == 1)]
+
+def point_less(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    "Whether each start point comes before its end point (comparing x, then y, then z)"
+    diff = np.sign(ends - starts)
+    # first non zero component decides
+    first = np.argmax(diff != 0, axis=-1)
+    return np.take_along_axis(diff, first[..., None], axis=-1)[..., 0] > 0
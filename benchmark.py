@@ -0,0 +1,514 @@
+"""
+Headless benchmark for Renderer3D
+
+Builds fixed scenes, renders them under SDL's dummy video driver along scripted
+camera paths and reports frame times (with a per-stage breakdown) as json.
+
+examples:
+    python benchmark.py
+    python benchmark.py --scenes grid teapot --pix-size 1 3 --output bench.json
+    python benchmark.py --compare bench.json --threshold 0.1
+    python benchmark.py --cold-start --scenes grid --frames 1
+    python benchmark.py --precision float64 float32 --verify-precision
+"""
+import os
+# must be set before pygame creates a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# asset paths (including the default texture) are relative to the project root
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygame
+import numpy as np
+import numba
+
+pygame.init()
+
+from camera import Camera
+from renderer import Renderer3D
+from meshes import Mesh, MeshData, load_mesh_data, load_obj_file, load_obj_mesh, global_texture_atlas
+from bake import bake_static
+from frame_stats import FrameStats
+
+
+# order in which stages are reported (same order as in Renderer3D.render_all)
+STAGES = ('wait', 'sync', 'cull', 'lod', 'occlusion', 'transform', 'gather', 'clip', 'backface', 'project', 'sort', 'raster', 'wireframe', 'present', 'display')
+# FrameStats counters which are averaged over all frames of a run
+COUNTERS = (
+    'meshes_culled', 'meshes_occluded', 'triangles_submitted', 'triangles_simplified', 'triangles_split', 'triangles_clipped', 'triangles_backface',
+    'triangles_occluded', 'triangles_rasterized',
+    'pixels_tested', 'pixels_written', 'pixels_covered', 'overdraw',
+)
+
+# triangle counts of the synthetic scenes
+SYNTHETIC_SIZES = {
+    'synthetic_1k'  : 1_000,
+    'synthetic_10k' : 10_000,
+    'synthetic_100k': 100_000,
+    'synthetic_1m'  : 1_000_000,
+}
+
+# --verify-precision: a pixel differs if any channel is more than PRECISION_LEVELS off the float64 render,
+#   a run fails if more than PRECISION_LIMIT (fraction) of a frame's pixels differ
+#   (small differences are expected where faces overlap exactly, either can win the z test)
+PRECISION_LEVELS = 8
+PRECISION_LIMIT = 0.02
+
+
+# scenes
+#   every scene returns (list of meshes, center of scene, radius of scene)
+#   camera paths are fitted to the center and radius
+
+def grid_scene(bake: bool = False) -> tuple:
+    "The scene from main.py: a 15x15 grid of cubes, a row of cubes on top and a teapot (cubes are baked if bake is set)"
+    meshes = []
+    cube = MeshData(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj", scale=5)[:-1])
+    for i in range(15):
+        for j in range(15):
+            meshes.append(Mesh.from_data(cube, position=(i*5, 0 if j % 2 else 5, j*5)))
+    for i in range(7):
+        meshes.append(Mesh.from_data(cube, position=(i*5,10,5)))
+    if (bake):
+        meshes = bake_static(meshes)
+
+    meshes.append(load_obj_mesh(global_texture_atlas, "./assets/teapot/teapot.obj", scale=3, position=[5, 6, 7]))
+
+    return meshes, (37.5, 5, 37.5), 55
+
+def teapot_scene() -> tuple:
+    "A single teapot"
+    return [load_obj_mesh(global_texture_atlas, "./assets/teapot/teapot.obj", scale=3)], (1.5, 1, 0), 4
+
+def teapot_field_scene() -> tuple:
+    "A 16x16 field of teapots, most of them far away (for levels of detail)"
+    teapot = load_mesh_data(global_texture_atlas, "./assets/teapot/teapot.obj", scale=3)
+    meshes = [Mesh.from_data(teapot, position=(i*10, 0, j*10)) for i in range(16) for j in range(16)]
+    return meshes, (75, 1, 75), 110
+
+def voxel_scene(bake: bool = False) -> tuple:
+    "A 24x24 terrain of stacked cubes, 1 to 4 high (cubes are baked if bake is set)"
+    cube = MeshData(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj", scale=5)[:-1])
+    heights = np.random.default_rng(0).integers(1, 5, size=(24, 24))
+    meshes = [
+        Mesh.from_data(cube, position=(i*5, k*5, j*5))
+        for i in range(24) for j in range(24) for k in range(heights[i, j])
+    ]
+    if (bake):
+        meshes = bake_static(meshes)
+    return meshes, (60, 10, 60), 90
+
+def synthetic_scene(num_tris: int) -> tuple:
+    "A uv sphere made of (approximately) num_tris ccw triangles"
+    # a sphere with n stacks and 2n slices has 4n^2 triangles
+    stacks = max(2, round(math.sqrt(num_tris/4)))
+    slices = 2*stacks
+    radius = 5
+
+    theta = np.linspace(0, np.pi, stacks+1)      # top to bottom
+    phi = np.linspace(0, 2*np.pi, slices+1)      # around
+    # grid of points, shape (stacks+1, slices+1, 3)
+    points = np.stack((
+        radius*np.sin(theta)[:, None]*np.cos(phi)[None, :],
+        radius*np.cos(theta)[:, None]*np.ones_like(phi)[None, :],
+        radius*np.sin(theta)[:, None]*np.sin(phi)[None, :],
+    ), axis=-1)
+    uvs = np.stack(np.meshgrid(theta/np.pi, phi/(2*np.pi), indexing='ij'), axis=-1)
+
+    # corners of every quad on the grid
+    p00, p01, p10, p11 = points[:-1, :-1], points[:-1, 1:], points[1:, :-1], points[1:, 1:]
+    t00, t01, t10, t11 = uvs[:-1, :-1], uvs[:-1, 1:], uvs[1:, :-1], uvs[1:, 1:]
+
+    tris = np.concatenate((
+        np.stack((p00, p11, p01), axis=2).reshape(-1, 3, 3),
+        np.stack((p00, p10, p11), axis=2).reshape(-1, 3, 3),
+    ))
+    uv_tris = np.concatenate((
+        np.stack((t00, t11, t01), axis=2).reshape(-1, 3, 2),
+        np.stack((t00, t10, t11), axis=2).reshape(-1, 3, 2),
+    ))
+
+    return [Mesh(tris, [*uv_tris])], (0, 0, 0), radius
+
+SCENES = {
+    'grid'  : grid_scene,
+    'grid_baked': lambda: grid_scene(bake=True),
+    'voxels': voxel_scene,
+    'voxels_baked': lambda: voxel_scene(bake=True),
+    'teapot': teapot_scene,
+    'teapot_field': teapot_field_scene,
+    **{name: (lambda size=size: synthetic_scene(size)) for name, size in SYNTHETIC_SIZES.items()},
+}
+
+
+# camera paths
+#   every path maps (frame index, frame count, scene center, scene radius) to (position, x_rot, y_rot)
+#   note that a camera with rotation x_rot faces (sin(x_rot), 0, cos(x_rot))
+
+def orbit_path(frame: int, frames: int, center: tuple, radius: float) -> tuple:
+    "Circle the scene once, looking at its center from slightly above"
+    angle = 360*frame/frames
+    distance = radius*1.5
+    return (
+        (
+            center[0] - distance*math.sin(math.radians(angle)),
+            center[1] + radius*0.3,
+            center[2] - distance*math.cos(math.radians(angle)),
+        ),
+        angle,
+        -10.0,
+    )
+
+def flythrough_path(frame: int, frames: int, center: tuple, radius: float) -> tuple:
+    "Fly straight through the scene (lots of near plane clipping)"
+    progress = frame/max(1, frames-1)
+    return (
+        (center[0], center[1], center[2] + radius*(2*progress - 1.5)),
+        0.0,
+        0.0,
+    )
+
+def static_path(frame: int, frames: int, center: tuple, radius: float) -> tuple:
+    "Look at the scene from a fixed point"
+    return orbit_path(0, 1, center, radius)
+
+PATHS = {
+    'orbit'     : orbit_path,
+    'flythrough': flythrough_path,
+    'static'    : static_path,
+}
+
+
+def summarize(values: list[float]) -> dict:
+    "Summary statistics (in milliseconds) of a list of durations (in seconds)"
+    values = sorted(values)
+    return {
+        'mean'  : statistics.fmean(values)*1000,
+        'median': statistics.median(values)*1000,
+        'p95'   : values[min(len(values)-1, int(len(values)*0.95))]*1000,
+        'min'   : values[0]*1000,
+        'max'   : values[-1]*1000,
+    }
+
+def warm_up(screen: pygame.surface.Surface, pix_size: int, debug: bool, options: dict) -> float:
+    "Render a single triangle, forcing numba to compile all kernels. Returns seconds taken"
+    renderer = Renderer3D(screen, Camera(), pix_size=pix_size, debug=debug, **options)
+    renderer.add_mesh(Mesh((((-1, -1, 5), (1, -1, 5), (0, 1, 5)),)))
+
+    start = time.perf_counter()
+    renderer.render_all()
+    return time.perf_counter() - start
+
+def run(
+        scene: str, path: str, size: tuple, pix_size: int, frames: int, debug: bool, options: dict, 
+        verify: bool = False, verify_precision: bool = False,
+    ) -> dict:
+    """Benchmark one scene along one camera path, returns a json serializable result\n
+    options are extra Renderer3D arguments (e.g. tile_size, threads)\n
+    If verify is set, the path is replayed (untimed) checking that occlusion culling drops no visible pixels\n
+    If verify_precision is set (and options set a precision), the path is replayed (untimed) comparing
+    every frame with a float64 render"""
+    screen = pygame.display.set_mode(size)
+    meshes, center, radius = SCENES[scene]()
+    if (options.get('lod_size')):
+        # levels of detail must exist before meshes are added
+        for data in {id(mesh.data): mesh.data for mesh in meshes}.values():
+            if (not data.lods):
+                data.generate_lods()
+
+    cam = Camera()
+    renderer = Renderer3D(screen, cam, pix_size=pix_size, debug=debug, **options)
+    for mesh in meshes:
+        renderer.add_mesh(mesh)
+
+    def move_cam(frame):
+        position, cam.x_rot, cam.y_rot = PATHS[path](frame, frames, center, radius)
+        cam.position = list(position)
+
+    # first frame is reported separately (includes any compilation numba still has to do)
+    move_cam(0)
+    start = time.perf_counter()
+    renderer.render_all()
+    pygame.display.update()
+    first_frame = time.perf_counter() - start
+
+    frame_times = []
+    stage_times = {stage: [] for stage in STAGES}
+    counters = {counter: [] for counter in COUNTERS}
+    for frame in range(frames):
+        move_cam(frame)
+        stats = FrameStats()
+
+        start = time.perf_counter()
+        renderer.render_all(stats)
+        lap = time.perf_counter()
+        pygame.display.update()
+        end = time.perf_counter()
+
+        stats.stage_times['display'] = end - lap
+        frame_times.append(end - start)
+        for stage in STAGES:
+            stage_times[stage].append(stats.stage_times.get(stage, 0.0))
+        for counter in COUNTERS:
+            counters[counter].append(getattr(stats, counter))
+
+    result = {
+        'scene'        : scene,
+        'path'         : path,
+        'size'         : list(size),
+        'pix_size'     : pix_size,
+        'options'      : options,
+        'frames'       : frames,
+        'triangles'    : sum(len(mesh.indices) for mesh in meshes),
+        'first_frame_s': first_frame,
+        'frame_ms'     : summarize(frame_times),
+        'fps'          : frames/sum(frame_times),
+        'stages_ms'    : {stage: statistics.fmean(times)*1000 for stage, times in stage_times.items()},
+        'counters'     : {counter: statistics.fmean(values) for counter, values in counters.items()},
+    }
+
+    if (verify):
+        # pixels of geometry rejected by occlusion culling which a full render shows (should be 0)
+        visible = []
+        for frame in range(frames):
+            move_cam(frame)
+            visible.append(renderer.verify_occlusion())
+        result['occlusion_errors'] = {'pixels': sum(visible), 'frames': sum(1 for count in visible if count)}
+
+    if (verify_precision) and ('precision' in options):
+        # same scene and options in float64, drawn offscreen
+        reference_surface = pygame.Surface(size, 0, screen)
+        reference = Renderer3D(
+            reference_surface, cam, pix_size=pix_size, debug=debug, 
+            **{option: value for option, value in options.items() if (option != 'precision')}
+        )
+        for mesh in meshes:
+            reference.add_mesh(mesh)
+
+        # fraction of pixels differing (see PRECISION_LEVELS), and mean difference of channels, per frame
+        differing, mean_diff = [], []
+        for frame in range(frames):
+            move_cam(frame)
+            renderer.render_all()
+            reference.render_all()
+            diff = np.abs(pygame.surfarray.array3d(screen).astype(np.int16) - pygame.surfarray.array3d(reference_surface))
+            differing.append(float(np.mean(diff.max(axis=2) > PRECISION_LEVELS)))
+            mean_diff.append(float(diff.mean()))
+        result['precision_errors'] = {
+            'max_pixels'   : max(differing),
+            'mean_pixels'  : statistics.fmean(differing),
+            'mean_diff'    : statistics.fmean(mean_diff),
+            'frames_failed': sum(1 for fraction in differing if fraction > PRECISION_LIMIT),
+        }
+
+    return result
+
+# run in a fresh process by cold_start: time to first frame of the grid scene, printed as json
+COLD_START = """
+import time
+start = time.perf_counter()
+import json
+import benchmark
+from benchmark import pygame, Camera, Renderer3D, grid_scene, orbit_path
+imported = time.perf_counter()
+
+renderer = Renderer3D(pygame.display.set_mode((600, 600)), Camera(), pix_size=3)
+renderer.warmup()
+warmed_up = time.perf_counter()
+
+meshes, center, radius = grid_scene()
+for mesh in meshes:
+    renderer.add_mesh(mesh)
+position, renderer.cam.x_rot, renderer.cam.y_rot = orbit_path(0, 1, center, radius)
+renderer.cam.position = list(position)
+loaded = time.perf_counter()
+
+renderer.render_all()
+pygame.display.update()
+end = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start, 'warmup_s': warmed_up - imported, 'scene_s': loaded - warmed_up,
+    'first_frame_s': end - loaded, 'total_s': end - start,
+}))
+"""
+
+def cold_start() -> dict:
+    """Time from starting a fresh process to its first frame (see COLD_START), twice:
+        cold: with an empty numba cache (every kernel is compiled)
+        warm: with the cache filled by the cold run (kernels are loaded)
+    process_s includes starting the interpreter. The project's own cache is left alone (a temporary one is used)"""
+    runs = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = os.environ | {'NUMBA_CACHE_DIR': cache_dir, 'PYGAME_HIDE_SUPPORT_PROMPT': '1'}
+        for name in ('cold', 'warm'):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, '-c', COLD_START], env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            runs[name] = json.loads(output.splitlines()[-1]) | {'process_s': time.perf_counter() - start}
+    return runs
+
+def key(result: dict) -> tuple:
+    "Identifies equivalent runs across reports"
+    return (result['scene'], result['path'], tuple(result['size']), result['pix_size'], json.dumps(result.get('options', {}), sort_keys=True))
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[str]:
+    "Compare median frame times against a previous report, returns descriptions of regressions"
+    previous = {key(result): result for result in baseline}
+    regressions = []
+
+    for result in results:
+        if (key(result) not in previous):
+            continue
+        old = previous[key(result)]['frame_ms']['median']
+        new = result['frame_ms']['median']
+        change = (new - old)/old
+
+        line = f"{result['scene']:>15} {result['path']:>10} {result['size'][0]}x{result['size'][1]} pix {result['pix_size']}: {old:8.2f} -> {new:8.2f} ms ({change:+.1%})"
+        print(line, file=sys.stderr)
+        if (change > threshold):
+            regressions.append(line)
+
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenes', nargs='+', choices=SCENES, default=['grid', 'teapot', 'synthetic_1k', 'synthetic_10k', 'synthetic_100k'],
+        help="scenes to render (synthetic_1m is not run by default)")
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=['orbit'], help="camera paths")
+    parser.add_argument('--frames', type=int, default=30, help="timed frames per run")
+    parser.add_argument('--size', nargs='+', default=['600x600'], help="window resolutions, as WIDTHxHEIGHT")
+    parser.add_argument('--pix-size', nargs='+', type=int, default=[3], help="Renderer3D pix_size values")
+    parser.add_argument('--tile-size', type=int, default=0, help="Renderer3D tile_size (0 disables tiled rasterization)")
+    parser.add_argument('--threads', nargs='+', type=int, default=[0], help="Renderer3D threads values, for tiled rasterization (0 uses all cores)")
+    parser.add_argument('--occlusion', choices=('off', 'mesh', 'triangle'), default='off',
+                        help="Renderer3D occlusion culling: off, of meshes, or of meshes and triangles")
+    parser.add_argument('--verify-occlusion', action='store_true',
+                        help="after each run, check that occlusion culling dropped no visible pixels (fails if it did)")
+    parser.add_argument('--draw-order', nargs='+', choices=('none', 'mesh', 'triangle'), default=['none'],
+                        help="Renderer3D draw_order values (compare overdraw and raster time between them)")
+    parser.add_argument('--lod-size', nargs='+', type=float, default=[0],
+                        help="Renderer3D lod_size values (levels of detail are generated for the scene's meshes if not 0)")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="Renderer3D pipelined rendering (geometry on a worker thread, one frame of latency)")
+    parser.add_argument('--precision', nargs='+', choices=('float64', 'float32'), default=['float64'],
+                        help="Renderer3D precision values (of geometry and depth buffers)")
+    parser.add_argument('--verify-precision', action='store_true',
+                        help=f"after each run not in float64, compare its frames with float64 renders (fails if over {PRECISION_LIMIT:.0%}% of a frame's pixels differ)")
+    parser.add_argument('--mipmaps', nargs='+', choices=('on', 'off'), default=['on'],
+                        help="Renderer3D mipmaps values (off always samples textures at full resolution)")
+    parser.add_argument('--cold-start', action='store_true',
+                        help="also measure time to first frame of fresh processes, with an empty and a filled numba cache")
+    parser.add_argument('--debug', action='store_true', help="enable wireframe rendering")
+    parser.add_argument('--output', help="write json report to this file (default: stdout)")
+    parser.add_argument('--compare', help="json report to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    sizes = [tuple(int(val) for val in size.split('x')) for size in args.size]
+    # occlusion options are only passed if enabled, so reports without them still compare
+    occlusion_options = {} if (args.occlusion == 'off') else {
+        'occlusion': True, 'occlusion_triangles': args.occlusion == 'triangle',
+    }
+    # (likewise for draw order)
+    order_options = [{} if (order == 'none') else {'draw_order': order} for order in args.draw_order]
+    lod_options = [{} if (not lod_size) else {'lod_size': lod_size} for lod_size in args.lod_size]
+    pipelined_options = {'pipelined': True} if (args.pipelined) else {}
+    precision_options = [{} if (precision == 'float64') else {'precision': precision} for precision in args.precision]
+    mipmap_options = [{} if (mipmaps == 'on') else {'mipmaps': False} for mipmaps in args.mipmaps]
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python'   : platform.python_version(),
+            'platform' : platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy'    : np.__version__,
+            'numba'    : numba.__version__,
+            'pygame'   : pygame.version.ver,
+        },
+        # compilation time of the numba kernels, paid once per process
+        'numba_warmup_s': warm_up(
+            pygame.display.set_mode(sizes[0]), args.pix_size[0], args.debug, 
+            {'tile_size': args.tile_size, 'threads': args.threads[0]} | occlusion_options | order_options[-1] | lod_options[-1] | pipelined_options | precision_options[-1] | mipmap_options[-1],
+        ),
+        'results': [],
+    }
+
+    if (args.cold_start):
+        report['cold_start'] = cold_start()
+        for name, run_times in report['cold_start'].items():
+            print(
+                f"cold start ({name} cache): {run_times['process_s']:.2f}s to first frame "
+                f"(import {run_times['import_s']:.2f}s, warmup {run_times['warmup_s']:.2f}s, first frame {run_times['first_frame_s']*1000:.1f} ms)",
+                file=sys.stderr
+            )
+
+    for scene in args.scenes:
+        for path in args.paths:
+            for size in sizes:
+                for pix_size in args.pix_size:
+                    for threads in args.threads:
+                        for order, order_option in zip(args.draw_order, order_options):
+                            for lod_size, lod_option in zip(args.lod_size, lod_options):
+                                for precision, precision_option in zip(args.precision, precision_options):
+                                    for mipmaps, mipmap_option in zip(args.mipmaps, mipmap_options):
+                                        options = (
+                                            {'tile_size': args.tile_size, 'threads': threads} 
+                                            | occlusion_options | order_option | lod_option | pipelined_options | precision_option | mipmap_option
+                                        )
+                                        result = run(scene, path, size, pix_size, args.frames, args.debug, options, args.verify_occlusion, args.verify_precision)
+                                        report['results'].append(result)
+                                        print(
+                                            f"{scene:>15} {path:>10} {size[0]}x{size[1]} pix {pix_size} threads {threads} order {order:>8} lod {lod_size:g} {precision}"
+                                            f" mipmaps {mipmaps}{' pipelined' if (args.pipelined) else ''}: "
+                                            f"{result['frame_ms']['median']:8.2f} ms/frame ({result['fps']:.1f} fps), "
+                                            f"overdraw {result['counters']['overdraw']:.2f}",
+                                            file=sys.stderr
+                                        )
+
+    if (args.output):
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    occlusion_errors = sum(result['occlusion_errors']['pixels'] for result in report['results'] if 'occlusion_errors' in result)
+    if (occlusion_errors):
+        print(f"occlusion culling dropped {occlusion_errors} visible pixel(s)", file=sys.stderr)
+        return 1
+
+    precision_errors = [result for result in report['results'] if result.get('precision_errors', {}).get('frames_failed')]
+    for result in precision_errors:
+        print(
+            f"{result['scene']} {result['path']} pix {result['pix_size']} {result['options']['precision']}: "
+            f"{result['precision_errors']['frames_failed']} frame(s) differ from float64 "
+            f"(up to {result['precision_errors']['max_pixels']:.1%} of pixels)",
+            file=sys.stderr
+        )
+    if (precision_errors):
+        return 1
+
+    if (args.compare):
+        with open(args.compare) as file:
+            regressions = compare(report['results'], json.load(file)['results'], args.threshold)
+        if (regressions):
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        pygame.quit()
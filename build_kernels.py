@@ -0,0 +1,63 @@
+"""
+Compile every numba kernel ahead of time, into numba's on-disk cache
+
+Kernels are compiled with cache=True, so compiled code is stored next to each module
+(in __pycache__, or in NUMBA_CACHE_DIR if set) and loaded by later runs instead of compiling again.
+Running this once (ex: after installing or updating) means the first run of main.py doesn't compile either.
+A kernel is recompiled (and cached again) whenever its module changes.
+
+examples:
+    python build_kernels.py
+"""
+import os
+# must be set before pygame creates a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+# asset paths (including the default texture) are relative to the project root
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import sys
+import time
+
+import pygame
+import numpy as np
+
+pygame.init()
+
+from camera import Camera
+from renderer import Renderer3D
+from meshes import MeshData
+
+
+def grid_mesh(size: int) -> MeshData:
+    "A flat size x size grid of quads (2 triangles each)"
+    points = np.stack(np.meshgrid(np.arange(size+1), np.arange(size+1), [0], indexing='ij'), axis=-1).reshape(-1, 3)
+    corners = (np.arange(size)[:, None]*(size+1) + np.arange(size)[None, :]).reshape(-1)
+    indices = np.concatenate((
+        np.stack((corners, corners + size + 2, corners + 1), axis=1),
+        np.stack((corners, corners + size + 1, corners + size + 2), axis=1),
+    ))
+    return MeshData.from_indexed(points, indices)
+
+def main() -> int:
+    start = time.perf_counter()
+
+    # every kernel used while rendering (kernels are compiled separately for each precision)
+    screen = pygame.display.set_mode((64, 64))
+    for precision in ('float64', 'float32'):
+        renderer_time = Renderer3D(screen, Camera(), precision=precision).warmup()
+        print(f"renderer kernels ({precision}): {renderer_time:.2f}s", file=sys.stderr)
+
+    # mesh simplification (used when loading with levels of detail)
+    lod_start = time.perf_counter()
+    grid_mesh(8).generate_lods(1)
+    print(f"level of detail kernels: {time.perf_counter() - lod_start:.2f}s", file=sys.stderr)
+
+    print(f"done in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    finally:
+        pygame.quit()
@@ -0,0 +1,399 @@
+import numpy as np
+import numba
+
+# results of AABBTree.frustum, per item
+OUTSIDE = 0         # entirely outside a plane
+INTERSECTING = 1    # crosses a plane
+INSIDE = 2          # entirely inside every plane
+
+
+class AABBTree:
+    """
+    Dynamic bounding volume hierarchy over axis aligned boxes (a binary tree, balanced like an AVL tree).\n
+    Every leaf stores an item (an int, ex: index of a mesh) with its box, and a slightly larger "fat" box,
+    so small moves don't change the tree. Inner nodes store the union of their children's boxes.\n
+    Nodes are kept in arrays, so queries are njit compiled: each costs O(log n) per result, instead of O(n)
+    """
+
+    __slots__ = [
+        'bounds',
+        'item_bounds',
+        'parent',
+        'child1',
+        'child2',
+        'height',
+        'items',
+        'root',
+        'margin',
+        '__free',
+    ]
+
+    def __init__(self, capacity: int = 64, margin: float = 1.0):
+        # per node (only the leaves use item_bounds and items; -1 marks missing links)
+        #   bounds:      (2, 3) (min point, max point) fat box (leaves), or union of children
+        #   item_bounds: (2, 3) exact box of item
+        self.bounds     : np.ndarray = np.zeros((capacity, 2, 3), dtype=np.double)
+        self.item_bounds: np.ndarray = np.zeros((capacity, 2, 3), dtype=np.double)
+        self.parent     : np.ndarray = np.full(capacity, -1, dtype=np.int64)
+        self.child1     : np.ndarray = np.full(capacity, -1, dtype=np.int64)
+        self.child2     : np.ndarray = np.full(capacity, -1, dtype=np.int64)
+        self.height     : np.ndarray = np.zeros(capacity, dtype=np.int64)
+        self.items      : np.ndarray = np.full(capacity, -1, dtype=np.int64)
+
+        self.root: int = -1
+        # how much fat boxes are expanded (on every side)
+        self.margin: float = margin
+        # unused nodes
+        self.__free: list[int] = list(range(capacity-1, -1, -1))
+
+    def insert(self, lo, hi, item: int) -> int:
+        "Add an item with box (lo, hi), returns its leaf node (used to move or remove it)"
+        leaf = self.__allocate()
+        self.item_bounds[leaf] = (lo, hi)
+        self.bounds[leaf] = (np.subtract(lo, self.margin), np.add(hi, self.margin))
+        self.items[leaf] = item
+        self.height[leaf] = 0
+        self.child1[leaf] = self.child2[leaf] = -1
+
+        new_parent = self.__allocate() if (self.root != -1) else -1
+        self.root = insert_leaf(
+            self.bounds, self.parent, self.child1, self.child2, self.height, self.root, leaf, new_parent
+        )
+        return leaf
+
+    def remove(self, leaf: int) -> None:
+        "Remove an item by its leaf node"
+        self.root, freed = remove_leaf(self.bounds, self.parent, self.child1, self.child2, self.height, self.root, leaf)
+        for node in (leaf, freed):
+            if (node != -1):
+                self.items[node] = self.parent[node] = self.child1[node] = self.child2[node] = -1
+                self.__free.append(node)
+
+    def move(self, leaf: int, lo, hi) -> bool:
+        """Update the box of an item. The tree only changes if the box leaves the fat box of the leaf.\n
+        Returns whether the tree changed"""
+        self.item_bounds[leaf] = (lo, hi)
+        if (np.all(self.bounds[leaf, 0] <= lo) and np.all(hi <= self.bounds[leaf, 1])):
+            return False
+
+        self.root, freed = remove_leaf(self.bounds, self.parent, self.child1, self.child2, self.height, self.root, leaf)
+        self.bounds[leaf] = (np.subtract(lo, self.margin), np.add(hi, self.margin))
+        self.root = insert_leaf(
+            self.bounds, self.parent, self.child1, self.child2, self.height, self.root, leaf, freed
+        )
+        return True
+
+    def shift_items(self, removed: int) -> None:
+        "Decrement every item larger than `removed` (for items that are indexes into a list)"
+        self.items[self.items > removed] -= 1
+
+    def query_aabb(self, lo, hi) -> np.ndarray:
+        "Items whose box overlaps the box (lo, hi)"
+        if (self.root == -1):
+            return np.empty(0, dtype=np.int64)
+        return query_aabb(
+            self.bounds, self.item_bounds, self.child1, self.child2, self.height, self.items, self.root,
+            np.asarray(lo, dtype=np.double), np.asarray(hi, dtype=np.double),
+        )
+
+    def ray_cast(self, origin, direction, max_distance: float = np.inf) -> tuple:
+        """Items whose box is hit by a ray, nearest first.\n
+        Returns (items, distances) where distance is where the ray enters the box,
+        in multiples of direction (0 if origin is inside)"""
+        if (self.root == -1):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.double)
+        items, distances = ray_cast(
+            self.bounds, self.item_bounds, self.child1, self.child2, self.height, self.items, self.root,
+            np.asarray(origin, dtype=np.double), np.asarray(direction, dtype=np.double), max_distance,
+        )
+        order = np.argsort(distances, kind='stable')
+        return items[order], distances[order]
+
+    def frustum(self, planes, num_items: int) -> np.ndarray:
+        """Classify every item against planes (a, b, c, d, e), where a point is outside if ax + by + cz + d > e.\n
+        Returns array of OUTSIDE, INTERSECTING or INSIDE, indexed by item (items must be in range(num_items))"""
+        states = np.zeros(num_items, dtype=np.int8)
+        if (self.root != -1):
+            frustum_states(
+                self.bounds, self.item_bounds, self.child1, self.child2, self.height, self.items, self.root,
+                np.asarray(planes, dtype=np.double), states,
+            )
+        return states
+
+    def __allocate(self) -> int:
+        "Get an unused node, growing arrays (doubling capacity) if there is none"
+        if (not self.__free):
+            capacity = len(self.parent)
+            for name, fill in (
+                ('bounds', 0), ('item_bounds', 0), ('parent', -1), ('child1', -1), ('child2', -1), ('height', 0), ('items', -1)
+            ):
+                old = getattr(self, name)
+                new = np.full((2*capacity, *old.shape[1:]), fill, dtype=old.dtype)
+                new[:capacity] = old
+                setattr(self, name, new)
+            self.__free = list(range(2*capacity-1, capacity-1, -1))
+        return self.__free.pop()
+
+
+# tree operations, see Box2D's b2DynamicTree (https://github.com/erincatto/box2d), which this follows
+@numba.njit(cache=True)
+def union_area(bounds, node_a, node_b) -> float:
+    "Surface area of the box containing both nodes' boxes"
+    dx = max(bounds[node_a, 1, 0], bounds[node_b, 1, 0]) - min(bounds[node_a, 0, 0], bounds[node_b, 0, 0])
+    dy = max(bounds[node_a, 1, 1], bounds[node_b, 1, 1]) - min(bounds[node_a, 0, 1], bounds[node_b, 0, 1])
+    dz = max(bounds[node_a, 1, 2], bounds[node_b, 1, 2]) - min(bounds[node_a, 0, 2], bounds[node_b, 0, 2])
+    return 2*(dx*dy + dy*dz + dz*dx)
+
+@numba.njit(cache=True)
+def set_union(bounds, node, node_a, node_b) -> None:
+    for axis in range(3):
+        bounds[node, 0, axis] = min(bounds[node_a, 0, axis], bounds[node_b, 0, axis])
+        bounds[node, 1, axis] = max(bounds[node_a, 1, axis], bounds[node_b, 1, axis])
+
+@numba.njit(cache=True)
+def descend_cost(bounds, child1, child, leaf, inheritance) -> float:
+    "Cost of inserting leaf below child (growth of child's box, plus growth of its ancestors)"
+    cost = union_area(bounds, child, leaf) + inheritance
+    if (child1[child] != -1):
+        cost -= union_area(bounds, child, child)
+    return cost
+
+@numba.njit(cache=True)
+def insert_leaf(bounds, parent, child1, child2, height, root, leaf, new_parent) -> int:
+    "Link a leaf into the tree, using new_parent (an unused node) as its parent. Returns new root"
+    if (root == -1):
+        parent[leaf] = -1
+        return leaf
+
+    # find best sibling: the node that grows the tree's surface area the least
+    index = root
+    while (child1[index] != -1):
+        area = union_area(bounds, index, index)
+        combined = union_area(bounds, index, leaf)
+
+        # cost of making leaf and index siblings, and minimum cost of pushing leaf further down
+        cost = 2*combined
+        inheritance = 2*(combined - area)
+
+        cost1 = descend_cost(bounds, child1, child1[index], leaf, inheritance)
+        cost2 = descend_cost(bounds, child1, child2[index], leaf, inheritance)
+
+        if (cost < cost1) and (cost < cost2):
+            break
+        index = child1[index] if (cost1 < cost2) else child2[index]
+    sibling = index
+
+    # new parent replaces sibling
+    old_parent = parent[sibling]
+    parent[new_parent] = old_parent
+    set_union(bounds, new_parent, sibling, leaf)
+    height[new_parent] = height[sibling] + 1
+    if (old_parent != -1):
+        if (child1[old_parent] == sibling):
+            child1[old_parent] = new_parent
+        else:
+            child2[old_parent] = new_parent
+    else:
+        root = new_parent
+    child1[new_parent] = sibling
+    child2[new_parent] = leaf
+    parent[sibling] = new_parent
+    parent[leaf] = new_parent
+
+    return refit(bounds, parent, child1, child2, height, root, parent[leaf])
+
+@numba.njit(cache=True)
+def remove_leaf(bounds, parent, child1, child2, height, root, leaf) -> tuple:
+    "Unlink a leaf from the tree. Returns (new root, parent node freed by removal or -1)"
+    if (leaf == root):
+        return -1, -1
+
+    old_parent = parent[leaf]
+    grand_parent = parent[old_parent]
+    sibling = child2[old_parent] if (child1[old_parent] == leaf) else child1[old_parent]
+
+    # sibling replaces parent
+    if (grand_parent != -1):
+        if (child1[grand_parent] == old_parent):
+            child1[grand_parent] = sibling
+        else:
+            child2[grand_parent] = sibling
+        parent[sibling] = grand_parent
+        root = refit(bounds, parent, child1, child2, height, root, grand_parent)
+    else:
+        root = sibling
+        parent[sibling] = -1
+
+    parent[leaf] = -1
+    return root, old_parent
+
+@numba.njit(cache=True)
+def refit(bounds, parent, child1, child2, height, root, index) -> int:
+    "Rebalance and recompute boxes and heights from index up to the root. Returns new root"
+    while (index != -1):
+        index = balance(bounds, parent, child1, child2, height, index)
+        if (parent[index] == -1):
+            root = index
+
+        height[index] = 1 + max(height[child1[index]], height[child2[index]])
+        set_union(bounds, index, child1[index], child2[index])
+        index = parent[index]
+    return root
+
+@numba.njit(cache=True)
+def balance(bounds, parent, child1, child2, height, a) -> int:
+    "Rotate node a if its subtrees' heights differ by more than 1. Returns root of subtree"
+    if (child1[a] == -1) or (height[a] < 2):
+        return a
+
+    b, c = child1[a], child2[a]
+    difference = height[c] - height[b]
+    if (-1 <= difference <= 1):
+        return a
+
+    # promote the higher child (up), moving a down
+    up, other = (c, b) if (difference > 1) else (b, c)
+    f, g = child1[up], child2[up]
+
+    child1[up] = a
+    parent[up] = parent[a]
+    parent[a] = up
+    if (parent[up] != -1):
+        if (child1[parent[up]] == a):
+            child1[parent[up]] = up
+        else:
+            child2[parent[up]] = up
+
+    # higher grandchild stays with promoted node, lower one goes to a
+    keep, give = (f, g) if (height[f] > height[g]) else (g, f)
+    child2[up] = keep
+    if (up == c):
+        child2[a] = give
+    else:
+        child1[a] = give
+    parent[give] = a
+
+    set_union(bounds, a, other, give)
+    set_union(bounds, up, a, keep)
+    height[a] = 1 + max(height[other], height[give])
+    height[up] = 1 + max(height[a], height[keep])
+    return up
+
+
+# queries
+@numba.njit(cache=True)
+def query_aabb(bounds, item_bounds, child1, child2, height, items, root, lo, hi) -> np.ndarray:
+    stack = np.empty(2*height[root] + 2, dtype=np.int64)
+    result = np.empty(len(items), dtype=np.int64)
+    count = 0
+
+    stack[0] = root
+    size = 1
+    while (size):
+        size -= 1
+        node = stack[size]
+        node_bounds = item_bounds if (child1[node] == -1) else bounds
+        if (
+            np.any(node_bounds[node, 0] > hi) or
+            np.any(node_bounds[node, 1] < lo)
+        ):
+            continue
+
+        if (child1[node] == -1):
+            result[count] = items[node]
+            count += 1
+        else:
+            stack[size] = child1[node]
+            stack[size+1] = child2[node]
+            size += 2
+    return result[:count]
+
+@numba.njit(cache=True)
+def ray_box(box, origin, inv_direction, max_distance) -> float:
+    "Distance along ray where it enters box (slab test), or -1 if it misses"
+    near, far = 0.0, max_distance
+    for axis in range(3):
+        t1 = (box[0, axis] - origin[axis])*inv_direction[axis]
+        t2 = (box[1, axis] - origin[axis])*inv_direction[axis]
+        if (t1 != t1): t1 = -np.inf # nan (0*inf) if ray is parallel, and starts on the slab's edge
+        if (t2 != t2): t2 = np.inf
+        near = max(near, min(t1, t2))
+        far = min(far, max(t1, t2))
+    return near if (near <= far) else -1.0
+
+@numba.njit(cache=True)
+def ray_cast(bounds, item_bounds, child1, child2, height, items, root, origin, direction, max_distance) -> tuple:
+    inv_direction = np.empty(3)
+    for axis in range(3):
+        inv_direction[axis] = 1/direction[axis] if (direction[axis]) else np.inf
+
+    stack = np.empty(2*height[root] + 2, dtype=np.int64)
+    result = np.empty(len(items), dtype=np.int64)
+    distances = np.empty(len(items))
+    count = 0
+
+    stack[0] = root
+    size = 1
+    while (size):
+        size -= 1
+        node = stack[size]
+        if (child1[node] == -1):
+            distance = ray_box(item_bounds[node], origin, inv_direction, max_distance)
+            if (distance >= 0):
+                result[count] = items[node]
+                distances[count] = distance
+                count += 1
+        elif (ray_box(bounds[node], origin, inv_direction, max_distance) >= 0):
+            stack[size] = child1[node]
+            stack[size+1] = child2[node]
+            size += 2
+    return result[:count], distances[:count]
+
+@numba.njit(cache=True)
+def box_side(bounds, node, plane) -> int:
+    "OUTSIDE, INTERSECTING or INSIDE, for a box against a plane (tests only the nearest and farthest corner)"
+    nearest = farthest = plane[3] - plane[4]
+    for axis in range(3):
+        lo, hi = plane[axis]*bounds[node, 0, axis], plane[axis]*bounds[node, 1, axis]
+        nearest += min(lo, hi)
+        farthest += max(lo, hi)
+    if (nearest > 0):
+        return 0 # outside
+    if (farthest > 0):
+        return 1 # intersecting
+    return 2 # inside
+
+@numba.njit(nogil=True, cache=True)
+def frustum_states(bounds, item_bounds, child1, child2, height, items, root, planes, states) -> None:
+    """Write OUTSIDE, INTERSECTING or INSIDE of every item (leaf) into states (which starts as OUTSIDE).\n
+    Subtrees outside a plane are skipped, and planes a node is entirely inside aren't tested for its children"""
+    # stack of (node, bit mask of planes still to be tested)
+    stack = np.empty((2*height[root] + 2, 2), dtype=np.int64)
+    stack[0] = (root, (1 << len(planes)) - 1)
+    size = 1
+    while (size):
+        size -= 1
+        node, mask = stack[size]
+        node_bounds = item_bounds if (child1[node] == -1) else bounds
+
+        state = 2 # inside
+        for plane in range(len(planes)):
+            if (not (mask >> plane) & 1):
+                continue
+            side = box_side(node_bounds, node, planes[plane])
+            if (side == 0):
+                state = 0
+                break
+            if (side == 2):
+                mask &= ~(1 << plane)
+            else:
+                state = 1
+        if (state == 0):
+            continue
+
+        if (child1[node] == -1):
+            states[items[node]] = state
+        else:
+            stack[size] = (child1[node], mask)
+            stack[size+1] = (child2[node], mask)
+            size += 2
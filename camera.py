@@ -1,5 +1,4 @@
 import numpy as np
-from numba import njit
 import math
 
 from meshes import Mesh
@@ -7,7 +6,7 @@ from meshes import Mesh
 class Camera:
     """Represents a viewport into the world"""
     
-    __slots__ = ['position', 'x_rot', 'y_rot']
+    __slots__ = ['position', 'x_rot', 'y_rot', '__view', '__view_state']
 
     def __init__(self, position: list[float] = (0, 0, 0), x_rot: float = 0.0, y_rot: float = 0.0):
         self.position: list[float] = [position[0], position[1], position[2]] #[x, y, z]
@@ -15,75 +14,47 @@ class Camera:
         self.x_rot: float = x_rot
         self.y_rot: float = y_rot 
 
-    # public interface for internal func
-    def transform_about_cam(self, mesh: Mesh) -> np.ndarray:
-        "Transform mesh about the cam to give illusion of movement, returns new array with transformed vertexes"
-        return self.__transform(
-            # convert to np arrays (for numba performance)
-            np.asarray(self.position           , dtype=np.double), 
-            np.asarray([self.x_rot, self.y_rot], dtype=np.double),
-            np.asarray(mesh.position           , dtype=np.double),
-            np.asarray(mesh.mesh               , dtype=np.double),
-        )
+        # cached view matrix, and the (position, rotation) it was built for
+        self.__view: np.ndarray = None
+        self.__view_state: tuple = None
+
+    @property
+    def view_matrix(self) -> np.ndarray:
+        """4x4 matrix which transforms world space points about the cam (gives illusion of movement).\n
+        Points are row vectors: [x, y, z, 1] @ view_matrix\n
+        Cached, only rebuilt after position or rotation changed"""
+        state = (*self.position, self.x_rot, self.y_rot)
+        if (state != self.__view_state):
+            self.__view = self.__build_view(np.asarray(self.position, dtype=np.double), self.x_rot, self.y_rot)
+            self.__view_state = state
+        return self.__view
 
-    # njit increases performance ten-fold 
-    #   but doesn't work well with the 'self' argument 
-    #   usually passed to class methods.
-    # Therefore, use staticmethods
     @staticmethod
-    @njit
-    def __transform(
-        cam_pos:  np.ndarray, 
-        cam_rot:  np.ndarray, 
-        mesh_pos: np.ndarray,
-        mesh:     np.ndarray,
-    ) -> np.ndarray:
-        "njit compiled internal function"
-        final = np.empty_like(mesh)
-
-        final_pos = cam_pos - mesh_pos
-
-        for tri_index, tri in enumerate(mesh):
-            for pt_index, point in enumerate(tri):
-                # rotate about camera
-
-                # xz axis rotation
-                xz_hyp = ((point[0]-final_pos[0])**2 + (point[2]-final_pos[2])**2)**(1/2)
-                # account for negative hypotenuse values
-                if (final_pos[0]-point[0]) >= 0:
-                    xz_hyp *= -1
-                # final rotation (radians); cam rot + relative rot(directly in front of cam is 0 degrees rel rot)
-                if (xz_hyp != 0):
-                    xz_rot = math.radians(cam_rot[0]) + math.asin((point[2]-final_pos[2])/xz_hyp)
-                else:
-                    xz_rot = 0
-                # final values
-                nx = math.cos(xz_rot)*xz_hyp + final_pos[0]
-                nz = math.sin(xz_rot)*xz_hyp + final_pos[2]
-
-                # yz axis rotation
-                yz_hyp = ((point[1]-final_pos[1])**2 + (nz-final_pos[2])**2)**(1/2)
-                if (final_pos[1]-point[1]) >= 0:
-                    yz_hyp *= -1
-
-                if (yz_hyp != 0):
-                    yz_rot = math.radians(cam_rot[1]) + math.asin((nz-final_pos[2])/yz_hyp)
-                else:
-                    yz_rot = 0
-
-                ny = math.cos(yz_rot)*yz_hyp + final_pos[1]
-                nz = math.sin(yz_rot)*yz_hyp + nz
-
-                # translate point according to player position (gives illusion that player is moving)
-                final[tri_index][pt_index] = [
-                    nx - final_pos[0],
-                    ny - final_pos[1],
-                    nz - final_pos[2],
-                ]
-                
-        return np.asarray(final, dtype=np.double)
-                
+    def __build_view(position: np.ndarray, x_rot: float, y_rot: float) -> np.ndarray:
+        "rotation about y axis (x_rot), followed by rotation about x axis (y_rot)"
+        sin_x, cos_x = math.sin(math.radians(x_rot)), math.cos(math.radians(x_rot))
+        sin_y, cos_y = math.sin(math.radians(y_rot)), math.cos(math.radians(y_rot))
+
+        # each column is one component of the transformed point
+        #   NOTE the z column keeps the behaviour of the original per-point transform,
+        #   which added the xz-rotated z on top of the yz rotation (so z is stretched).
+        #   kept as-is, since the projection and near plane are tuned for it
+        rotation = np.asarray((
+            (cos_x, -sin_x*sin_y, sin_x*(1 + cos_y)),
+            (0    ,  cos_y      , sin_y            ),
+            (-sin_x, -cos_x*sin_y, cos_x*(1 + cos_y)),
+        ), dtype=np.double)
+
+        view = np.identity(4, dtype=np.double)
+        view[:3, :3] = rotation
+        # translate by cam position first (world point - cam position)
+        view[3, :3] = -position @ rotation
+        return view
 
+    def transform_about_cam(self, mesh: Mesh) -> np.ndarray:
+        "Transform mesh about the cam to give illusion of movement, returns new array with transformed vertexes"
+        view = self.view_matrix
+        return (np.asarray(mesh.mesh, dtype=np.double) + mesh.position) @ view[:3, :3] + view[3, :3]
 
     def translate_cam(self, trans_vec: list[float]) -> None:
         "translate position, accounting for camera rotation"
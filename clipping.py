@@ -0,0 +1,176 @@
+import numpy as np
+import numba
+
+
+class Clipper:
+    """
+    Clips clip space triangles against planes, writing into buffers which are kept between frames
+    (so clipping doesn't allocate per triangle, or per frame once the buffers are big enough).\n
+    A plane is (a, b, c, d, e): a point (x, y, z, w) is outside if ax + by + cz + dw > e\n
+    Two kinds of planes are used:
+        clipping planes: triangles crossing them are cut, and the part inside is kept
+        culling planes:  triangles entirely outside are removed, crossing triangles are kept as is
+    Output triangles are in the same order as the triangles they came from\n
+    Output triangles and attributes are stored as dtype (float64 or float32), clipping itself is done in float64
+    """
+
+    __slots__ = ['dtype', 'tris', 'attrs', 'sources', 'codes']
+
+    def __init__(self, capacity: int = 1024, num_attrs: int = 2, dtype = np.double):
+        self.dtype: np.dtype = np.dtype(dtype)
+
+        # output buffers, only the first `count` (returned by clip) entries are in use
+        #   tris:    (n, 3, 4) clipped triangles
+        #   attrs:   (n, 3, num_attrs) per vertex attributes (ex: uvs), interpolated when clipping
+        #   sources: (n,) index of the input triangle each output triangle came from
+        self.tris   : np.ndarray = np.empty((capacity, 3, 4), dtype=self.dtype)
+        self.attrs  : np.ndarray = np.empty((capacity, 3, num_attrs), dtype=self.dtype)
+        self.sources: np.ndarray = np.empty((capacity,), dtype=np.int64)
+
+        # bit mask of planes each input vertex is outside of
+        self.codes  : np.ndarray = np.empty((capacity, 3), dtype=np.uint32)
+
+    def clip(self, tris, attrs, needs_clip, clipping_planes, culling_planes) -> tuple:
+        """
+        Clip triangles, args:
+            tris:       (n, 3, 4) array of clip space triangles
+            attrs:      (n, 3, a) array of per vertex attributes (a must match num_attrs)
+            needs_clip: (n,) array of bool, triangles known to be inside every plane are copied as is
+        Returns (tris, attrs, sources, culled): views of the output buffers (valid until next call),
+        and the amount of input triangles removed
+        """
+        planes = np.concatenate((clipping_planes, culling_planes))
+        if (len(planes) > 32):
+            raise ValueError("at most 32 planes are supported")
+
+        # classify vertexes, and find (an upper bound of) the amount of output triangles
+        if (len(tris) > len(self.codes)):
+            self.codes = np.empty((max(len(tris), 2*len(self.codes)), 3), dtype=np.uint32)
+        max_output = classify(tris, needs_clip, planes, len(clipping_planes), self.codes)
+        self.__reserve(max_output)
+
+        count, culled = clip_triangles(
+            tris, attrs, self.codes, planes, len(clipping_planes), self.tris, self.attrs, self.sources
+        )
+        return self.tris[:count], self.attrs[:count], self.sources[:count], culled
+
+    def __reserve(self, capacity: int) -> None:
+        "Grow output buffers (to twice the needed size) so at least `capacity` triangles fit"
+        if (capacity <= len(self.tris)):
+            return
+        capacity = 2*capacity
+        self.tris = np.empty((capacity, 3, 4), dtype=self.dtype)
+        self.attrs = np.empty((capacity, 3, self.attrs.shape[2]), dtype=self.dtype)
+        self.sources = np.empty((capacity,), dtype=np.int64)
+
+
+@numba.njit(cache=True)
+def plane_dist(point, plane) -> float:
+    """Signed distance (scaled) of a clip space point from a plane (a, b, c, d, e), positive if outside.\n
+    Written out instead of np.dot, which is slow for 4 elements"""
+    return point[0]*plane[0] + point[1]*plane[1] + point[2]*plane[2] + point[3]*plane[3] - plane[4]
+
+@numba.njit(nogil=True, cache=True)
+def classify(tris, needs_clip, planes, num_clipping, codes) -> int:
+    """Write a bit mask of the planes each vertex is outside of into codes (0 for triangles
+    that don't need clipping). Returns the most triangles clipping can output"""
+    max_output = 0
+    clip_mask = (1 << num_clipping) - 1
+    for tri in range(len(tris)):
+        code_and = 0xFFFFFFFF
+        code_or = 0
+        for pnt in range(3):
+            code = 0
+            if (needs_clip[tri]):
+                for plane in range(len(planes)):
+                    if (plane_dist(tris[tri, pnt], planes[plane]) > 0):
+                        code |= 1 << plane
+            codes[tri, pnt] = code
+            code_and &= code
+            code_or |= code
+
+        if (code_and):
+            continue # entirely outside a plane
+        # every clipping plane crossed adds at most one vertex to the polygon (so one triangle)
+        max_output += 1
+        code_or &= clip_mask
+        while (code_or):
+            max_output += code_or & 1
+            code_or >>= 1
+    return max_output
+
+@numba.njit(nogil=True, cache=True)
+def clip_triangles(tris, attrs, codes, planes, num_clipping, out_tris, out_attrs, out_sources) -> tuple:
+    """Clip triangles classified by classify, writing the results (in order) into the output buffers.\n
+    Returns (amount of output triangles, amount of input triangles removed)"""
+    # a triangle clipped by n planes is a convex polygon of at most 3 + n vertexes
+    #   (Sutherland–Hodgman), which is split back into triangles as a fan
+    max_vertices = 3 + num_clipping
+    num_attrs = attrs.shape[2]
+    poly = np.empty((2, max_vertices, 4))
+    poly_attrs = np.empty((2, max_vertices, num_attrs))
+    clip_mask = (1 << num_clipping) - 1
+
+    out = culled = 0
+    for tri in range(len(tris)):
+        code_and = codes[tri, 0] & codes[tri, 1] & codes[tri, 2]
+        code_or = (codes[tri, 0] | codes[tri, 1] | codes[tri, 2]) & clip_mask
+        if (code_and):
+            culled += 1
+            continue
+
+        if (not code_or): # nothing to clip, copy as is
+            out_tris[out] = tris[tri]
+            out_attrs[out] = attrs[tri]
+            out_sources[out] = tri
+            out += 1
+            continue
+
+        # clip polygon against every plane crossed, alternating between the two polygon buffers
+        cur = 0
+        size = 3
+        poly[cur, :3] = tris[tri]
+        poly_attrs[cur, :3] = attrs[tri]
+        for plane in range(num_clipping):
+            if (not (code_or >> plane) & 1):
+                continue
+            nxt = 1 - cur
+            new_size = 0
+            for pnt in range(size):
+                following = (pnt + 1) % size
+                dist = plane_dist(poly[cur, pnt], planes[plane])
+                dist_following = plane_dist(poly[cur, following], planes[plane])
+
+                if (dist <= 0): # inside, keep point
+                    poly[nxt, new_size] = poly[cur, pnt]
+                    poly_attrs[nxt, new_size] = poly_attrs[cur, pnt]
+                    new_size += 1
+                if ((dist <= 0) != (dist_following <= 0)): # edge crosses plane, add intersection
+                    t = dist/(dist - dist_following)
+                    # (component by component, so no temporary arrays are created)
+                    for k in range(4):
+                        poly[nxt, new_size, k] = poly[cur, pnt, k] + t*(poly[cur, following, k] - poly[cur, pnt, k])
+                    for k in range(num_attrs):
+                        poly_attrs[nxt, new_size, k] = poly_attrs[cur, pnt, k] + t*(poly_attrs[cur, following, k] - poly_attrs[cur, pnt, k])
+                    new_size += 1
+            cur = nxt
+            size = new_size
+            if (size < 3):
+                break
+
+        if (size < 3): # nothing left
+            culled += 1
+            continue
+
+        # fan keeps winding order of original
+        for pnt in range(1, size - 1):
+            out_tris[out, 0] = poly[cur, 0]
+            out_tris[out, 1] = poly[cur, pnt]
+            out_tris[out, 2] = poly[cur, pnt + 1]
+            out_attrs[out, 0] = poly_attrs[cur, 0]
+            out_attrs[out, 1] = poly_attrs[cur, pnt]
+            out_attrs[out, 2] = poly_attrs[cur, pnt + 1]
+            out_sources[out] = tri
+            out += 1
+
+    return out, culled
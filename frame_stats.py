@@ -0,0 +1,111 @@
+import json
+import tracemalloc
+
+from numba.core.runtime import rtsys
+
+
+class FrameStats:
+    """Statistics of a single frame, filled in by Renderer3D.render_all"""
+
+    __slots__ = [
+        'frame',
+        'meshes_culled',
+        'meshes_occluded',
+        'triangles_submitted',
+        'triangles_simplified',
+        'triangles_split',
+        'triangles_clipped',
+        'triangles_backface',
+        'triangles_occluded',
+        'triangles_rasterized',
+        'pixels_tested',
+        'pixels_written',
+        'pixels_covered',
+        'stage_times',
+        'frame_time',
+        'alloc_bytes',
+        'kernel_allocs',
+    ]
+
+    def __init__(self):
+        self.frame: int = 0                 # index of frame (counted by renderer)
+
+        # geometry
+        self.meshes_culled: int = 0         # meshes skipped for being entirely outside the view frustum
+        self.meshes_occluded: int = 0       # meshes skipped for being hidden behind drawn geometry (occlusion culling)
+        self.triangles_submitted: int = 0   # triangles of all meshes (at full detail)
+        self.triangles_simplified: int = 0  # triangles left out by drawing meshes with simpler levels of detail
+        self.triangles_split: int = 0       # triangles added when clipping splits a tri into a quad
+        self.triangles_clipped: int = 0     # triangles culled for being entirely outside a clipping plane (or in a culled mesh)
+        self.triangles_backface: int = 0    # triangles culled for facing away from cam
+        self.triangles_occluded: int = 0    # triangles culled by occlusion culling (including triangles of occluded meshes)
+        self.triangles_rasterized: int = 0  # triangles sent to rasterizer
+
+        # fill rate
+        self.pixels_tested: int = 0         # pixels tested against z_buffer
+        self.pixels_written: int = 0        # pixels that passed z test (z_buffer and color written)
+        self.pixels_covered: int = 0        # distinct pixels covered by geometry at end of frame
+
+        # time (seconds)
+        self.stage_times: dict[str, float] = {}
+        self.frame_time: float = 0.0
+
+        # memory, None if not being measured
+        #   alloc_bytes:   peak python/numpy allocations above start of frame (needs tracemalloc to be tracing)
+        #   kernel_allocs: allocations made inside numba kernels (needs env var NUMBA_NRT_STATS=1)
+        self.alloc_bytes: int = None
+        self.kernel_allocs: int = None
+
+    @property
+    def overdraw(self) -> float:
+        "Average amount of times a covered pixel was written"
+        return self.pixels_written/self.pixels_covered if self.pixels_covered else 0.0
+
+    def add(self, other: 'FrameStats') -> None:
+        "Add the counters and stage times of other (stats of work done for this frame elsewhere, ex: on another thread)"
+        for slot in self.__slots__[1:self.__slots__.index('stage_times')]:
+            setattr(self, slot, getattr(self, slot) + getattr(other, slot))
+        for stage, duration in other.stage_times.items():
+            self.stage_times[stage] = self.stage_times.get(stage, 0.0) + duration
+
+    def as_dict(self) -> dict:
+        "json serializable version of stats"
+        return {slot: getattr(self, slot) for slot in self.__slots__} | {'overdraw': self.overdraw}
+
+    # memory measurements are bracketed by these two methods (called by renderer)
+    def start_memory(self) -> None:
+        "Start measuring memory allocated during frame (no-op if not measurable)"
+        if (tracemalloc.is_tracing()):
+            tracemalloc.reset_peak()
+            self.alloc_bytes = tracemalloc.get_traced_memory()[0]
+        self.kernel_allocs = self.__kernel_allocs()
+
+    def stop_memory(self) -> None:
+        "Finish measuring memory allocated during frame"
+        if (self.alloc_bytes is not None):
+            self.alloc_bytes = tracemalloc.get_traced_memory()[1] - self.alloc_bytes
+        if (self.kernel_allocs is not None):
+            self.kernel_allocs = self.__kernel_allocs() - self.kernel_allocs
+
+    @staticmethod
+    def __kernel_allocs():
+        try:
+            return rtsys.get_allocation_stats().alloc
+        except RuntimeError: # stats are disabled
+            return None
+
+
+class StatsWriter:
+    """Callback which streams FrameStats to a file, one json object per line.\n
+    Register with Renderer3D.add_stats_callback"""
+
+    __slots__ = ['file']
+
+    def __init__(self, filepath: str):
+        self.file = open(filepath, 'w')
+
+    def __call__(self, stats: FrameStats) -> None:
+        self.file.write(json.dumps(stats.as_dict()) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,232 @@
+import numpy as np
+import numba
+
+# Mesh simplification, used to generate levels of detail (see MeshData.generate_lods).
+# Edge collapse with quadric error metrics (Garland & Heckbert): every vertex accumulates the planes
+#   of the triangles around it, the error of moving it is the sum of squared distances to those planes.
+# Collapses are half edge collapses (a vertex is merged into a neighbour, which doesn't move), so the
+#   vertices and uvs of a simplified mesh are a subset of the original ones (and it stays in the same bounds).
+# Vertices on uv seams, texture borders and open borders are never removed, so textures stay
+#   mapped the same way, and open meshes keep their outline.
+# Collapses are done in passes: each pass sorts every possible collapse by error, and applies
+#   the cheapest ones, skipping collapses next to one already applied in the same pass.
+
+
+def simplify(vertices, indices, uvs, uv_indices, textures, target: int, uv_seams: bool = True) -> tuple:
+    """
+    Simplify an indexed mesh (see MeshData.from_indexed) to about `target` triangles,
+    stops early if no more collapses are allowed.\n
+    If uv_seams is False, uvs are per triangle (like MeshData's default uvs, where every triangle maps
+    to the same part of the texture) instead of a mapping of the surface: they don't lock vertices,
+    and every triangle keeps its own uvs\n
+    Returns (vertices, indices, uvs, uv_indices, textures) of the simplified mesh
+    """
+    vertices = np.ascontiguousarray(vertices, dtype=np.double)
+    # (copies, modified in place)
+    indices = np.array(indices, dtype=np.int64).reshape(-1, 3)
+    uv_indices = np.array(uv_indices, dtype=np.int64).reshape(-1, 3)
+    textures = np.asarray(textures)
+    alive = np.ones(len(indices), dtype=np.bool_)
+    quadrics = vertex_quadrics(vertices, indices)
+
+    count = len(indices)
+    while (count > target):
+        removed = collapse_pass(vertices, indices, uv_indices, textures, alive, quadrics, count - target, uv_seams)
+        if (not removed):
+            break
+        count -= removed
+
+    # drop removed triangles, and vertices and uvs no longer used
+    indices, uv_indices, textures = indices[alive], uv_indices[alive], textures[alive]
+    used_vertices, indices = np.unique(indices, return_inverse=True)
+    used_uvs, uv_indices = np.unique(uv_indices, return_inverse=True)
+    return (
+        vertices[used_vertices], indices.reshape(-1, 3).astype(np.int32),
+        np.asarray(uvs)[used_uvs], uv_indices.reshape(-1, 3).astype(np.int32),
+        textures,
+    )
+
+
+@numba.njit(cache=True)
+def vertex_quadrics(vertices, indices) -> np.ndarray:
+    """(vertices, 4, 4) array, the sum of the (area weighted) plane quadrics of the triangles around each vertex.\n
+    The squared distance of point p to the planes is [p, 1] @ Q @ [p, 1]"""
+    quadrics = np.zeros((len(vertices), 4, 4))
+    plane = np.empty(4)
+    for tri in range(len(indices)):
+        normal_x, normal_y, normal_z = triangle_normal(vertices, indices[tri, 0], indices[tri, 1], indices[tri, 2])
+        length = np.sqrt(normal_x**2 + normal_y**2 + normal_z**2)
+        if (length == 0):
+            continue
+        p0 = vertices[indices[tri, 0]]
+        plane[0], plane[1], plane[2] = normal_x/length, normal_y/length, normal_z/length
+        plane[3] = -(plane[0]*p0[0] + plane[1]*p0[1] + plane[2]*p0[2])
+
+        area = length/2
+        for pnt in range(3):
+            vtx = indices[tri, pnt]
+            for row in range(4):
+                for col in range(4):
+                    quadrics[vtx, row, col] += area*plane[row]*plane[col]
+    return quadrics
+
+@numba.njit(cache=True)
+def triangle_normal(vertices, v0, v1, v2) -> tuple:
+    "cross(p1 - p0, p2 - p0), its length is twice the triangle's area"
+    ax, ay, az = vertices[v1, 0] - vertices[v0, 0], vertices[v1, 1] - vertices[v0, 1], vertices[v1, 2] - vertices[v0, 2]
+    bx, by, bz = vertices[v2, 0] - vertices[v0, 0], vertices[v2, 1] - vertices[v0, 1], vertices[v2, 2] - vertices[v0, 2]
+    return ay*bz - az*by, az*bx - ax*bz, ax*by - ay*bx
+
+@numba.njit(cache=True)
+def collapse_error(quadrics, vertices, source, dest) -> float:
+    "Error of moving vertex source onto vertex dest"
+    error = 0.0
+    for row in range(4):
+        x_row = vertices[dest, row] if (row < 3) else 1.0
+        for col in range(4):
+            x_col = vertices[dest, col] if (col < 3) else 1.0
+            error += x_row*(quadrics[source, row, col] + quadrics[dest, row, col])*x_col
+    return error
+
+@numba.njit(cache=True)
+def vertex_triangles(indices, alive, num_vertices) -> tuple:
+    """Triangles around every vertex (only alive ones), returns (starts, tris):
+    the triangles of vertex v are tris[starts[v]:starts[v+1]]"""
+    counts = np.zeros(num_vertices + 1, dtype=np.int64)
+    for tri in range(len(indices)):
+        if (not alive[tri]): continue
+        for pnt in range(3):
+            counts[indices[tri, pnt] + 1] += 1
+    starts = np.cumsum(counts)
+    tris = np.empty(starts[-1], dtype=np.int64)
+    fill = starts[:-1].copy()
+    for tri in range(len(indices)):
+        if (not alive[tri]): continue
+        for pnt in range(3):
+            tris[fill[indices[tri, pnt]]] = tri
+            fill[indices[tri, pnt]] += 1
+    return starts, tris
+
+@numba.njit(cache=True)
+def corner(indices, tri, vtx) -> int:
+    "Which point (0, 1 or 2) of a triangle is vtx"
+    return 0 if (indices[tri, 0] == vtx) else (1 if (indices[tri, 1] == vtx) else 2)
+
+@numba.njit(cache=True)
+def locked_vertices(indices, uv_indices, textures, starts, tris, uv_seams) -> np.ndarray:
+    """Vertices which can't be removed: the ones on uv seams or texture borders (their triangles
+    don't all share one uv and texture), and the ones on open or non manifold edges
+    (an edge from them isn't shared by exactly one other triangle, in the opposite direction)"""
+    locked = np.zeros(len(starts) - 1, dtype=np.bool_)
+    for vtx in range(len(starts) - 1):
+        first = starts[vtx]
+        for entry in range(starts[vtx], starts[vtx+1]):
+            tri, other = tris[entry], tris[first]
+            if (
+                (uv_seams and uv_indices[tri, corner(indices, tri, vtx)] != uv_indices[other, corner(indices, other, vtx)])
+                or textures[tri] != textures[other]
+            ):
+                locked[vtx] = True
+                break
+            # edge vtx -> following must appear once, and following -> vtx once
+            following = indices[tri, (corner(indices, tri, vtx) + 1) % 3]
+            outgoing = incoming = 0
+            for entry_2 in range(starts[vtx], starts[vtx+1]):
+                pnt = corner(indices, tris[entry_2], vtx)
+                outgoing += indices[tris[entry_2], (pnt + 1) % 3] == following
+                incoming += indices[tris[entry_2], (pnt + 2) % 3] == following
+            if (outgoing != 1) or (incoming != 1):
+                locked[vtx] = True
+                break
+    return locked
+
+@numba.njit(cache=True)
+def collapse_pass(vertices, indices, uv_indices, textures, alive, quadrics, max_removed, uv_seams) -> int:
+    """Apply the cheapest allowed collapses (each changing a separate part of the mesh),
+    until max_removed triangles were removed or none are left. Returns amount of triangles removed"""
+    num_vertices = len(vertices)
+    starts, tris = vertex_triangles(indices, alive, num_vertices)
+    locked = locked_vertices(indices, uv_indices, textures, starts, tris, uv_seams)
+
+    # candidates: every edge of every triangle, collapsed in both directions
+    #   (the other direction comes from the triangle on the other side)
+    sources = np.empty(3*len(indices), dtype=np.int64)
+    dests = np.empty(3*len(indices), dtype=np.int64)
+    errors = np.empty(3*len(indices))
+    count = 0
+    for tri in range(len(indices)):
+        if (not alive[tri]): continue
+        for pnt in range(3):
+            source, dest = indices[tri, pnt], indices[tri, (pnt + 1) % 3]
+            if (locked[source]): continue
+            sources[count], dests[count] = source, dest
+            errors[count] = collapse_error(quadrics, vertices, source, dest)
+            count += 1
+
+    # vertices whose triangles were changed this pass (the adjacency above is outdated for them)
+    touched = np.zeros(num_vertices, dtype=np.bool_)
+    # neighbours of source (marked with the index of the candidate being tested)
+    marks = np.full(num_vertices, -1, dtype=np.int64)
+
+    removed = 0
+    for candidate in np.argsort(errors[:count]):
+        source, dest = sources[candidate], dests[candidate]
+        if (touched[source]) or (touched[dest]):
+            continue
+
+        # manifold check (link condition): source and dest must only share the 2 neighbours
+        #   opposite of their edge, otherwise the collapse folds the mesh onto itself
+        for entry in range(starts[source], starts[source+1]):
+            for pnt in range(3):
+                marks[indices[tris[entry], pnt]] = candidate
+        shared = 0
+        for entry in range(starts[dest], starts[dest+1]):
+            for pnt in range(3):
+                vtx = indices[tris[entry], pnt]
+                if (marks[vtx] == candidate) and (vtx != source) and (vtx != dest):
+                    shared += 1
+                    marks[vtx] = -1 # count once
+        if (shared != 2):
+            continue
+
+        # triangles that stay must not flip (or collapse to a line)
+        allowed = True
+        for entry in range(starts[source], starts[source+1]):
+            tri = tris[entry]
+            pnt = corner(indices, tri, source)
+            following, preceding = indices[tri, (pnt + 1) % 3], indices[tri, (pnt + 2) % 3]
+            if (following == dest) or (preceding == dest):
+                continue
+            old_x, old_y, old_z = triangle_normal(vertices, source, following, preceding)
+            new_x, new_y, new_z = triangle_normal(vertices, dest, following, preceding)
+            if (old_x*new_x + old_y*new_y + old_z*new_z <= 0):
+                allowed = False
+                break
+        if (not allowed):
+            continue
+
+        # uv of dest on source's side of any seam (source's triangles all share one uv)
+        dest_uv = -1
+        for entry in range(starts[source], starts[source+1]):
+            tri = tris[entry]
+            if (indices[tri, 0] == dest) or (indices[tri, 1] == dest) or (indices[tri, 2] == dest):
+                dest_uv = uv_indices[tri, corner(indices, tri, dest)]
+                break
+
+        # collapse: triangles on the edge are removed, the rest move to dest
+        for entry in range(starts[source], starts[source+1]):
+            tri = tris[entry]
+            pnt = corner(indices, tri, source)
+            touched[indices[tri, 0]] = touched[indices[tri, 1]] = touched[indices[tri, 2]] = True
+            if (indices[tri, (pnt + 1) % 3] == dest) or (indices[tri, (pnt + 2) % 3] == dest):
+                alive[tri] = False
+                removed += 1
+            else:
+                indices[tri, pnt] = dest
+                if (uv_seams):
+                    uv_indices[tri, pnt] = dest_uv
+        quadrics[dest] += quadrics[source]
+
+        if (removed >= max_removed):
+            break
+    return removed
@@ -5,7 +5,10 @@ from scipy import __version__
 from camera import Camera
 from renderer import Renderer3D
 from event_checker import EventChecker
-from meshes import Mesh, load_obj_file, global_texture_atlas
+from meshes import Mesh, MeshData, global_texture_atlas
+from frame_stats import FrameStats
+from bake import bake_static
+from assets import AssetLoader
 """
 TODO:
 
@@ -17,7 +20,7 @@ efficiency
     <NEW> NOTE current bottleneck is in matrix multiply function
        <   > Refactor, currently, some functions return a new array, while some modify the input
 
-    <   > when clipping against planes, determine if entire meshes are in/out
+    <YES> when clipping against planes, determine if entire meshes are in/out
 
 texturing
     REFACTOR
@@ -32,11 +35,11 @@ mesh class?
         <MEH> BUG uv coords (not sure yet)
     
     <MEH> .obj file support?
-        <   > Trianglify obj files (all faces must have 3 vertexes)
+        <YES> Trianglify obj files (all faces must have 3 vertexes)
         <MEH> counterclockwise-ify all 
         <MEH> Texture Uvs
         <   > REFACTOR, use new pathlib module?
-           <   > refactor loading code (rn it reads through the file 3 times)
+           <YES> refactor loading code (rn it reads through the file 3 times)
 
 lighting
     ray tracing?
@@ -90,23 +93,32 @@ def main(use_mouse = False, debug = False):
     #            Mesh(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj")[:-1], position=(i, 0 if j % 2 else 1, j)) # exclude last argument (textures)
     #        )
 
-    for i in range(15):
-        for j in range(15):
-            renderer.add_mesh(
-                Mesh(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj", scale=5)[:-1], position=(i*5, 0 if j % 2 else 5, j*5))
-            )
-    for i in range(7):
-        renderer.add_mesh(Mesh(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj", scale=5)[:-1], position=(i*5,10,5)))
+    # assets are loaded in the background (see AssetLoader), and appear as they finish loading
+    loader = AssetLoader(global_texture_atlas, renderer)
+    cube_future, _ = loader.load_manifest([
+        {'obj': "./assets/cube/cube_ccw.obj", 'scale': 5},
+        {'obj': "./assets/teapot/teapot.obj", 'scale': 3, 'positions': [(5, 6, 7)]},
+    ])
+
+    def add_cubes(future):
+        # cube geometry is loaded once, and shared by every cube (exclude textures)
+        data = future.result()
+        cube = MeshData.from_indexed(data.vertices, data.indices, data.uvs, data.uv_indices)
+        cubes = []
+        for i in range(15):
+            for j in range(15):
+                cubes.append(Mesh.from_data(cube, position=(i*5, 0 if j % 2 else 5, j*5)))
+        for i in range(7):
+            cubes.append(Mesh.from_data(cube, position=(i*5,10,5)))
+
+        # cubes never move, merge them into a few meshes (without the faces between touching cubes)
+        for mesh in bake_static(cubes):
+            renderer.add_mesh(mesh)
+    # (called by loader.poll, on this thread)
+    cube_future.add_done_callback(add_cubes)
 
     #renderer.add_mesh(Mesh(*load_obj_file(global_texture_atlas, "./assets/cube/cube_ccw.obj", scale=15)[:-1], position=(-5, -15, 0)))
 
-    renderer.add_mesh(
-        Mesh(
-            *load_obj_file(global_texture_atlas, "./assets/teapot/teapot.obj", scale=3),
-            position = [5, 6, 7]
-        )
-    )
-
     # renderer.add_mesh(Mesh(*load_obj_file(global_texture_atlas, "./assets/tri/tri.obj")))
 
     # renderer.add_mesh(
@@ -114,7 +126,7 @@ def main(use_mouse = False, debug = False):
     # )
 
     # a transparent rectangle to put text on
-    stat_area = pygame.Surface((150, 70)) 
+    stat_area = pygame.Surface((150, 110)) 
     stat_area.set_alpha(128)               
     stat_area.fill((0, 0, 0))
     
@@ -127,15 +139,20 @@ def main(use_mouse = False, debug = False):
         (10, 10)
     )
     pygame.display.update()
+    # compile every kernel now (only slow on the first run, compiled kernels are cached, see build_kernels.py)
+    renderer.warmup()
 
 
     run = True
     while (run):
-        #mesh.position[0] += .005
+        #mesh.position = (mesh.position[0] + .005, *mesh.position[1:])
         
         # how much time has passed since last frame
         delta_time = clock.tick(FPS)/1000
 
+        # add assets that finished loading
+        loader.poll()
+
         event_checker.check_key_press()
         if event_checker.get_state('quit'):
             run = False
@@ -184,7 +201,9 @@ def main(use_mouse = False, debug = False):
         if (cam.y_rot > 90):
             cam.y_rot = 90
 
-        renderer.render_all()
+        # only collect frame stats if they are displayed
+        stats = FrameStats() if (debug) else None
+        renderer.render_all(stats)
 
         if (debug):
             # display transparent rect as bg of stats        
@@ -200,9 +219,27 @@ def main(use_mouse = False, debug = False):
                 f"X: {int(cam.x_rot)}, Y: {int(cam.y_rot)} DEG", 
                 True, (255, 255, 255), None), (10, 50)
             )
+            # display amount of triangles drawn and average times each pixel was drawn
+            screen.blit(FONT.render(
+                f"TRIS {stats.triangles_rasterized}/{stats.triangles_submitted}", 
+                True, (255, 255, 255), None), (10, 70)
+            )
+            screen.blit(FONT.render(
+                f"OVERDRAW {stats.overdraw:.2f}", 
+                True, (255, 255, 255), None), (10, 90)
+            )
+
+        # loading progress
+        if (loader.pending):
+            screen.blit(FONT.render(
+                f"Loading assets... {loader.finished}/{loader.total}", 
+                True, (255, 255, 255), None), (10, HEIGHT - 25)
+            )
 
         pygame.display.update()
 
+    loader.close()
+
     
 if __name__ == "__main__":
     try:
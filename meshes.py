@@ -1,55 +1,305 @@
 import pygame
 import numpy as np
 import os
+import json
+import hashlib
+from array import array
 from typing import Optional
 
 from textures import Atlas
+import lod
 
 # this is a global variable, perhaps remove later
 global_texture_atlas = Atlas()
 
-class Mesh:
+class MeshData:
+	"""
+	Geometry of a mesh, stored as an indexed vertex buffer:
+	each triangle is 3 indexes into vertices (and 3 indexes into uvs), so a vertex 
+	shared by several triangles is only stored (and transformed) once.\n
+	One MeshData can be shared by any number of Mesh instances\n
+	It may have levels of detail (lods): simplified versions of itself (see generate_lods), 
+	which Renderer3D draws instead when the mesh covers little of the screen
+	"""
 
-	__slots__ = ['mesh', 'uv_mesh', 'textures', 'position']
+	__slots__ = ['vertices', 'indices', 'uvs', 'uv_indices', 'textures', 'aabb', 'bounding_sphere', 'lods']
 
 	def __init__(self, 
 			mesh, 	 # mesh is the only required argument
 					 #	 the rest are optional (have defaults)
 			uv_mesh  = (), 
 			textures = (), 
-			position = (0, 0, 0), 
 		):
-
-
-		self.mesh: np.ndarray = np.asarray(mesh)
-
-		if (uv_mesh):
-			self.uv_mesh = np.asarray((*uv_mesh,))
+		# mesh (and uv_mesh) are arrays of triangles (3 points each)
+		#   identical points are merged into shared vertices
+		mesh = np.asarray(mesh, dtype=np.double).reshape(-1, 3, 3)
+
+		self.vertices: np.ndarray
+		self.indices : np.ndarray
+		self.vertices, self.indices = self.__weld(mesh.reshape(-1, 3))
+
+		self.uvs       : np.ndarray
+		self.uv_indices: np.ndarray
+		if (len(uv_mesh)):
+			self.uvs, self.uv_indices = self.__weld(np.asarray((*uv_mesh,), dtype=np.double).reshape(-1, 2))
 		else: 
 			#default val
-			self.uv_mesh = np.asarray([
-				((0, 0),
-				 (0, 1),
-				 (1, 1),)
-				for _ in self.mesh # for every tri in mesh
-			]) #list comprehension to make np array
-
-		if (textures):
-			self.textures = textures
+			self.uvs, self.uv_indices = self.__default_uvs(len(mesh))
+
+		if (len(textures)):
+			self.textures: np.ndarray = np.asarray(textures, dtype=np.uint16)
+		else:
+			self.textures: np.ndarray = np.zeros(len(mesh), dtype=np.uint16)
+
+		self.aabb: np.ndarray
+		self.bounding_sphere: tuple
+		self.update_bounds()
+
+		# simplified versions of this data, each with fewer triangles than the previous
+		self.lods: list[MeshData] = []
+
+	@classmethod
+	def from_indexed(cls, 
+			vertices, 
+			indices, 
+			uvs        = None, 
+			uv_indices = None, 
+			textures   = None, 
+		) -> 'MeshData':
+		"""Create mesh data directly from vertex and index buffers
+			vertices:   (n, 3) array of points
+			indices:    (tris, 3) array of indexes into vertices (ccw)
+			uvs:        (m, 2) array of uv coords, defaults provided if None
+			uv_indices: (tris, 3) array of indexes into uvs
+			textures:   (tris,) array of texture indexes (in Atlas), defaults to 0
+		"""
+		data = cls.__new__(cls)
+
+		data.vertices = np.asarray(vertices, dtype=np.double).reshape(-1, 3)
+		data.indices = np.asarray(indices, dtype=np.int32).reshape(-1, 3)
+
+		if (uvs is not None):
+			data.uvs = np.asarray(uvs, dtype=np.double).reshape(-1, 2)
+			data.uv_indices = np.asarray(uv_indices, dtype=np.int32).reshape(-1, 3)
 		else:
-			self.textures = [0 for _ in self.mesh]
+			data.uvs, data.uv_indices = cls.__default_uvs(len(data.indices))
+
+		if (textures is not None):
+			data.textures = np.asarray(textures, dtype=np.uint16)
+		else:
+			data.textures = np.zeros(len(data.indices), dtype=np.uint16)
+
+		data.update_bounds()
+		data.lods = []
+		return data
+
+	def update_bounds(self) -> None:
+		"""Recompute bounding volumes (in local space) from vertices:
+			aabb:            (2, 3) array of (min point, max point)
+			bounding_sphere: (center, radius), centered on the aabb
+		Needed if vertices were modified in place (Renderer3D.update_mesh does this)"""
+		if (len(self.vertices)):
+			self.aabb = np.asarray((self.vertices.min(axis=0), self.vertices.max(axis=0)))
+		else:
+			self.aabb = np.zeros((2, 3))
+		center = self.aabb.mean(axis=0)
+		radius = float(np.sqrt(((self.vertices - center)**2).sum(axis=1).max())) if (len(self.vertices)) else 0.0
+		self.bounding_sphere = (center, radius)
+
+	def generate_lods(self, levels: int = 3, ratio: float = 0.5, min_triangles: int = 16) -> list:
+		"""Generate up to `levels` levels of detail (see lod.py), each with about `ratio` times 
+		the triangles of the previous. Stops early once a level would have fewer than min_triangles,
+		or the mesh can't be simplified much further.\n
+		Must be called before meshes using this data are added to a renderer, 
+		and again if the data is modified. Returns (and stores) list of levels"""
+		# default uvs are per triangle, they don't describe the surface (see lod.simplify)
+		default_uvs, default_uv_indices = self.__default_uvs(len(self.indices))
+		uv_seams = not (np.array_equal(self.uvs, default_uvs) and np.array_equal(self.uv_indices, default_uv_indices))
+
+		self.lods = []
+		data = self
+		for _ in range(levels):
+			target = int(len(data.indices)*ratio)
+			if (target < min_triangles):
+				break
+			simplified = MeshData.from_indexed(*lod.simplify(
+				data.vertices, data.indices, data.uvs, data.uv_indices, data.textures, target, uv_seams,
+			))
+			# not worth another level
+			if (len(simplified.indices) > len(data.indices)*(1 + ratio)/2):
+				break
+			self.lods.append(simplified)
+			data = simplified
+		return self.lods
+
+	# expanded (3 points per triangle) versions of the buffers
+	@property
+	def mesh(self) -> np.ndarray:
+		"(tris, 3, 3) array, the points of every triangle"
+		return self.vertices[self.indices]
+
+	@property
+	def uv_mesh(self) -> np.ndarray:
+		"(tris, 3, 2) array, the uv coords of every triangle"
+		return self.uvs[self.uv_indices]
+
+	@staticmethod
+	def __weld(points: np.ndarray) -> tuple:
+		"Merge identical points, returns (unique points, (n, 3) array of indexes into them)"
+		unique, inverse = np.unique(points, axis=0, return_inverse=True)
+		return unique, inverse.astype(np.int32).reshape(-1, 3)
+
+	@staticmethod
+	def __default_uvs(num_tris: int) -> tuple:
+		"every triangle maps to the same half of the texture"
+		return (
+			np.asarray(((0, 0), (0, 1), (1, 1)), dtype=np.double),
+			np.tile(np.arange(3, dtype=np.int32), (num_tris, 1)),
+		)
+
+
+class Mesh:
+	"""
+	An instance of MeshData placed in the world.\n
+	Only holds a position and a reference to its (possibly shared) data, 
+	so many copies of the same geometry cost (almost) no extra memory\n
+	A mesh is moved by setting its position (a tuple, so it can't be changed in place),
+	which tells the scenes holding it (see SceneStore) that it moved
+	"""
 
-		self.position: list[float] = [position[0], position[1], position[2]]
+	__slots__ = ['data', 'scenes', '__position']
+
+	def __init__(self, 
+			mesh, 	 # mesh is the only required argument
+					 #	 the rest are optional (have defaults)
+			uv_mesh  = (), 
+			textures = (), 
+			position = (0, 0, 0), 
+		):
+		self.data: MeshData = MeshData(mesh, uv_mesh, textures)
+		# scene stores the mesh is in (see SceneStore.moved)
+		self.scenes: list = []
+		self.position = position
+
+	@classmethod
+	def from_data(cls, data: MeshData, position = (0, 0, 0)) -> 'Mesh':
+		"Create an instance of existing mesh data (data is shared, not copied)"
+		mesh = cls.__new__(cls)
+		mesh.data = data
+		mesh.scenes = []
+		mesh.position = position
+		return mesh
+
+	@classmethod
+	def from_indexed(cls, 
+			vertices, 
+			indices, 
+			uvs        = None, 
+			uv_indices = None, 
+			textures   = None, 
+			position   = (0, 0, 0),
+		) -> 'Mesh':
+		"Create a mesh directly from vertex and index buffers (see MeshData.from_indexed)"
+		return cls.from_data(MeshData.from_indexed(vertices, indices, uvs, uv_indices, textures), position)
+
+	def instance(self, position = (0, 0, 0)) -> 'Mesh':
+		"Create a new mesh sharing this mesh's data"
+		return self.from_data(self.data, position)
+
+	# shortcuts to data (NOTE: modifying these affects every instance of the data)
+	vertices   = property(lambda self: self.data.vertices)
+	indices    = property(lambda self: self.data.indices)
+	uvs        = property(lambda self: self.data.uvs)
+	uv_indices = property(lambda self: self.data.uv_indices)
+	textures   = property(lambda self: self.data.textures)
+	mesh       = property(lambda self: self.data.mesh)
+	uv_mesh    = property(lambda self: self.data.uv_mesh)
+
+	@property
+	def position(self) -> tuple:
+		"Position in world space (x, y, z)"
+		return self.__position
+
+	@position.setter
+	def position(self, position) -> None:
+		self.__position = (position[0], position[1], position[2])
+		for scene in self.scenes:
+			scene.moved(self)
+
+	# bounding volumes, in world space
+	@property
+	def aabb(self) -> np.ndarray:
+		"(2, 3) array of (min point, max point)"
+		return self.data.aabb + self.position
+
+	@property
+	def bounding_sphere(self) -> tuple:
+		"(center, radius)"
+		center, radius = self.data.bounding_sphere
+		return (center + self.position, radius)
+
+
+# loaded obj files, so every file is only parsed once
+#   {(atlas id, absolute path, scale): MeshData}
+mesh_data_cache: dict = {}
+
+def load_mesh_data(
+    atlas:    Atlas, 
+    filepath: str, 
+    scale:    Optional[float] = 0,
+    cache:    bool = True,
+    lods:     int = 0,
+)   ->        MeshData:
+    """Load an obj file as MeshData, see parse_obj_file for args.
+    If lods is set, up to that many levels of detail are generated (see MeshData.generate_lods)\n
+    Results are cached, loading the same file (with the same scale) again returns the same object"""
+    key = (id(atlas), os.path.abspath(filepath), scale)
+    if (key not in mesh_data_cache):
+        mesh_data_cache[key] = MeshData.from_indexed(*parse_obj_file(atlas, filepath, scale, cache))
+    data = mesh_data_cache[key]
+    if (len(data.lods) < lods):
+        data.generate_lods(lods)
+    return data
+
+
+def load_obj_mesh(
+    atlas:    Atlas, 
+    filepath: str, 
+    scale:    Optional[float] = 0,
+    position: tuple = (0, 0, 0),
+    lods:     int = 0,
+)   ->        Mesh:
+    "Load an obj file as a Mesh, see parse_obj_file (and load_mesh_data) for args. Data is shared with other meshes loaded from the same file"
+    return Mesh.from_data(load_mesh_data(atlas, filepath, scale, lods=lods), position)
 
 
-# NOTE: use triangulated obj files (3 vertex face elements)
 def load_obj_file(
     atlas:    Atlas, 
     filepath: str, 
     scale:    Optional[float] = 0
 )   ->        tuple:
     """
-    Load an obj file, given the filepath of said object
+    Load an obj file, given the filepath of said object\n
+    Same as parse_obj_file, but with every face expanded to its 3 points (see Mesh args)
+
+    returns:    tuple
+        element 1: array of faces
+        element 2: array of uv coordinates corresponding to faces
+        element 3: array of face texture indexes (corresponding to Atlas object), 
+    """
+    data = load_mesh_data(atlas, filepath, scale)
+
+    return (data.mesh, data.uv_mesh, data.textures.copy())
+
+
+def parse_obj_file(
+    atlas:    Atlas, 
+    filepath: str, 
+    scale:    Optional[float] = 0,
+    cache:    bool = True,
+)   ->        tuple:
+    """
+    Load an obj file, given the filepath of said object, as vertex and index buffers
     
     atlas:      Alias object
         all loaded textures are stored here
@@ -59,115 +309,323 @@ def load_obj_file(
         The max size of any one face. Largest face becomes scale value. \n
         Defaults to 0, which will enable auto-scaling \n
         Setting scale to None preserves original values. 
+    cache:      bool
+        Whether to use (and create) a binary cache of the file, see read_obj_cached
 
     returns:    tuple
-        element 1: list of faces
-        element 2: list of uv coordinates corresponding to faces
-        element 3: list of face texture indexes (corresponding to Atlas object), 
+        element 1: (n, 3) array of vertexes
+        element 2: (faces, 3) array of indexes into vertexes
+        element 3: (m, 2) array of uv coordinates (None if file has no uv coords)
+        element 4: (faces, 3) array of indexes into uv coordinates (None if file has no uv coords)
+        element 5: (faces,) array of face texture indexes (corresponding to Atlas object), 
 
     Note that if object file is missing a texture, a default will be provided\n
-    Similarly, if object file is missing uv coords, a default will be provided
+    Similarly, if a face is missing uv coords, a default will be provided
+    """
+    vertices, indices, uvs, uv_indices, face_materials, materials, _ = (
+        read_obj_cached(filepath, scale) if (cache) else read_obj_file(filepath, scale)
+    )
+
+    textures = load_materials(atlas, materials, os.path.dirname(filepath))[face_materials]
+
+    return (vertices, indices, uvs, uv_indices, textures)
+
+
+def read_obj_file(
+    filepath: str, 
+    scale:    Optional[float] = 0
+)   ->        tuple:
+    """
+    Read an obj file in a single pass, without loading any textures (see parse_obj_file for args)\n
+    Faces with more than 3 vertexes (quads, n-gons) are split into triangles (winding order is kept)
+
+    returns:    tuple
+        element 1-4: vertexes, indexes, uv coords, uv indexes (see parse_obj_file)
+        element 5:   (faces,) array of material indexes (into element 6)
+        element 6:   list of materials used by faces, as (name, texture path or None) 
+            texture paths are relative to the directory of the obj file.
+            material 0 is always ('', None), used by faces without material
+        element 7:   list of mtl files referred to by the obj file (relative to its directory)
     """
     # sanitize args
     if (scale is not None) and (scale < 0):
         raise ValueError("scale argument must be greater than zero")
 
-    info = filepath.split('/')
-
-    dirpath = '/'.join(info[:-1]) + '/'
-    filename = info[-1]
-
-    prev_dir = os.getcwd()
-    os.chdir(dirpath)
-
-    with open(filename, 'r') as file:
-        raw = file.readlines()
-
-        mtllibs = []
-
-        vertexes = []
-        uv_coords = []
-
-        faces = []
-        uv_faces = []
-        textures = []
-        
-        # read file
-        for line in raw:
-            if (line[:6] == 'mtllib'):
-                mtllibs.append(f"./{line.split()[1]}")
-
-        # load all materials
-        for lib in mtllibs:
-
-            with open(lib) as libfile: 
-                rawlib = libfile.readlines()
-
-                curr_mtl = ""
-                for line in rawlib:
-                    
-                    # NOTE add other loading features here
-                    #   for now, only basic texture maps implemented
-                    if   (line.strip()[:6] == 'newmtl'):
-                        curr_mtl = line.split()[1]
-                    elif (line.strip()[:6] == 'map_Kd'):
-                        mtl_path = line.split()[1]
-                        if (curr_mtl not in atlas):
-                            atlas.add_tex(
-                                curr_mtl,
-                                pygame.surfarray.array3d(pygame.image.load(f"./{mtl_path}"))
-                            )
-                        curr_mtl = ""
-
-        curr_mtl  = ""
-        for line in raw:
-            if (line.strip()[:6] == 'usemtl'):
-                curr_mtl = line.split()[1]
-
-            if (line.strip()[:2] == 'v '):
-                vertexes.append(
-                    (float(line.split()[1]), float(line.split()[2]), float(line.split()[3]))
-                )
-            if (line.strip()[:2] == 'vt'):
-                uv_coords.append(
-                    (float(line.split()[1]), float(line.split()[2]) 
-                        if len(line.split()) >=3 else 0.0)
-                )
-        
-        # scale vertex data
-        if (scale is not None):
-            if (scale == 0):
-                scale_coef = 1/max([num for val in vertexes for num in val])
-            else:
-                scale_coef = scale/max([num for val in vertexes for num in val])
-            vertexes = [(vtx[0]*scale_coef, vtx[1]*scale_coef, vtx[2]*scale_coef) for vtx in vertexes]
-        
-        for line in raw:
-            if (line.strip()[:2] == 'f '):
-                indexes = [i.split('/') for i in line.split()[1:]]
-
-                faces.append((
-                    vertexes[int(indexes[0][0])-1], 
-                    vertexes[int(indexes[1][0])-1], 
-                    vertexes[int(indexes[2][0])-1],
-                ))
-
-                
-                if (
-                    ((len(indexes[0]) > 1) and (indexes[0][1] != ''))
-                and ((len(indexes[1]) > 1) and (indexes[1][1] != ''))
-                and ((len(indexes[2]) > 1) and (indexes[2][1] != ''))
-                ):
-                    uv_indexes = [i[1] for i in indexes]
-                    uv_faces.append((
-                        uv_coords[int(uv_indexes[0])-1], 
-                        uv_coords[int(uv_indexes[1])-1], 
-                        uv_coords[int(uv_indexes[2])-1],
-                    ))
-
-                textures.append(atlas[curr_mtl] if curr_mtl in atlas else 0)
-
-    os.chdir(prev_dir)
-
-    return (faces, uv_faces, textures)
-
+    # data is streamed into typed arrays (much smaller than lists of tuples)
+    vertexes = array('d')
+    uv_coords = array('d')
+    faces = array('i')
+    uv_faces = array('i')
+    face_mtls = array('i')
+
+    mtllibs = []
+    # materials referred to by usemtl, {name: index}
+    mtl_indexes = {'': 0}
+    curr_mtl = 0
+    has_uvs = False
+
+    with open(filepath, 'r') as file:
+        for line in file:
+            parts = line.split()
+            if (not parts):
+                continue
+            tag = parts[0]
+
+            if (tag == 'v'):
+                vertexes.append(float(parts[1])); vertexes.append(float(parts[2])); vertexes.append(float(parts[3]))
+
+            elif (tag == 'vt'):
+                uv_coords.append(float(parts[1])); uv_coords.append(float(parts[2]) if len(parts) >= 3 else 0.0)
+
+            elif (tag == 'f'):
+                corners = [corner.split('/') for corner in parts[1:]]
+                if (len(corners) < 3):
+                    raise ValueError(f"face with less than 3 vertexes in {filepath}: {line.strip()}")
+
+                # obj indexes start at 1, negative indexes are relative to the end (of data read so far)
+                vtx = [int(corner[0]) for corner in corners]
+                vtx = [idx-1 if idx > 0 else len(vertexes)//3 + idx for idx in vtx]
+
+                if (all(len(corner) > 1 and corner[1] != '' for corner in corners)):
+                    uv = [int(corner[1]) for corner in corners]
+                    uv = [idx-1 if idx > 0 else len(uv_coords)//2 + idx for idx in uv]
+                    has_uvs = True
+                else:
+                    # refer to default uvs, which are appended to the end of the uv coords later
+                    #   (-1, -2, -3) -> (count, count+1, count+2)
+                    uv = [-1, -2, -3] + [-3]*(len(corners)-3)
+
+                # split face into a fan of triangles (0, 1, 2), (0, 2, 3), ...
+                for corner in range(1, len(corners)-1):
+                    faces.append(vtx[0]); faces.append(vtx[corner]); faces.append(vtx[corner+1])
+                    uv_faces.append(uv[0]); uv_faces.append(uv[corner]); uv_faces.append(uv[corner+1])
+                    face_mtls.append(curr_mtl)
+
+            elif (tag == 'usemtl'):
+                curr_mtl = mtl_indexes.setdefault(line.split(None, 1)[1].strip(), len(mtl_indexes))
+
+            elif (tag == 'mtllib'):
+                mtllibs.extend(parts[1:])
+
+    vertices = np.frombuffer(vertexes, dtype=np.double).reshape(-1, 3)
+    indices = np.frombuffer(faces, dtype=np.intc).astype(np.int32).reshape(-1, 3)
+    face_materials = np.frombuffer(face_mtls, dtype=np.intc).astype(np.int32)
+
+    # scale vertex data
+    if (scale is not None) and (len(vertices)):
+        if (scale == 0):
+            scale_coef = 1/vertices.max()
+        else:
+            scale_coef = scale/vertices.max()
+        vertices = vertices*scale_coef
+
+    # only look up materials that are used by a face
+    materials = read_mtl_files(mtllibs, list(mtl_indexes), os.path.dirname(filepath))
+
+    if (not has_uvs):
+        return (vertices, indices, None, None, face_materials, materials, mtllibs)
+
+    uvs = np.concatenate((
+        np.frombuffer(uv_coords, dtype=np.double).reshape(-1, 2), 
+        ((0, 0), (0, 1), (1, 1)),
+    ))
+    uv_indices = np.frombuffer(uv_faces, dtype=np.intc).astype(np.int32).reshape(-1, 3)
+    default = uv_indices < 0
+    uv_indices[default] = len(uvs) - 4 - uv_indices[default]
+
+    return (vertices, indices, uvs, uv_indices, face_materials, materials, mtllibs)
+
+
+def read_mtl_files(mtllibs: list[str], names: list[str], dirpath: str) -> list[tuple]:
+    """Look up the diffuse texture of each material name in the given mtl files (paths relative to dirpath)\n
+    returns list of (name, texture path or None), texture paths are relative to dirpath"""
+    textures = {}
+
+    for lib in mtllibs:
+        if (not os.path.isfile(os.path.join(dirpath, lib))):
+            continue
+
+        with open(os.path.join(dirpath, lib)) as libfile: 
+            curr_mtl = ""
+            for line in libfile:
+                parts = line.split()
+                if (not parts):
+                    continue
+
+                # NOTE add other loading features here
+                #   for now, only basic texture maps implemented
+                if   (parts[0] == 'newmtl'):
+                    curr_mtl = line.split(None, 1)[1].strip()
+                elif (parts[0] == 'map_Kd') and (curr_mtl in names) and (curr_mtl not in textures):
+                    # texture path is the last argument (after options)
+                    textures[curr_mtl] = os.path.join(os.path.dirname(lib), parts[-1])
+
+    return [(name, textures.get(name)) for name in names]
+
+
+def load_materials(atlas: Atlas, materials: list[tuple], dirpath: str, decoded: dict = None) -> np.ndarray:
+    """Add the textures of materials (see read_obj_file) to atlas, unless already present (by name)\n
+    decoded optionally holds textures already decoded (ex: by AssetLoader's workers), 
+    as {texture path joined to dirpath: pixels (see array3d)}, other textures are loaded from file\n
+    returns array mapping material indexes to texture indexes in atlas"""
+    lookup = np.zeros(len(materials), dtype=np.uint16)
+
+    for index, (name, texture_path) in enumerate(materials):
+        if (name not in atlas) and (texture_path is not None):
+            path = os.path.join(dirpath, texture_path)
+            atlas.add_tex(
+                name,
+                decoded[path] if (decoded) and (path in decoded) else pygame.surfarray.array3d(pygame.image.load(path))
+            )
+        lookup[index] = atlas[name] if (name in atlas) else 0
+
+    return lookup
+
+
+# binary mesh cache
+#   a compiled copy of an obj file's data, stored next to it as <file>.<scale>.meshcache
+#   layout: magic, header length (uint32), json header, arrays (each aligned to 64 bytes)
+#   the header holds the content hashes of the obj and its mtl files, the cache is rebuilt if they change
+MESH_CACHE_VERSION = 1
+MESH_CACHE_MAGIC = b'P3DMESH\0'
+
+def read_obj_cached(
+    filepath: str, 
+    scale:    Optional[float] = 0
+)   ->        tuple:
+    """Same as read_obj_file, but arrays are read from a memory mapped binary cache if one is 
+    up to date (otherwise the obj file is read and the cache is rebuilt).\n
+    Mapped arrays are copy-on-write: pages are shared between processes until modified"""
+    cache_path = mesh_cache_path(filepath, scale)
+
+    cached = read_mesh_cache(cache_path, filepath, scale)
+    if (cached is not None):
+        return cached
+
+    result = read_obj_file(filepath, scale)
+    try:
+        write_mesh_cache(cache_path, filepath, scale, result)
+    except OSError: # asset directory may be read only, cache is optional
+        pass
+    return result
+
+def mesh_cache_path(filepath: str, scale: Optional[float]) -> str:
+    "Path of the cache of an obj file loaded with a given scale"
+    if (scale is None):
+        tag = 'raw'
+    elif (scale == 0):
+        tag = 'auto'
+    else:
+        tag = repr(float(scale))
+    return f"{filepath}.{tag}.meshcache"
+
+def file_hash(filepath: str) -> Optional[str]:
+    "Hash of a file's content (None if file doesn't exist)"
+    if (not os.path.isfile(filepath)):
+        return None
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_mesh_cache(cache_path: str, filepath: str, scale: Optional[float], obj: tuple) -> None:
+    "Write the result of read_obj_file to a binary cache file"
+    vertices, indices, uvs, uv_indices, face_materials, materials, mtllibs = obj
+    dirpath = os.path.dirname(filepath)
+
+    arrays = {'vertices': vertices, 'indices': indices, 'face_materials': face_materials}
+    if (uvs is not None):
+        arrays |= {'uvs': uvs, 'uv_indices': uv_indices}
+
+    header = {
+        'version'  : MESH_CACHE_VERSION,
+        'scale'    : scale,
+        'hash'     : file_hash(filepath),
+        'mtllibs'  : {lib: file_hash(os.path.join(dirpath, lib)) for lib in mtllibs},
+        'materials': materials,
+        'arrays'   : {},
+    }
+
+    # arrays are placed after header, header size depends on offsets (so leave plenty of room)
+    offset = 4096 * (1 + len(json.dumps(header)) // 2048)
+    for name, data in arrays.items():
+        header['arrays'][name] = {'dtype': data.dtype.str, 'shape': data.shape, 'offset': offset}
+        offset += -(-data.nbytes // 64) * 64
+
+    raw_header = json.dumps(header).encode()
+    if (len(MESH_CACHE_MAGIC) + 4 + len(raw_header) > header['arrays']['vertices']['offset']):
+        raise ValueError("mesh cache header too large")
+
+    # write to temporary file first, so a cache is never half written
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(MESH_CACHE_MAGIC)
+            file.write(len(raw_header).to_bytes(4, 'little'))
+            file.write(raw_header)
+            for name, data in arrays.items():
+                file.seek(header['arrays'][name]['offset'])
+                file.write(np.ascontiguousarray(data).tobytes())
+            file.truncate(offset)
+        os.replace(temp_path, cache_path)
+    finally:
+        if (os.path.exists(temp_path)):
+            os.remove(temp_path)
+
+def read_mesh_cache(cache_path: str, filepath: str, scale: Optional[float]) -> Optional[tuple]:
+    "Read a binary cache file (as read_obj_file would return), None if missing, out of date or damaged (ex: truncated)"
+    if (not os.path.isfile(cache_path)):
+        return None
+
+    with open(cache_path, 'rb') as file:
+        if (file.read(len(MESH_CACHE_MAGIC)) != MESH_CACHE_MAGIC):
+            return None
+        try:
+            header = json.loads(file.read(int.from_bytes(file.read(4), 'little')))
+        except ValueError:
+            return None
+
+    dirpath = os.path.dirname(filepath)
+    # (a header that doesn't have the expected fields, or arrays that don't fit the file, mean the cache is damaged)
+    try:
+        if (
+            header.get('version') != MESH_CACHE_VERSION
+            or header['scale'] != scale
+            or header['hash'] != file_hash(filepath)
+            or any(file_hash(os.path.join(dirpath, lib)) != lib_hash for lib, lib_hash in header['mtllibs'].items())
+        ):
+            return None
+
+        # (offset, size in bytes) of each array
+        extents = {
+            name: (info['offset'], np.dtype(info['dtype']).itemsize*int(np.prod(info['shape'])))
+            for name, info in header['arrays'].items()
+        }
+        # arrays are written after the header, a truncated file (ex: disk full) is missing some of them
+        if (os.path.getsize(cache_path) < max((offset + size for offset, size in extents.values()), default=0)):
+            return None
+
+        buffer = np.memmap(cache_path, dtype=np.uint8, mode='c')
+        arrays = {
+            name: buffer[offset:offset + size].view(header['arrays'][name]['dtype']).reshape(header['arrays'][name]['shape'])
+            for name, (offset, size) in extents.items()
+        }
+        # (shapes must agree with each other: points and triangles have 3 columns, one material per triangle)
+        if (
+            arrays['vertices'].shape[1:] != (3,) or arrays['indices'].shape[1:] != (3,)
+            or arrays['face_materials'].shape != arrays['indices'].shape[:1]
+        ):
+            return None
+
+        return (
+            arrays['vertices'],
+            arrays['indices'],
+            arrays.get('uvs'),
+            arrays.get('uv_indices'),
+            arrays['face_materials'],
+            [tuple(material) for material in header['materials']],
+            list(header['mtllibs']),
+        )
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
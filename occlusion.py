@@ -0,0 +1,160 @@
+import numpy as np
+import numba
+
+# Hierarchical z (Hi-Z) occlusion culling, used by Renderer3D.
+# A depth pyramid holds the z_buffer at decreasing resolutions, every texel storing the farthest
+#   depth of the pixels below it. Something whose nearest depth is farther than the farthest depth
+#   over its whole screen rectangle can't pass the z test anywhere, so it doesn't need to be drawn.
+# The rectangle is looked up at a level where it only covers a few texels.
+
+
+class DepthPyramid:
+    """
+    Max depth pyramid of a z_buffer, all levels packed into one array:
+        texels: every level's depths, texel (x, y) of a level is texels[offset + x*height + y]
+        table:  (levels, 3) array of each level's (offset, width, height)
+    Level l covers 2^(l+1) x 2^(l+1) pixels (the full resolution z_buffer isn't copied, 
+    a 2x2 block is the smallest area tested), each level is half the size of the previous (rounded up)
+    """
+
+    __slots__ = ['texels', 'table']
+
+    def __init__(self):
+        self.texels: np.ndarray = np.empty(0, dtype=np.double)
+        self.table : np.ndarray = np.empty((0, 3), dtype=np.int64)
+
+    def build(self, z_buffer: np.ndarray) -> None:
+        "Rebuild pyramid from z_buffer (reallocating only if its size changed)"
+        width, height = z_buffer.shape
+        if (not len(self.table)) or (tuple(self.table[0, 1:]) != (-(-width//2), -(-height//2))):
+            levels = [(0, -(-width//2), -(-height//2))]
+            while (levels[-1][1] > 1) or (levels[-1][2] > 1):
+                offset, width, height = levels[-1]
+                levels.append((offset + width*height, -(-width//2), -(-height//2)))
+            self.table = np.asarray(levels, dtype=np.int64)
+            self.texels = np.empty(levels[-1][0] + 1, dtype=np.double)
+
+        build_pyramid(z_buffer, self.texels, self.table)
+
+
+@numba.njit(cache=True)
+def reduce_level(src, src_offset, src_width, src_height, dst, dst_offset, dst_width, dst_height) -> None:
+    "Write the farthest depth of every 2x2 block of a level (or of the z_buffer) into the next level"
+    for x in range(dst_width):
+        for y in range(dst_height):
+            if (2*x + 1 < src_width) and (2*y + 1 < src_height):
+                near_col = src_offset + 2*x*src_height + 2*y
+                far_col = near_col + src_height
+                depth = max(
+                    max(src[near_col], src[near_col + 1]),
+                    max(src[far_col], src[far_col + 1]),
+                )
+            else: # block on the edge of an odd sized level
+                depth = -np.inf
+                for sub_x in range(2*x, min(2*x + 2, src_width)):
+                    for sub_y in range(2*y, min(2*y + 2, src_height)):
+                        depth = max(depth, src[src_offset + sub_x*src_height + sub_y])
+            dst[dst_offset + x*dst_height + y] = depth
+
+@numba.njit(cache=True)
+def build_pyramid(z_buffer, texels, table) -> None:
+    width, height = z_buffer.shape
+    reduce_level(z_buffer.ravel(), 0, width, height, texels, table[0, 0], table[0, 1], table[0, 2])
+    for level in range(1, len(table)):
+        src_offset, src_width, src_height = table[level-1]
+        dst_offset, dst_width, dst_height = table[level]
+        reduce_level(texels, src_offset, src_width, src_height, texels, dst_offset, dst_width, dst_height)
+
+@numba.njit(cache=True)
+def rect_occluded(texels, table, x_min, x_max, y_min, y_max, depth) -> bool:
+    """Whether every pixel of the rectangle [x_min, x_max] x [y_min, y_max] (inclusive, clamped to screen)
+    is nearer than depth. An empty rectangle is occluded"""
+    x_min, y_min = max(x_min, 0), max(y_min, 0)
+    x_max, y_max = min(x_max, 2*table[0, 1] - 1), min(y_max, 2*table[0, 2] - 1)
+    if (x_min > x_max) or (y_min > y_max):
+        return True
+    # to texels of first level
+    x_min, x_max, y_min, y_max = x_min >> 1, x_max >> 1, y_min >> 1, y_max >> 1
+
+    # lowest level where rectangle covers at most 4x4 texels
+    level = 0
+    while (level < len(table) - 1) and (
+        (x_max >> level) - (x_min >> level) >= 4 or (y_max >> level) - (y_min >> level) >= 4
+    ):
+        level += 1
+
+    offset, _, height = table[level]
+    for x in range(x_min >> level, (x_max >> level) + 1):
+        for y in range(y_min >> level, (y_max >> level) + 1):
+            if (texels[offset + x*height + y] >= depth):
+                return False
+    return True
+
+@numba.njit(cache=True)
+def occluded_instances(bounds, instance_data, positions, view_proj, instance_state, near, texels, table) -> np.ndarray:
+    """Test the aabb of every instance which isn't culled (state != 0) against a depth pyramid.\n
+    Returns array of bool, whether each instance is surely hidden"""
+    width, height = 2*table[0, 1], 2*table[0, 2]
+    occluded = np.zeros(len(instance_data), dtype=np.bool_)
+
+    for inst, data in enumerate(instance_data):
+        if (instance_state[inst] == 0): continue
+
+        # screen rectangle and nearest depth of the box's corners
+        #   (the mesh is inside the box, so its pixels can't be outside the rectangle or nearer)
+        x_lo = y_lo = depth = np.inf
+        x_hi = y_hi = -np.inf
+        visible = False
+        for corner in range(8):
+            x = bounds[data, corner & 1, 0] + positions[inst, 0]
+            y = bounds[data, (corner >> 1) & 1, 1] + positions[inst, 1]
+            z = bounds[data, (corner >> 2) & 1, 2] + positions[inst, 2]
+
+            clip_x = x*view_proj[0, 0] + y*view_proj[1, 0] + z*view_proj[2, 0] + view_proj[3, 0]
+            clip_y = x*view_proj[0, 1] + y*view_proj[1, 1] + z*view_proj[2, 1] + view_proj[3, 1]
+            clip_z = x*view_proj[0, 2] + y*view_proj[1, 2] + z*view_proj[2, 2] + view_proj[3, 2]
+            clip_w = x*view_proj[0, 3] + y*view_proj[1, 3] + z*view_proj[2, 3] + view_proj[3, 3]
+            if (clip_w < near): # box crosses near plane, can't be projected
+                visible = True
+                break
+
+            x_lo, x_hi = min(x_lo, clip_x/clip_w), max(x_hi, clip_x/clip_w)
+            y_lo, y_hi = min(y_lo, clip_y/clip_w), max(y_hi, clip_y/clip_w)
+            depth = min(depth, clip_z)
+        if (visible):
+            continue
+
+        # to pixels, like the rasterizer (with a pixel of margin)
+        occluded[inst] = rect_occluded(
+            texels, table,
+            int(x_lo + width//2) - 1, int(x_hi + width//2) + 1,
+            int(height//2 - y_hi) - 1, int(height//2 - y_lo) + 1,
+            depth,
+        )
+    return occluded
+
+@numba.njit(cache=True)
+def occluded_triangles(triangles, culled_faces, texels, table) -> int:
+    """Cull projected triangles which are surely hidden by the depth pyramid (writes into culled_faces).\n
+    Returns amount of triangles culled"""
+    width, height = 2*table[0, 1], 2*table[0, 2]
+    count = 0
+    for index in range(len(triangles)):
+        if (culled_faces[index]): continue
+
+        tri = triangles[index]
+        x_lo = min(tri[0, 0], tri[1, 0], tri[2, 0])
+        x_hi = max(tri[0, 0], tri[1, 0], tri[2, 0])
+        y_lo = min(tri[0, 1], tri[1, 1], tri[2, 1])
+        y_hi = max(tri[0, 1], tri[1, 1], tri[2, 1])
+        depth = min(tri[0, 2], tri[1, 2], tri[2, 2])
+
+        if (rect_occluded(
+            texels, table,
+            int(x_lo + width//2) - 1, int(x_hi + width//2) + 1,
+            int(height//2 - y_hi) - 1, int(height//2 - y_lo) + 1,
+            depth,
+        )):
+            culled_faces[index] = True
+            count += 1
+    return count
@@ -0,0 +1,379 @@
+import numpy as np
+import numba
+
+# Rasterization kernels, used by Renderer3D.
+# A whole frame is rasterized in a single compiled call (rasterize_all), so the interpreter
+#   isn't involved once per triangle.
+# Kernels are module level functions (instead of staticmethods) so they can call each other.
+# Alternatively, triangles can be binned into screen tiles and the tiles drawn on multiple threads
+#   (bin_triangles, rasterize_tiled).
+# Triangles can be drawn front to back (depth_order), so hidden pixels fail the z test before being textured.
+# Textures are mipmapped (see Atlas), each triangle samples the level matching its size on screen (mip_level).
+#
+# Triangles are projected: (x, y, z) with x, y centered on the surface (y up), and z the depth.
+
+
+@numba.njit(nogil=True, cache=True)
+def rasterize_all(surfarray, z_buffer, triangles, uvs, textures, culled_faces, tex_pixels, tex_table) -> tuple:
+    """Draw every triangle which isn't culled (in order), sampling textures from a packed atlas.\n
+    Returns amount of pixels tested against and written to z_buffer"""
+    tested = written = 0
+    for index in range(len(triangles)):
+        if (culled_faces[index]): continue
+
+        tri_tested, tri_written = draw_triangle(
+            surfarray, z_buffer, triangles[index], tex_pixels, tex_table, textures[index], uvs[index],
+            0, len(surfarray), 0, len(surfarray[0]),
+        )
+        tested += tri_tested
+        written += tri_written
+    return tested, written
+
+@numba.njit(nogil=True, cache=True)
+def bin_triangles(triangles, culled_faces, surf_width, surf_height, tile_size) -> tuple:
+    """Sort triangles which aren't culled into the screen tiles their bounding box overlaps.\n
+    Tiles are numbered row by row. Returns (tile_starts, tile_tris):
+    the triangles of tile i are tile_tris[tile_starts[i]:tile_starts[i+1]], in original order"""
+    tiles_x = -(-surf_width//tile_size)
+    tiles_y = -(-surf_height//tile_size)
+
+    # tile range (x0, x1, y0, y1 inclusive) of every triangle, empty if off screen
+    ranges = np.empty((len(triangles), 4), dtype=np.int64)
+    counts = np.zeros(tiles_x*tiles_y + 1, dtype=np.int64)
+
+    for index in range(len(triangles)):
+        ranges[index] = (0, -1, 0, -1)
+        if (culled_faces[index]): continue
+
+        # bounding box in pixels (same rounding as draw_triangle)
+        x_lo = y_lo = np.inf
+        x_hi = y_hi = -np.inf
+        for pnt in range(3):
+            x = float(int(triangles[index, pnt, 0] + surf_width//2))
+            y = float(int(surf_height//2 - triangles[index, pnt, 1]))
+            x_lo, x_hi = min(x_lo, x), max(x_hi, x)
+            y_lo, y_hi = min(y_lo, y), max(y_hi, y)
+
+        if (x_hi < 0) or (y_hi < 0) or (x_lo >= surf_width) or (y_lo >= surf_height):
+            continue
+        ranges[index] = (
+            max(0, int(x_lo))//tile_size, min(surf_width-1, int(x_hi))//tile_size,
+            max(0, int(y_lo))//tile_size, min(surf_height-1, int(y_hi))//tile_size,
+        )
+        for tile_y in range(ranges[index, 2], ranges[index, 3]+1):
+            for tile_x in range(ranges[index, 0], ranges[index, 1]+1):
+                counts[tile_y*tiles_x + tile_x + 1] += 1
+
+    # counting sort: offsets of each tile, then fill in order
+    tile_starts = np.cumsum(counts)
+    tile_tris = np.empty(tile_starts[-1], dtype=np.int64)
+    fill = tile_starts[:-1].copy()
+    for index in range(len(triangles)):
+        for tile_y in range(ranges[index, 2], ranges[index, 3]+1):
+            for tile_x in range(ranges[index, 0], ranges[index, 1]+1):
+                tile = tile_y*tiles_x + tile_x
+                tile_tris[fill[tile]] = index
+                fill[tile] += 1
+
+    return tile_starts, tile_tris
+
+@numba.njit(nogil=True, cache=True)
+def depth_order(depths, culled_faces, bits) -> np.ndarray:
+    """Indexes of the triangles which aren't culled, nearest (smallest depth) first.\n
+    Approximate: depths are quantized into 2^bits buckets between the nearest and farthest depth,
+    and sorted with a radix sort (8 bits per pass). Triangles in the same bucket keep their order"""
+    count = 0
+    lo, hi = np.inf, -np.inf
+    for index in range(len(depths)):
+        if (culled_faces[index]): continue
+        count += 1
+        lo, hi = min(lo, depths[index]), max(hi, depths[index])
+
+    order = np.empty(count, dtype=np.int64)
+    keys = np.empty(count, dtype=np.int64)
+    scale = ((1 << bits) - 1)/(hi - lo) if (hi > lo) else 0.0
+    out = 0
+    for index in range(len(depths)):
+        if (culled_faces[index]): continue
+        order[out] = index
+        keys[out] = int((depths[index] - lo)*scale)
+        out += 1
+
+    # least significant byte first, each pass is a (stable) counting sort
+    sorted_order = np.empty_like(order)
+    sorted_keys = np.empty_like(keys)
+    counts = np.empty(257, dtype=np.int64)
+    for shift in range(0, bits, 8):
+        counts[:] = 0
+        for key in keys:
+            counts[((key >> shift) & 255) + 1] += 1
+        for bucket in range(256):
+            counts[bucket + 1] += counts[bucket]
+        for entry in range(count):
+            bucket = (keys[entry] >> shift) & 255
+            sorted_order[counts[bucket]] = order[entry]
+            sorted_keys[counts[bucket]] = keys[entry]
+            counts[bucket] += 1
+        order, sorted_order = sorted_order, order
+        keys, sorted_keys = sorted_keys, keys
+
+    return order
+
+@numba.njit(parallel=True, nogil=True, cache=True)
+def rasterize_tiled(surfarray, z_buffer, triangles, uvs, textures, tex_pixels, tex_table, tile_starts, tile_tris, tile_size) -> tuple:
+    """Same as rasterize_all, for triangles binned by bin_triangles. Tiles are drawn in parallel:
+    each tile only writes its own pixels, and draws its triangles in order, so output is the same
+    as drawing everything on one thread.\n
+    Returns amount of pixels tested against and written to z_buffer"""
+    surf_width, surf_height = len(surfarray), len(surfarray[0])
+    tiles_x = -(-surf_width//tile_size)
+    num_tiles = len(tile_starts) - 1
+
+    tested = np.zeros(num_tiles, dtype=np.int64)
+    written = np.zeros(num_tiles, dtype=np.int64)
+    for tile in numba.prange(num_tiles):
+        x_min = (tile % tiles_x)*tile_size
+        y_min = (tile//tiles_x)*tile_size
+        x_max = min(surf_width, x_min + tile_size)
+        y_max = min(surf_height, y_min + tile_size)
+
+        for entry in range(tile_starts[tile], tile_starts[tile+1]):
+            index = tile_tris[entry]
+            tri_tested, tri_written = draw_triangle(
+                surfarray, z_buffer, triangles[index], tex_pixels, tex_table, textures[index], uvs[index],
+                x_min, x_max, y_min, y_max,
+            )
+            tested[tile] += tri_tested
+            written[tile] += tri_written
+
+    return tested.sum(), written.sum()
+
+@numba.njit(nogil=True, cache=True)
+def wireframe_all(surfarray, triangles, culled_faces) -> None:
+    "Draw the wireframe of every triangle which isn't culled"
+    for index in range(len(triangles)):
+        if (culled_faces[index]): continue
+        draw_wireframe(surfarray, triangles[index])
+
+@numba.njit(cache=True)
+# A LOT of inspirations from https://github.com/FinFetChannel/SimplePython3DEngine 
+def draw_triangle(surfarray, z_buffer, triangle, tex_pixels, tex_table, texture, texture_uv, x_min, x_max, y_min, y_max):
+    """Draw a projected triangle, returns amount of pixels tested against and written to z_buffer\n
+    texture is an index into tex_table, (offset, width, height) of each mip level of the texture in tex_pixels (see Atlas).
+    Levels past the end of tex_table's second axis are clamped to its last one\n
+    Only pixels inside [x_min, x_max) and [y_min, y_max) are drawn (a tile, or the whole surface)"""
+    # start with perspective correct triangle
+    surf_width, surf_height = len(surfarray), len(surfarray[0])
+    level = min(mip_level(triangle, texture_uv, tex_table[texture, 0, 1], tex_table[texture, 0, 2]), tex_table.shape[1]-1)
+    tex_offset, tex_height = tex_table[texture, level, 0], tex_table[texture, level, 2]
+    tex_size_u, tex_size_v = tex_table[texture, level, 1]-1, tex_height-1
+
+    # normalize pygame coordinates (pygame has (0,0) in top left corner)
+    # and sort points of triangle by y value (top to botton)
+    #   note: stable, points with the same y keep their order
+    order = sort_by_y(triangle, surf_height)
+    start, middle, stop = order[0], order[1], order[2]
+
+    x_start, y_start, z_start = float(int(triangle[start, 0]+surf_width//2)), float(int(surf_height//2-triangle[start, 1])), triangle[start, 2]
+    x_middle, y_middle, z_middle = float(int(triangle[middle, 0]+surf_width//2)), float(int(surf_height//2-triangle[middle, 1])), triangle[middle, 2]
+    x_stop, y_stop, z_stop = float(int(triangle[stop, 0]+surf_width//2)), float(int(surf_height//2-triangle[stop, 1])), triangle[stop, 2]
+
+    x_slope_1 = (x_stop - x_start)/(y_stop - y_start + 1e-32)
+    x_slope_2 = (x_middle - x_start)/(y_middle - y_start + 1e-32)
+    x_slope_3 = (x_stop - x_middle)/(y_stop - y_middle + 1e-32)  
+
+
+    # invert z for interpolation
+    z_start, z_middle, z_stop = 1/(z_start +1e-32), 1/(z_middle + 1e-32), 1/(z_stop +1e-32)
+
+    z_slope_1 = (z_stop - z_start)/(y_stop - y_start + 1e-32) 
+    z_slope_2 = (z_middle - z_start)/(y_middle - y_start + 1e-32) 
+    z_slope_3 = (z_stop - z_middle)/(y_stop - y_middle + 1e-32)  
+
+    # uv coordinates multiplied by inverted z to account for perspective
+    #   (u and v are kept as separate scalars, so no arrays are created per pixel)
+    u_start, v_start = texture_uv[start, 0]*z_start, texture_uv[start, 1]*z_start
+    u_middle, v_middle = texture_uv[middle, 0]*z_middle, texture_uv[middle, 1]*z_middle
+    u_stop, v_stop = texture_uv[stop, 0]*z_stop, texture_uv[stop, 1]*z_stop
+
+    u_slope_1, v_slope_1 = (u_stop - u_start)/(y_stop - y_start + 1e-32), (v_stop - v_start)/(y_stop - y_start + 1e-32)
+    u_slope_2, v_slope_2 = (u_middle - u_start)/(y_middle - y_start + 1e-32), (v_middle - v_start)/(y_middle - y_start + 1e-32)
+    u_slope_3, v_slope_3 = (u_stop - u_middle)/(y_stop - y_middle + 1e-32), (v_stop - v_middle)/(y_stop - y_middle + 1e-32)
+
+    tested = written = 0
+    # min and max used to cut off rows not in screen (or tile)
+    for y in range(max(y_min, int(y_start)), min(y_max, int(y_stop))):
+        # to get start and end of each row, traverse the lines 
+        # of the triangle that make up the row (on either side)
+        # simply use slope to find x limits given y
+
+        delta_y = y - y_start
+        x1 = x_start + int(delta_y*x_slope_1)
+        z1 = z_start + delta_y*z_slope_1
+        u1, v1 = u_start + delta_y*u_slope_1, v_start + delta_y*v_slope_1
+
+        # y middle is the where the lines that the row is between changes
+        #   ex: above y_middle, the row is between line 1 and line 2, but below it,
+        #       the line is between line 3 and line 2
+        #                O
+        #       line 1  * *
+        #              *   *  line 2
+        #             O—————*—————————————
+        #               **   *    below this line (y-middle), the rows (x vals) of pixels in the triangle
+        #          line 3  ** *    are between line 3 and line 2, as opposed to line 1 and 2
+        #                     *O 
+        if y < y_middle:
+            x2 = x_start + int(delta_y*x_slope_2)
+            z2 = z_start + delta_y*z_slope_2
+            u2, v2 = u_start + delta_y*u_slope_2, v_start + delta_y*v_slope_2
+
+        else:
+            delta_y = y - y_middle
+            x2 = x_middle + int(delta_y*x_slope_3)
+            z2 = z_middle + delta_y*z_slope_3
+            u2, v2 = u_middle + delta_y*u_slope_3, v_middle + delta_y*v_slope_3
+
+        # x1 should be smaller
+        if x1 > x2:
+            x1, x2 = x2, x1
+            z1, z2 = z2, z1
+            u1, u2 = u2, u1
+            v1, v2 = v2, v1
+
+        u_slope = (u2 - u1)/(x2 - x1 + 1e-32) # 1e-32 to avoid zero division ¯\_(ツ)_/¯
+        v_slope = (v2 - v1)/(x2 - x1 + 1e-32)
+        z_slope = (z2 - z1)/(x2 - x1 + 1e-32)
+
+        # min and max used to cut off pixels not in screen (or tile)
+        for x in range(max(x_min, int(x1)), min(x_max, int(x2))):
+            z = 1/(z1 + (x - x1)*z_slope + 1e-32) # retrive z
+
+            # if pixel's z distance from cam is closer than previous 
+            #   value in z_buf, update z_buf and draw pixel.
+            # Otherwise, the pixel is behind another pixel (don't render)
+            tested += 1
+            if (z > z_buffer[x, y]):
+                continue
+            z_buffer[x, y] = z
+            written += 1
+
+            # multiply by z to go back to uv space
+            u = (u1 + (x - x1)*u_slope)*z
+            v = (v1 + (x - x1)*v_slope)*z
+            # for now, shading is determined by distance from cam (farther=darker)
+            shade = max(0, 1 - z/(20))
+            # don't render texture if uv out of bounds
+            if (min(u, v) >= 0 and max(u, v) <= 1): 
+                texel = tex_offset + int(u*tex_size_u)*tex_height + int(v*tex_size_v)
+                for channel in range(3):
+                    surfarray[x, y, channel] = tex_pixels[texel, channel]*shade
+
+    return tested, written
+
+@numba.njit(cache=True)
+def mip_level(triangle, texture_uv, tex_width, tex_height) -> int:
+    """Mip level a projected triangle should sample: each level halves both dimensions (quarters the area),
+    so the level is half the log2 of how many texels (of the full texture) the triangle covers per pixel.\n
+    0 when magnified (or if the uvs are degenerate). Only depends on the triangle and the size of the texture,
+    not on where levels are packed"""
+    screen_area = abs(
+        (triangle[1, 0] - triangle[0, 0])*(triangle[2, 1] - triangle[0, 1]) - 
+        (triangle[2, 0] - triangle[0, 0])*(triangle[1, 1] - triangle[0, 1])
+    )
+    texel_area = abs(
+        (texture_uv[1, 0] - texture_uv[0, 0])*(texture_uv[2, 1] - texture_uv[0, 1]) - 
+        (texture_uv[2, 0] - texture_uv[0, 0])*(texture_uv[1, 1] - texture_uv[0, 1])
+    )*tex_width*tex_height
+    # (both areas are doubled, which cancels out)
+    if (texel_area <= screen_area):
+        return 0
+    return int(0.5*np.log2(texel_area/(screen_area + 1e-32)))
+
+@numba.njit(cache=True)
+def sort_by_y(triangle, surf_height) -> tuple:
+    "Indexes of a projected triangle's points, sorted by screen y (top to bottom, stable)"
+    y0 = int(surf_height//2-triangle[0, 1])
+    y1 = int(surf_height//2-triangle[1, 1])
+    y2 = int(surf_height//2-triangle[2, 1])
+
+    # insertion sort (stable)
+    a, b, c = 0, 1, 2
+    if (y1 < y0):
+        a, b, y0, y1 = b, a, y1, y0
+    if (y2 < y1):
+        b, c, y1, y2 = c, b, y2, y1
+        if (y1 < y0):
+            a, b = b, a
+    return a, b, c
+
+@numba.njit(cache=True)
+def draw_wireframe(surfarray, triangle):
+    "Draw the edges of a projected triangle (fading with distance)"
+
+    surf_width, surf_height = len(surfarray), len(surfarray[0])
+    centered_tri = np.asarray([(int(point[0]+surf_width//2), int(surf_height//2-point[1]), point[2]) for point in triangle])
+
+    sorted_y = centered_tri[:,1].argsort()
+
+    x_start, y_start, z_start = centered_tri[sorted_y[0]]
+    x_middle, y_middle, z_middle = centered_tri[sorted_y[1]]
+    x_stop, y_stop, z_stop = centered_tri[sorted_y[2]] 
+
+    x_slope_1 = (x_stop - x_start)/(y_stop - y_start + 1e-32)
+    x_slope_2 = (x_middle - x_start)/(y_middle - y_start + 1e-32)
+    x_slope_3 = (x_stop - x_middle)/(y_stop - y_middle + 1e-32)  
+
+
+    # invert z for interpolation
+    z_start, z_middle, z_stop = 1/(z_start +1e-32), 1/(z_middle + 1e-32), 1/(z_stop +1e-32)
+
+    z_slope_1 = (z_stop - z_start)/(y_stop - y_start + 1e-32) 
+    z_slope_2 = (z_middle - z_start)/(y_middle - y_start + 1e-32) 
+    z_slope_3 = (z_stop - z_middle)/(y_stop - y_middle + 1e-32)  
+
+    for y in range(max(0, int(y_start)), min(surf_height, int(y_stop))):
+
+        delta_y = y - y_start
+        x1 = x_start + int(delta_y*x_slope_1)
+        z1 = z_start + delta_y*z_slope_1
+
+        if y < y_middle:
+            x2 = x_start + int(delta_y*x_slope_2)
+            z2 = z_start + delta_y*z_slope_2 
+            # save right line slope
+            r_slope = x_slope_2
+        else:
+            delta_y = y - y_middle
+            x2 = x_middle + int(delta_y*x_slope_3)
+            z2 = z_middle + delta_y*z_slope_3
+            r_slope = x_slope_3
+
+        # x1 should be smaller
+        if x1 > x2:
+            x1, x2 = x2, x1
+            z1, z2 = z2, z1
+
+        z_slope = (z2 - z1)/(x2 - x1 + 1e-32)
+
+        # min and max used to cut off pixels not in screen
+        for x in range(max(0, int(x1)), min(surf_width, int(x2))):
+            z = 1/(z1 + (x - x1)*z_slope + 1e-32) # retrive z
+
+            shade = max(0, 1 - z/(50))
+
+            # stop if too far
+            if (shade == 0):
+                continue
+
+            # closest line
+            d = min(
+                abs(((y_stop-y_start)*x - (x_stop-x_start)*y + x_stop*y_start - y_stop*x_start)/np.sqrt((y_stop-y_start)**2+(x_stop-x_start)**2)),
+                min(
+                abs(((y_middle-y_start)*x - (x_middle-x_start)*y + x_middle*y_start - y_middle*x_start)/np.sqrt((y_middle-y_start)**2+(x_middle-x_start)**2)),
+                abs(((y_stop-y_middle)*x - (x_stop-x_middle)*y + x_stop*y_middle - y_stop*x_middle)/np.sqrt((y_stop-y_middle)**2+(x_stop-x_middle)**2))
+                )
+            ) 
+
+            # draw pixel if close enough to line
+            if (d < 0.5):
+                surfarray[x, y] = np.asarray((255,255,255))*shade
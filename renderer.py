@@ -1,9 +1,19 @@
 import pygame
 import numpy as np
 import numba
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
+import raster
+import bvh
+import occlusion
+from occlusion import DepthPyramid
 from camera import Camera
-from meshes import Mesh, global_texture_atlas
+from meshes import Mesh, MeshData, global_texture_atlas
+from frame_stats import FrameStats
+from scene import SceneStore
+from clipping import Clipper
+
 
 
 class Renderer3D:
@@ -15,19 +25,66 @@ class Renderer3D:
         '__ASPECT_RATIO', 
         '__PROJ', 
         '__CLIPPING_PLANES',
+        '__FAR_PLANE',
         'cam', 
         'pix_size',
+        'tile_size',
+        'threads',
+        'occlusion',
+        'occlusion_triangles',
+        'draw_order',
+        'lod_size',
+        'pipelined',
+        'precision',
+        '__dtype',
+        'mipmaps',
         'surface', 
         'z_buffer',
+        '__frame',
+        '__pixels',
+        '__scaled',
         'meshes',
-        'debug'
+        'scene',
+        'clipper',
+        '__clippers',
+        '__worker',
+        '__pending',
+        '__pyramid',
+        '__visible',
+        '__rejected',
+        '__levels',
+        '__draw_data',
+        'debug',
+        'frame_count',
+        'stats_callbacks',
     ]
 
     __MAX_Z = 1000
     __OFFSET_Z = .1
     __FOV_RAD = 360
-
-    def __init__(self, surface: pygame.surface.Surface, cam: Camera, pix_size: int = 1, debug=False):
+    __GUARD_BAND = 4
+    __DRAW_ORDERS = ('none', 'mesh', 'triangle')
+    __PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+    __DEPTH_BITS = 16
+    __LOD_HYSTERESIS = 0.25
+    __BACKGROUND = (120, 170, 210)
+
+    def __init__(
+            self, 
+            surface: pygame.surface.Surface, 
+            cam: Camera, 
+            pix_size: int = 1, 
+            debug=False, 
+            tile_size: int = 0, 
+            threads: int = 0,
+            occlusion: bool = False,
+            occlusion_triangles: bool = False,
+            draw_order: str = 'none',
+            lod_size: float = 0,
+            pipelined: bool = False,
+            precision: str = 'float64',
+            mipmaps: bool = True,
+        ):
 
         self.debug = debug
 
@@ -41,94 +98,219 @@ class Renderer3D:
             (0, 0, (-self.__MAX_Z * self.__OFFSET_Z) / (self.__MAX_Z - self.__OFFSET_Z), 0),
         ), dtype=np.double)
 
-        # a plane is just 3 points (ccw faces towards cam)
+        # clipping is done in clip space (after multiplying by view and projection matrices, 
+        #   before dividing by w). Note that w is the distance in front of cam.
+        # a plane is (a, b, c, d, e): a point (x, y, z, w) is outside if ax + by + cz + dw > e
+        # the view frustum is made of:
+        #   near plane:   triangles crossing it are clipped (projection breaks behind the cam)
+        #   far plane:    nothing beyond MAX_Z passes the z test, so triangles beyond it are culled
+        #   screen edges: triangles entirely outside are culled. Triangles crossing them are only
+        #       clipped if they leave the guard band (GUARD_BAND times the screen), the rasterizer 
+        #       already skips offscreen pixels, so clipping only pays off for huge triangles
+        #   (screen edges depend on pix_size, see __screen_planes)
         self.__CLIPPING_PLANES = np.asarray((
-            ((0, 0, self.__OFFSET_Z*10+1), (1, 1, self.__OFFSET_Z*10+1), (1, 0 , self.__OFFSET_Z*10+1)), # front facing
-            # ((0.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 1.0, 1.0)),
+            (0, 0, 0, -1, -(self.__OFFSET_Z*10+1)), # front facing (w < near)
+        ), dtype=np.double)
+        self.__FAR_PLANE = np.asarray((
+            (0, 0, 1, 0, self.__MAX_Z),             # behind far plane (z > far)
         ), dtype=np.double)
 
         self.cam: Camera = cam
         self.pix_size: int = int(pix_size)
         if (pix_size < 1):
             raise ValueError("pix_size cannot be smaller than native screen resolution (1)")
+
+        # tiled rasterization: if tile_size is set, the screen is split into tiles (of tile_size
+        #   low res pixels) which are rasterized in parallel, on `threads` threads (0 uses all cores)
+        self.tile_size: int = int(tile_size)
+        self.threads: int = int(threads)
+        if (self.tile_size < 0):
+            raise ValueError("tile_size cannot be negative")
+        if not (0 <= self.threads <= numba.config.NUMBA_NUM_THREADS):
+            raise ValueError(f"threads must be between 0 and {numba.config.NUMBA_NUM_THREADS}")
         
+        # occlusion culling: meshes (and, with occlusion_triangles, triangles) hidden behind 
+        #   geometry already drawn are skipped (see __draw_occlusion_culled)
+        self.occlusion: bool = bool(occlusion)
+        self.occlusion_triangles: bool = bool(occlusion_triangles)
+
+        # order triangles are drawn in: 
+        #   'none':     as submitted (mesh list order)
+        #   'mesh':     meshes front to back (by nearest point of their bounding sphere)
+        #   'triangle': triangles front to back (by their nearest vertex)
+        # drawing near things first makes more hidden pixels fail the z test before being textured
+        self.draw_order: str = draw_order
+        if (draw_order not in self.__DRAW_ORDERS):
+            raise ValueError(f"draw_order must be one of {self.__DRAW_ORDERS}")
+
+        # levels of detail (see MeshData.lods): meshes whose bounding sphere is projected smaller than
+        #   lod_size (diameter, in low res pixels) are drawn with simpler levels, one level further
+        #   each time their projected area halves. 0 always draws full detail
+        self.lod_size: float = float(lod_size)
+        if (self.lod_size < 0):
+            raise ValueError("lod_size cannot be negative")
+
+        # pipelined rendering: the geometry of a frame (everything up to rasterization) is processed on a
+        #   worker thread, while the previous frame is rasterized and presented (kernels release the GIL,
+        #   so both run at once on multi core machines). Each frame shows the cam and meshes as they were
+        #   on the previous call (one frame of latency). Can't be combined with occlusion culling (rejected)
+        self.pipelined: bool = bool(pipelined)
+        if (self.pipelined and self.occlusion):
+            raise ValueError("pipelined can't be used with occlusion culling (it needs the frame's depth to process geometry)")
+
+        # precision of the per frame geometry and depth buffers ('float64' or 'float32'): transformed, clipped
+        #   and projected triangles, their uvs, and z_buffer. float32 halves the memory they take (and the
+        #   bandwidth to read and write them), at the cost of precision (depth of nearly touching faces)
+        #   Matrices, planes and culling stay float64 (they are tiny)
+        self.precision: str = precision
+        if (precision not in self.__PRECISIONS):
+            raise ValueError(f"precision must be one of {tuple(self.__PRECISIONS)}")
+        self.__dtype = self.__PRECISIONS[precision]
+
+        # mipmapping: each triangle samples the mip level of its texture (see Atlas) matching its size on screen,
+        #   so distant triangles read small levels (less aliasing, and fewer cache misses). 
+        #   Otherwise, textures are always sampled at full resolution
+        self.mipmaps: bool = bool(mipmaps)
+
         # define instance variables that will change
 
         self.surface: pygame.surface.Surface = surface
-        self.z_buffer: np.ndarray = np.full(
-            (self.__WIDTH//self.pix_size, self.__HEIGHT//self.pix_size),
-            self.__MAX_Z
-        ).astype('d') # array of doubles
-
-        self.meshes: list[Mesh] = []
+        # frame buffers (low res, see __allocate_buffers), reused every frame
+        self.z_buffer: np.ndarray
+        self.__frame: pygame.surface.Surface
+        self.__pixels: np.ndarray
+        self.__scaled: pygame.surface.Surface
+        self.__allocate_buffers()
+
+        # geometry of all meshes, kept in contiguous arrays
+        self.scene: SceneStore = SceneStore()
+        # NOTE: use add_mesh/remove_mesh instead of modifying this list
+        self.meshes: list[Mesh] = self.scene.meshes
+        # clips triangles into its own (reused) buffers
+        self.clipper: Clipper = Clipper(dtype=self.__dtype)
+        # pipelined rendering state: clippers used in turn (so the geometry being drawn, which views a clipper's
+        #   buffers, isn't overwritten by the next frame's), worker thread (created when needed),
+        #   and the geometry being processed on it
+        self.__clippers: tuple = (self.clipper, Clipper(dtype=self.__dtype))
+        self.__worker: ThreadPoolExecutor = None
+        self.__pending: Future = None
+        # occlusion culling state: depth pyramid (rebuilt when needed), which instances were visible
+        #   last frame, and geometry rejected by occlusion culling (only kept by verify_occlusion)
+        self.__pyramid: DepthPyramid = DepthPyramid()
+        self.__visible: np.ndarray = np.empty(0, dtype=np.bool_)
+        self.__rejected: list = None
+        # level of detail each mesh was drawn with last frame, and index of the data each mesh is drawn with
+        self.__levels: np.ndarray = np.empty(0, dtype=np.int64)
+        self.__draw_data: np.ndarray = np.empty(0, dtype=np.int64)
+
+        self.frame_count: int = 0
+        # functions called with the FrameStats of every rendered frame
+        self.stats_callbacks: list = []
 
     def add_mesh(self, mesh: Mesh) -> None:
-        # function may not have purpose
-        self.meshes.append(mesh)
-
-    def render_all(self) -> None:
+        self.__wait_geometry()
+        self.scene.add(mesh)
+
+    def remove_mesh(self, mesh: Mesh) -> None:
+        self.__wait_geometry()
+        self.scene.remove(mesh)
+
+    def update_mesh(self, mesh: Mesh) -> None:
+        "Must be called after a mesh's triangles, uvs or textures were modified in place (moving a mesh is detected automatically)"
+        self.__wait_geometry()
+        self.scene.update(mesh)
+
+    def add_stats_callback(self, callback) -> None:
+        "Register a function to be called with the FrameStats of each frame (see frame_stats.py)"
+        self.stats_callbacks.append(callback)
+
+    def remove_stats_callback(self, callback) -> None:
+        self.stats_callbacks.remove(callback)
+
+    def ray_cast(self, origin, direction, max_distance: float = np.inf) -> list:
+        "Meshes whose bounding box is hit by a ray, nearest first, as (distance, mesh) (see SceneStore.ray_cast)"
+        self.__wait_geometry()
+        self.scene.sync()
+        return self.scene.ray_cast(origin, direction, max_distance)
+
+    def query_region(self, lo, hi) -> list:
+        "Meshes whose bounding box overlaps the box from lo to hi"
+        self.__wait_geometry()
+        self.scene.sync()
+        return self.scene.query_region(lo, hi)
+
+    def render_all(self, stats: FrameStats = None) -> None:
         """
         Render all meshes the renderer owns, clearing screen in the process.\n
-        Note that this will directly update the surface owned by renderer
+        Note that this will directly update the surface owned by renderer\n
+        stats : FrameStats, optional
+            if provided, filled with statistics of the frame.
+            If stats callbacks are registered, a FrameStats is created when not provided
         """
-
-        # convert screen to numpy array for easier pixel manipulation
-        #    also clears screen
-        #    also scale down to account for pix_size
-        surface = np.full(
-            (self.__WIDTH//self.pix_size, self.__HEIGHT//self.pix_size, 3), 
-            fill_value=(120, 170, 210), # Background RGB
-            dtype=np.uint8
-        )
-        
-        # clear z buffer
-        self.z_buffer = np.full(
-            (self.__WIDTH//self.pix_size, self.__HEIGHT//self.pix_size),
-            self.__MAX_Z,
-            dtype=np.double
-        )
-        # flatten all meshes into array of tris
-        triangles = np.asarray([tri for mesh in self.meshes for tri in self.cam.transform_about_cam(mesh)], dtype=np.double)
-        
-        # same process with corresponding uv coords and texture keys
-        uv_coords = np.asarray([uv_tri for mesh in self.meshes for uv_tri in mesh.uv_mesh], dtype=np.double)
-        textures = np.asarray([key for mesh in self.meshes for key in mesh.textures], dtype=np.uint16)
-
-        # array of bools, indicating whether the corresponding face should be culled
-        culled_faces = np.full((len(triangles)), False, np.bool8)
-
-        triangles, uv_coords, textures, culled_faces = self.__get_clipped(
-                triangles, uv_coords, textures, culled_faces, self.__CLIPPING_PLANES,
-        )
-        
-        self.__get_backfaces(triangles, culled_faces)
-        self.__project_triangles(triangles, self.__PROJ)
-
-        #numrendered = 0 #
-        for index, tri in enumerate(triangles):
-            if culled_faces[index]: continue
-
-            self.__draw_triangle(
-                surface,
-                self.z_buffer,
-                tri,
-                global_texture_atlas[textures[index].item()], #use .item() to force np uint to native int
-                uv_coords[index]
-            )
+        if (stats is None) and (self.stats_callbacks):
+            stats = FrameStats()
+        if (stats is not None):
+            stats.frame = self.frame_count
+            stats.start_memory()
+        self.frame_count += 1
+
+        frame_start = lap = time.perf_counter()
+
+        # (pipelined) geometry processed since last call, the worker must be done before the scene is synced
+        previous = None
+        if (self.__pending is not None):
+            previous = self.__pending.result()
+            self.__pending = None
+            lap = self.__record(stats, 'wait', lap)
+
+        # clear screen and z buffer (in place, the same buffers are drawn into every frame)
+        #    surface is a view of the low res frame's pixels, so drawing into it draws into the frame
+        if (self.z_buffer.shape != (self.__WIDTH//self.pix_size, self.__HEIGHT//self.pix_size)):
+            self.__allocate_buffers() # pix_size changed
+        surface = self.__pixels
+        self.__frame.fill(self.__BACKGROUND) # (much faster than filling the view, whose pixels aren't contiguous)
+        self.z_buffer.fill(self.__MAX_Z)
+        # bring scene arrays up to date (reads positions of meshes that moved)
+        self.scene.sync()
+        lap = self.__record(stats, 'sync', lap)
+
+        # transform every mesh to clip space, and flatten all meshes into array of tris
+        #   (also returns corresponding uv coords and texture keys)
+        #   view and projection matrix are combined, so each vertex is only multiplied once
+        view_proj = self.cam.view_matrix @ self.__PROJ
+
+        # triangles entirely outside culling planes are removed, triangles crossing clipping planes are clipped
+        culling_planes = np.concatenate((self.__FAR_PLANE, self.__screen_planes()))
+        clipping_planes = np.concatenate((self.__CLIPPING_PLANES, self.__screen_planes(self.__GUARD_BAND)))
+
+        if (self.occlusion):
+            instance_state, lap = self.__cull(view_proj, culling_planes, stats, lap)
+            drawn, lap = self.__draw_occlusion_culled(surface, view_proj, instance_state, clipping_planes, culling_planes, stats, lap)
+        elif (self.pipelined):
+            # this frame's geometry (cam and scene as of now) is processed on the worker while the previous frame is drawn
+            if (previous is None): # first frame, nothing to draw yet
+                previous = self.__submit_geometry(view_proj, clipping_planes, culling_planes, stats is not None).result()
+            self.__pending = self.__submit_geometry(view_proj, clipping_planes, culling_planes, stats is not None)
+            geometry, geometry_stats = previous
+            # (no geometry stats if the previous call didn't collect any)
+            if (stats is not None) and (geometry_stats is not None):
+                stats.add(geometry_stats)
+            lap = self.__rasterize(surface, *geometry, stats, lap)
+            drawn = [geometry]
+        else:
+            instance_state, lap = self.__cull(view_proj, culling_planes, stats, lap)
+            geometry, lap = self.__geometry(view_proj, instance_state, clipping_planes, culling_planes, self.clipper, stats, lap)
+            lap = self.__rasterize(surface, *geometry, stats, lap)
+            drawn = [geometry]
+        if (stats is not None):
+            stats.pixels_covered = np.count_nonzero(self.z_buffer < self.__MAX_Z)
 
         # wireframe rendering
         if (self.debug):
-            for index, tri in enumerate(triangles):
-                if culled_faces[index]: continue
+            for triangles, _, _, culled_faces in drawn:
+                raster.wireframe_all(surface, triangles, culled_faces)
+            lap = self.__record(stats, 'wireframe', lap)
 
-                self.__draw_wireframe(
-                    surface,
-                    tri,
-                )
-       
-
-        surf = pygame.surfarray.make_surface(surface)
-        
         # legacy wireframe
        # if (self.debug):
        #     # wireframe mesh
@@ -144,339 +326,460 @@ class Renderer3D:
        #         pygame.draw.line(surf, (255,255,255), scoords(tri[1]), scoords(tri[2]), width=1)
        #         pygame.draw.line(surf, (255,255,255), scoords(tri[2]), scoords(tri[0]), width=1)
 
-        # scale back to surface size
-        surf = pygame.transform.scale(surf, (self.__WIDTH, self.__HEIGHT))
-        
-        self.surface.blit(surf, (0, 0)) 
-        # print(numrendered) #
+        # scale back to surface size (straight from the frame into surface, no copies in between,
+        #   unless surface's format can't be viewed as rgb values, see __allocate_buffers)
+        if (self.__scaled is None):
+            pygame.transform.scale(self.__frame, (self.__WIDTH, self.__HEIGHT), self.surface)
+        else:
+            pygame.transform.scale(self.__frame, (self.__WIDTH, self.__HEIGHT), self.__scaled)
+            self.surface.blit(self.__scaled, (0, 0))
+        lap = self.__record(stats, 'present', lap)
+
+        if (stats is not None):
+            stats.frame_time = lap - frame_start
+            stats.stop_memory()
+            for callback in self.stats_callbacks:
+                callback(stats)
+
+    def verify_occlusion(self) -> int:
+        """
+        Check that occlusion culling is conservative (only rejects geometry which is surely hidden),
+        for the current view.\n
+        Renders a frame with occlusion culling, keeping everything it rejected, then a full frame
+        without it, and draws the rejected geometry against the full frame's depth.\n
+        Returns the amount of pixels of rejected geometry that would have been visible (0 if conservative).
+        Leaves the full frame on the surface
+        """
+        enabled = self.occlusion
+        self.occlusion = True
+        self.__rejected = []
+        try:
+            self.render_all()
+            rejected = self.__rejected
+        finally:
+            self.__rejected = None
+        self.occlusion = False
+        try:
+            self.render_all()
+        finally:
+            self.occlusion = enabled
+
+        # anything passing the z test (equal depths pass) is nearer than what the full frame drew there
+        z_buffer = np.nextafter(self.z_buffer, -np.inf)
+        surface = np.empty((*z_buffer.shape, 3), dtype=np.uint8)
+        visible = 0
+        for triangles, uv_coords, textures, culled_faces in rejected:
+            visible += raster.rasterize_all(
+                surface, z_buffer, triangles, uv_coords, textures, culled_faces,
+                global_texture_atlas.pixels, self.__texture_table(),
+            )[1]
+        return visible
+
+    def warmup(self) -> float:
+        """
+        Compile every kernel the renderer uses up front (numba compiles a kernel on its first call),
+        so the first frame doesn't stall. Compiled kernels are cached on disk (see build_kernels.py),
+        so once cached, this only loads them.\n
+        A tiny scene is rendered by throwaway renderers (on a small surface in the same format as surface),
+        through every code path: plain and tiled rasterization, draw orders, occlusion culling (and its
+        verification), wireframe, ray casts and region queries. This renderer is left untouched.\n
+        Returns seconds taken
+        """
+        start = time.perf_counter()
+        surface = pygame.Surface((32, 32), 0, self.surface)
+
+        # a tetrahedron in front of cam (some faces face away), a copy outside the view,
+        #   and a large triangle crossing the near plane and the guard band (so it gets clipped)
+        tetra = MeshData.from_indexed(
+            ((-1, -1, -1), (1, -1, 1), (-1, 1, 1), (1, 1, -1)),
+            ((0, 1, 2), (0, 3, 1), (0, 2, 3), (1, 3, 2)),
+        )
+        meshes = (
+            Mesh.from_data(tetra, (0, 0, 5)),
+            Mesh.from_data(tetra, (500, 0, 5)),
+            Mesh(((-50, -50, 3), (50, -50, 3), (0, 50, -1))),
+        )
+
+        for options in (
+            {'debug': True},
+            {'tile_size': 8, 'mipmaps': False},
+            {'draw_order': 'mesh'},
+            {'draw_order': 'triangle', 'lod_size': 20},
+            {'occlusion': True, 'occlusion_triangles': True},
+        ):
+            renderer = Renderer3D(surface, Camera(), precision=self.precision, **options)
+            for mesh in meshes:
+                renderer.add_mesh(mesh)
+            renderer.render_all(FrameStats())
+        renderer.verify_occlusion()
+        renderer.ray_cast((0, 0, 0), (0, 0, 1))
+        renderer.query_region((-1, -1, -1), (1, 1, 1))
+        renderer.remove_mesh(meshes[0])
+
+        return time.perf_counter() - start
+
+    def __cull(self, view_proj, culling_planes, stats, lap) -> tuple:
+        """Frustum cull meshes and pick their levels of detail.\n
+        Returns (state of every instance (see AABBTree.frustum), time of the last lap)"""
+        # test every mesh's bounding box against the view frustum first (by walking the scene's tree):
+        #   meshes entirely outside are skipped, meshes entirely inside don't need clipping or culling
+        # planes are moved to world space: a world point p is outside if [p, 1] @ view_proj @ normal > e
+        world_planes = np.concatenate((self.__CLIPPING_PLANES, culling_planes))
+        world_planes[:, :4] = world_planes[:, :4] @ view_proj.T
+        instance_state = self.scene.tree.frustum(world_planes, len(self.meshes))
+        lap = self.__record(stats, 'cull', lap)
+
+        # data each mesh is drawn with (its level of detail)
+        if (self.lod_size):
+            self.__select_lods(view_proj)
+            self.__draw_data = self.scene.lod_table[self.scene.instance_data, self.__levels]
+            lap = self.__record(stats, 'lod', lap)
+        else:
+            self.__draw_data = self.scene.instance_data
+
+        if (stats is not None):
+            tri_counts = self.scene.data_offsets[self.__draw_data, 2, 1]
+            stats.meshes_culled = np.count_nonzero(instance_state == bvh.OUTSIDE)
+            stats.triangles_submitted = int(self.scene.data_offsets[self.scene.instance_data, 2, 1].sum())
+            stats.triangles_simplified = stats.triangles_submitted - int(tri_counts.sum())
+            # triangles of culled meshes (triangles culled by the clipper are added when drawing)
+            stats.triangles_clipped = int(tri_counts[instance_state == bvh.OUTSIDE].sum())
+
+        return instance_state, lap
+
+    def __submit_geometry(self, view_proj, clipping_planes, culling_planes, collect_stats: bool) -> Future:
+        """Cull and process a frame's geometry on the worker thread (pipelined rendering).\n
+        The future's result is (geometry (see __geometry), FrameStats of the work done, or None if not collecting stats)"""
+        if (self.__worker is None):
+            self.__worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geometry')
+        # the next clipper, so the buffers of the geometry submitted before are left alone
+        self.__clippers = self.__clippers[::-1]
+        clipper = self.__clippers[0]
+        stats = FrameStats() if (collect_stats) else None
+
+        def process() -> tuple:
+            lap = time.perf_counter()
+            instance_state, lap = self.__cull(view_proj, culling_planes, stats, lap)
+            return self.__geometry(view_proj, instance_state, clipping_planes, culling_planes, clipper, stats, lap)[0], stats
+        return self.__worker.submit(process)
+
+    def __wait_geometry(self) -> None:
+        "Wait for the worker to finish processing geometry (it reads the scene, which mustn't change meanwhile)"
+        if (self.__pending is not None):
+            self.__pending.result()
+
+    def __geometry(self, view_proj, instance_state, clipping_planes, culling_planes, clipper, stats, lap) -> tuple:
+        """Transform, clip, backface cull and project the triangles of instances not culled (state != OUTSIDE).\n
+        Returns (triangles, uv_coords, textures, culled_faces), and the time of the last lap"""
+        triangles, uv_coords, textures, needs_clip = self.__transform_instances(
+            self.scene.vertices, self.scene.uvs,
+            self.scene.indices, self.scene.uv_indices, self.scene.textures,
+            self.scene.data_offsets, self.__draw_data, self.scene.positions,
+            view_proj.astype(self.__dtype), instance_state,
+        )
+        lap = self.__record(stats, 'transform', lap)
+
+        transformed = len(triangles)
+
+        # clip triangles (uvs are interpolated), triangles outside the frustum are removed
+        #   sources maps each output triangle back to the triangle it came from
+        triangles, uv_coords, sources, culled = clipper.clip(
+            triangles, uv_coords, needs_clip, clipping_planes, culling_planes,
+        )
+        lap = self.__record(stats, 'clip', lap)
+
+        textures = textures[sources]
+        # array of bools, indicating whether the corresponding face should be culled
+        culled_faces = np.full((len(triangles)), False, np.bool8)
+        lap = self.__record(stats, 'gather', lap)
+        if (stats is not None):
+            stats.triangles_split += len(triangles) - (transformed - culled)
+            stats.triangles_clipped += culled
+
+        self.__get_backfaces(triangles, culled_faces)
+        lap = self.__record(stats, 'backface', lap)
+        if (stats is not None):
+            backfaces = np.count_nonzero(culled_faces)
+            stats.triangles_backface += backfaces
+            stats.triangles_rasterized += len(triangles) - backfaces
+
+        triangles = self.__project_triangles(triangles)
+        lap = self.__record(stats, 'project', lap)
+
+        if (self.draw_order != 'none'):
+            if (self.draw_order == 'mesh'):
+                depths = self.__instance_depths(view_proj, instance_state)[sources]
+            else:
+                depths = triangles[:, :, 2].min(axis=1)
+            # order only holds triangles which aren't culled
+            order = raster.depth_order(depths, culled_faces, self.__DEPTH_BITS)
+            triangles, uv_coords, textures = triangles[order], uv_coords[order], textures[order]
+            culled_faces = np.zeros(len(order), dtype=np.bool_)
+            lap = self.__record(stats, 'sort', lap)
+
+        return (triangles, uv_coords, textures, culled_faces), lap
+
+    def __instance_depths(self, view_proj, instance_state) -> np.ndarray:
+        """Depth (distance in front of cam) of the nearest point of each visible instance's bounding sphere,
+        repeated for each of its triangles (in the order __transform_instances outputs them)"""
+        visible = instance_state != bvh.OUTSIDE
+        centers, radii = self.__bounding_spheres(visible)
+        # w of clip space is the distance in front of cam
+        depths = centers @ view_proj[:3, 3] + view_proj[3, 3] - radii
+        return np.repeat(depths, self.scene.data_offsets[self.__draw_data[visible], 2, 1])
+
+    def __bounding_spheres(self, selection = slice(None)) -> tuple:
+        "(centers, radii) of spheres around the bounding boxes of (selected) meshes, in world space"
+        bounds = self.scene.bounds[self.scene.instance_data[selection]]
+        centers = bounds.mean(axis=1) + self.scene.positions[selection]
+        radii = np.linalg.norm(bounds[:, 1] - bounds[:, 0], axis=1)/2
+        return centers, radii
+
+    def __select_lods(self, view_proj) -> None:
+        "Pick the level of detail of every mesh from its projected size (see lod_size)"
+        centers, radii = self.__bounding_spheres()
+        depths = np.maximum(centers @ view_proj[:3, 3] + view_proj[3, 3], -self.__CLIPPING_PLANES[0, 4])
+        # projected x, y are low res pixels times w (see __screen_planes), y is scaled by FOV_RAD
+        sizes = 2*radii*self.__FOV_RAD/depths
+
+        # every level has about half the triangles of the previous:
+        #   go one level further each time the projected area halves
+        target = 2*np.log2(self.lod_size/np.maximum(sizes, 1e-9))
+        if (len(self.__levels) != len(target)):
+            self.__levels = np.clip(np.floor(target), 0, SceneStore.MAX_LODS - 1).astype(np.int64)
+
+        # hysteresis: only switch once the target is a margin past the current level's range,
+        #   so meshes at the boundary between levels don't pop back and forth
+        switch = (target < self.__levels - self.__LOD_HYSTERESIS) | (target >= self.__levels + 1 + self.__LOD_HYSTERESIS)
+        self.__levels[switch] = np.clip(np.floor(target[switch]), 0, SceneStore.MAX_LODS - 1)
+
+    def __rasterize(self, surface, triangles, uv_coords, textures, culled_faces, stats, lap) -> float:
+        "Draw projected triangles into surface and z_buffer, returns time of the last lap"
+        # textures are sampled from the atlas' packed buffer by index
+        tex_pixels, tex_table = global_texture_atlas.pixels, self.__texture_table()
+
+        if (self.tile_size):
+            # bin triangles into tiles, and draw tiles in parallel
+            if (self.threads):
+                numba.set_num_threads(self.threads)
+            tile_starts, tile_tris = raster.bin_triangles(
+                triangles, culled_faces, surface.shape[0], surface.shape[1], self.tile_size,
+            )
+            pixels_tested, pixels_written = raster.rasterize_tiled(
+                surface, self.z_buffer, triangles, uv_coords, textures, tex_pixels, tex_table,
+                tile_starts, tile_tris, self.tile_size,
+            )
+        else:
+            # all triangles are drawn in one compiled call
+            pixels_tested, pixels_written = raster.rasterize_all(
+                surface, self.z_buffer, triangles, uv_coords, textures, culled_faces, tex_pixels, tex_table,
+            )
+        lap = self.__record(stats, 'raster', lap)
+        if (stats is not None):
+            stats.pixels_tested += pixels_tested
+            stats.pixels_written += pixels_written
+        return lap
+
+    def __draw_occlusion_culled(self, surface, view_proj, instance_state, clipping_planes, culling_planes, stats, lap) -> tuple:
+        """
+        Draw instances in two passes, skipping the ones hidden behind what's already drawn (see occlusion.py):
+            1. instances which were visible last frame are drawn (they most likely still are, and fill the z_buffer)
+            2. a depth pyramid is built from the z_buffer, the remaining instances (and optionally,
+               their triangles) are tested against it, and only the ones that may be visible are drawn
+        Last frame's depth only decides the order: every instance either gets drawn,
+        or is tested against this frame's depth, so nothing visible is dropped when the cam moves.\n
+        Returns list of geometry drawn (see __geometry), and the time of the last lap
+        """
+        near = -self.__CLIPPING_PLANES[0, 4]
+        # (levels of detail are inside the bounds of the data they simplify)
+        scene_args = (self.scene.bounds, self.scene.instance_data, self.scene.positions, view_proj)
+
+        # pass 1 (every instance is assumed visible when meshes were added or removed)
+        if (len(self.__visible) != len(instance_state)):
+            self.__visible = np.ones(len(instance_state), dtype=np.bool_)
+        first = np.where(self.__visible, instance_state, bvh.OUTSIDE).astype(np.int8)
+        first_geometry, lap = self.__geometry(view_proj, first, clipping_planes, culling_planes, self.clipper, stats, lap)
+        lap = self.__rasterize(surface, *first_geometry, stats, lap)
+
+        # pass 2
+        self.__pyramid.build(self.z_buffer)
+        rest = np.where(self.__visible, bvh.OUTSIDE, instance_state).astype(np.int8)
+        occluded = occlusion.occluded_instances(*scene_args, rest, near, self.__pyramid.texels, self.__pyramid.table)
+        if (self.__rejected is not None):
+            hidden = np.where(occluded, rest, bvh.OUTSIDE).astype(np.int8)
+            # (uvs are copied, they are a view of the clipper's buffers)
+            triangles, uv_coords, textures, culled_faces = self.__geometry(view_proj, hidden, clipping_planes, culling_planes, self.clipper, None, lap)[0]
+            self.__rejected.append((triangles, uv_coords.copy(), textures, culled_faces))
+        rest[occluded] = bvh.OUTSIDE
+        lap = self.__record(stats, 'occlusion', lap)
+        if (stats is not None):
+            stats.meshes_occluded = np.count_nonzero(occluded)
+            stats.triangles_occluded = int(self.scene.data_offsets[self.__draw_data[occluded], 2, 1].sum())
+
+        geometry, lap = self.__geometry(view_proj, rest, clipping_planes, culling_planes, self.clipper, stats, lap)
+        if (self.occlusion_triangles):
+            triangles, uv_coords, textures, culled_faces = geometry
+            not_hidden = ~culled_faces
+            hidden_count = occlusion.occluded_triangles(triangles, culled_faces, self.__pyramid.texels, self.__pyramid.table)
+            if (self.__rejected is not None):
+                self.__rejected.append((triangles, uv_coords.copy(), textures, ~(culled_faces & not_hidden)))
+            lap = self.__record(stats, 'occlusion', lap)
+            if (stats is not None):
+                stats.triangles_occluded += hidden_count
+                stats.triangles_rasterized -= hidden_count
+        lap = self.__rasterize(surface, *geometry, stats, lap)
+
+        # instances visible at the end of the frame are drawn first next frame
+        self.__pyramid.build(self.z_buffer)
+        self.__visible = (instance_state != bvh.OUTSIDE) & ~occlusion.occluded_instances(
+            *scene_args, instance_state, near, self.__pyramid.texels, self.__pyramid.table,
+        )
+        lap = self.__record(stats, 'occlusion', lap)
+        return [first_geometry, geometry], lap
+
+    def __allocate_buffers(self) -> None:
+        """Create the frame buffers, scaled down to account for pix_size:
+            z_buffer: depth of every pixel
+            __frame:  surface drawn into, in the same format as surface (so it can be scaled straight into it)
+            __pixels: (width, height, 3) view of frame's rgb values (not a copy), the rasterizer writes into it
+            __scaled: None, unless surface is 8 or 16 bit (which can't be viewed as rgb values): frame is then 32 bit,
+                      and scaled into this (full size, same format as frame) before being blitted onto surface
+        The view keeps frame locked for as long as the renderer lives (scaling works on locked surfaces, blitting doesn't)"""
+        size = (self.__WIDTH//self.pix_size, self.__HEIGHT//self.pix_size)
+        self.z_buffer = np.full(size, self.__MAX_Z, dtype=self.__dtype)
+        if (self.surface.get_bitsize() in (24, 32)):
+            self.__frame = pygame.Surface(size, 0, self.surface)
+            self.__scaled = None
+        else:
+            self.__frame = pygame.Surface(size, 0, 32)
+            self.__scaled = pygame.Surface((self.__WIDTH, self.__HEIGHT), 0, self.__frame)
+        self.__pixels = pygame.surfarray.pixels3d(self.__frame)
+
+    def __texture_table(self) -> np.ndarray:
+        "Table of the atlas' texture levels to sample from (only full resolution levels if mipmapping is off)"
+        if (self.mipmaps):
+            return global_texture_atlas.table
+        # (levels past the table's end are clamped to its last)
+        return np.ascontiguousarray(global_texture_atlas.table[:, :1])
+
+    @staticmethod
+    def __record(stats: FrameStats, stage: str, start: float) -> float:
+        "Add time elapsed since start to the stage's time (if stats are being collected), returns current time"
+        now = time.perf_counter()
+        if (stats is not None):
+            stats.stage_times[stage] = stats.stage_times.get(stage, 0.0) + now - start
+        return now
+
+    def __screen_planes(self, scale: float = 1) -> np.ndarray:
+        """The planes through the edges of the (low res) screen, scaled by `scale` (around its center).\n
+        Projected x, y are low res pixels (centered on screen), so a point is on screen if
+        |x/w| <= half width (and |y/w| <= half height). Since x = x_view*ASPECT_RATIO*FOV_RAD, 
+        this is the horizontal field of view given by __PROJ (and likewise for y)"""
+        # +1 to account for rounding to pixels
+        half_width = (self.__WIDTH//self.pix_size/2 + 1)*scale
+        half_height = (self.__HEIGHT//self.pix_size/2 + 1)*scale
+        return np.asarray((
+            ( 1,  0, 0, -half_width , 0), # right  (x > w*half_width)
+            (-1,  0, 0, -half_width , 0), # left   (x < -w*half_width)
+            ( 0,  1, 0, -half_height, 0), # top
+            ( 0, -1, 0, -half_height, 0), # bottom
+        ), dtype=np.double)
 
     # njit increases performance ten-fold 
     #   but doesn't work well with the 'self' argument 
     # Therefore, use staticmethods
     @staticmethod
-    @numba.njit
+    @numba.njit(nogil=True, cache=True)
+    def __transform_instances(
+        vertices, uvs, indices, uv_indices, textures,   # buffers of all mesh data (see SceneStore)
+        data_offsets,                                   # ranges of each data in buffers
+        instance_data, positions,                       # data and position of each mesh
+        view_proj,                                      # matrix from world to clip space
+        instance_state,                                 # result of AABBTree.frustum (per instance)
+    ) -> tuple:
+        """
+        Transform every visible instance's vertexes (once per vertex) and expand them into triangles.\n
+        Returns new arrays of clip space triangles, their uvs, texture keys, 
+        and whether they need clipping (their instance intersects the frustum)\n
+        Triangles (and uvs) are of view_proj's dtype
+        """
+        num_tris = 0
+        max_vertices = 0
+        for inst, data in enumerate(instance_data):
+            if (instance_state[inst] == 0): continue
+            num_tris += data_offsets[data, 2, 1]
+            max_vertices = max(max_vertices, data_offsets[data, 0, 1])
+
+        tris = np.empty((num_tris, 3, 4), dtype=view_proj.dtype)
+        tri_uvs = np.empty((num_tris, 3, 2), dtype=view_proj.dtype)
+        tri_texs = np.empty((num_tris,), dtype=np.uint16)
+        needs_clip = np.empty((num_tris,), dtype=np.bool_)
+
+        # transformed vertexes of current instance
+        transformed = np.empty((max_vertices, 4), dtype=view_proj.dtype)
+
+        out = 0
+        for inst, data in enumerate(instance_data):
+            if (instance_state[inst] == 0): continue
+            vtx_start, vtx_count = data_offsets[data, 0]
+            uv_start = data_offsets[data, 1, 0]
+            tri_start, tri_count = data_offsets[data, 2]
+
+            for vtx in range(vtx_count):
+                # move to world space (by mesh position)
+                x = vertices[vtx_start + vtx, 0] + positions[inst, 0]
+                y = vertices[vtx_start + vtx, 1] + positions[inst, 1]
+                z = vertices[vtx_start + vtx, 2] + positions[inst, 2]
+
+                # [x, y, z, 1] @ view_proj
+                for col in range(4):
+                    transformed[vtx, col] = x*view_proj[0, col] + y*view_proj[1, col] + z*view_proj[2, col] + view_proj[3, col]
+
+            for tri in range(tri_start, tri_start + tri_count):
+                for pnt in range(3):
+                    tris[out, pnt] = transformed[indices[tri, pnt]]
+                    tri_uvs[out, pnt] = uvs[uv_start + uv_indices[tri, pnt]]
+                tri_texs[out] = textures[tri]
+                needs_clip[out] = instance_state[inst] == 1
+                out += 1
+
+        return tris, tri_uvs, tri_texs, needs_clip
+
+    @staticmethod
+    @numba.njit(nogil=True, cache=True)
     def __get_backfaces(faces: np.ndarray, culled_buffer: np.ndarray) -> None:
-        """Determine if a face is a backface. Write results into provided buffer
+        """Determine if a face (in clip space) is a backface. Write results into provided buffer
         Note: winding order of faces must be CCW."""
         # credits to http://www.dgp.toronto.edu/~karan/courses/csc418/fall_2002/notes/cull.html
+        # the face is a backface if its normal faces away from cam:
+        #   dot(cross(p1-p0, p2-p0), p0) < 0, which simplifies to det(p0, p1, p2) < 0.
+        # x, y and w of clip space are just scaled x, y and z of the cam's view,
+        #   which doesn't change the sign of the determinant
 
         for index, tri in enumerate(faces):
-            normal = np.cross(tri[1]-tri[0], tri[2]-tri[0])
-            
-            if (not culled_buffer[index]):
-                culled_buffer[index] = np.sum(normal*tri[0]) < 0
+            if (culled_buffer[index]): continue
 
-    @staticmethod
-    @numba.njit
-    def __get_clipped(tris, uvs, texs, culled_faces, planes) -> tuple:
-        """
-        Clip triangles against given plane. \n
-        Args:
-            tris         : triangles to be clipped
-            uvs          : tris corresponding uv coords
-            texs         : tris corresponding textures
-            culled_faces : array of bool, denoting whether corresponding face is culled
-                provide tris length array filled with false if none are culled
-            plane        : array representing a plane, denoted by 3 points (order matters)
-        Returns: 
-            tuple:
-                A tuple of results, element 1 being the new array of tris, 2 new uvs, etc.
-                Note that original arrays are scrambled as a side-effect (incorrect) 
-        """
-        # triangle clipping sometimes results in a triangle becoming a quadrilateral
-        #   ex:
-        #        clipping across this line results in quadrilateral
-        #  * - _ |        * - _ |      * - _     
-        #   *    | *  -->  *    |  -->  * 1 /|   Since the renderer only handles triangles,
-        #    *   |*         *   |        * /2|   this quad must be split into two tris
-        #     *_-|           *_-|         *_-*
-        # one triangle will replace the original, 
-        # but the other must be appended to end of array
-        # these overflow tris are accumulated and eventually appended
-
-        # https://www.quora.com/Given-a-point-and-a-plane-how-would-you-determine-which-side-of-the-plane-the-point-lies
-        # https://gabrielgambetta.com/computer-graphics-from-scratch/11-clipping.html
-        for plane in planes:
-            # where overflow data is stored to later be appended
-            tri_over = []
-            uvs_over = []
-            tex_over = []
-            cul_over = []
-
-            normal = np.cross(plane[1]-plane[0], plane[2]-plane[0])
-            d = np.sum(normal*plane[0])
-
-            for tri_idx, tri in enumerate(tris):
-                if culled_faces[tri_idx]: continue
-
-                # filter points in tri (for ones that are outside of plane)
-                cul_pnts = np.argwhere(np.dot(tri, normal) > d)
-                # four cases for each tri:
-                if (len(cul_pnts) == 0): # no points out of bound (do nothing)
-                    continue
-
-                elif (len(cul_pnts) == 1): # this case leads to quadrilateral (2 tris)
-                    new_pnts = []
-                    new_uvs = []
-
-                    unculled = [pnt for pnt in (0, 1, 2) if pnt not in cul_pnts]
-                    p1 = tri[cul_pnts[0]][0]
-                    for pnt_idx in unculled:
-                        p2 = tri[pnt_idx]
-
-                        t = (np.dot(normal, plane[0]-p2) / np.dot(normal, p1-p2))
-                        new_pnts.append(p2 + t*(p1-p2))
-                        new_uvs.append(uvs[tri_idx][pnt_idx] - t*(uvs[tri_idx][pnt_idx]-uvs[tri_idx][cul_pnts[0]]))
-
-                    # modify original tri
-                    tris[tri_idx][cul_pnts[0]] = new_pnts[0]
-                    uvs[tri_idx][cul_pnts[0]] = new_uvs[0]
-
-                    # preserve winding order
-                    order = (0, 1)
-                    if (cul_pnts[0] == 1):
-                        order = order[::-1]
-
-                    new_tri = (
-                        (new_pnts[order[0]][0],new_pnts[order[0]][1],new_pnts[order[0]][2]), 
-                        (tri[unculled[-1]][0], tri[unculled[-1]][1],tri[unculled[-1]][2]),
-                        (new_pnts[order[1]][0],new_pnts[order[1]][1],new_pnts[order[1]][2]), 
-                    )
-                    new_uv = (
-                        (new_uvs[order[0]][0][0],new_uvs[order[0]][0][1]), 
-                        (uvs[tri_idx][unculled[-1]][0], uvs[tri_idx][unculled[-1]][1]),
-                        (new_uvs[order[1]][0][0],new_uvs[order[1]][0][1]), 
-                    )
-                    # append new tri
-                    tri_over.append(new_tri)
-                    uvs_over.append(new_uv)                    
-                    tex_over.append(texs[tri_idx])
-                    cul_over.append(False)
-
-
-                elif (len(cul_pnts) == 2): # only original needs to be replaced
-                    unculled = [pnt for pnt in (0, 1, 2) if pnt not in cul_pnts][0] 
-                    p1 = tri[unculled]
-                    for pnt_idx in cul_pnts:
-                        p2 = tri[pnt_idx][0]
-
-                        # code adapted from https://stackoverflow.com/questions/4938332/line-plane-intersection-based-on-points
-                        t = (np.dot(normal, plane[0]-p1) / np.dot(normal, p2-p1))
-                        new_pnt = p1 + t*(p2 - p1)
-                        tris[tri_idx][pnt_idx] = new_pnt
-
-                        new_uv = uvs[tri_idx][unculled] - t*(uvs[tri_idx][unculled]-uvs[tri_idx][pnt_idx])
-                        uvs[tri_idx][pnt_idx] = new_uv
-
-                else: # all points out of bound (cull)
-                    culled_faces[tri_idx] = True
-
-            if (tri_over): # append if there is overflow
-                tris, uvs, texs, culled_faces = (
-                    np.concatenate((tris        , np.asarray(tri_over, dtype=np.double))),
-                    np.concatenate((uvs         , np.asarray(uvs_over, dtype=np.double))),
-                    np.concatenate((texs        , np.asarray(tex_over, dtype=np.uint16))),
-                    np.concatenate((culled_faces, np.asarray(cul_over, dtype=np.bool8 ))),
-                )
-
-        return (tris, uvs, texs, culled_faces)
-                
-    @staticmethod
-    @numba.njit
-    def __project_triangles(tris, proj_mat) -> None:
-        
-        for tri_idx, tri in enumerate(tris):
-            for pnt_idx, point in enumerate(tri):
+            (x0, y0, _, w0), (x1, y1, _, w1), (x2, y2, _, w2) = tri
+            culled_buffer[index] = (
+                x0*(y1*w2 - w1*y2) - y0*(x1*w2 - w1*x2) + w0*(x1*y2 - y1*x2)
+            ) < 0
 
-                # output = [
-                #     mat1[0]*mat2[0][0] + mat1[1]*mat2[1][0] + mat1[2]*mat2[2][0] + mat2[3][0],
-                #     mat1[0]*mat2[0][1] + mat1[1]*mat2[1][1] + mat1[2]*mat2[2][1] + mat2[3][1],
-                #     mat1[0]*mat2[0][2] + mat1[1]*mat2[1][2] + mat1[2]*mat2[2][2] + mat2[3][2],
-                # ] #this is equivalent np.dot
+    @staticmethod
+    @numba.njit(nogil=True, cache=True)
+    def __project_triangles(tris) -> np.ndarray:
+        """Perspective divide of clip space triangles, returns new array of (x, y, z) points.\n
+        z is kept as is (used for depth), points are of the same dtype as tris"""
+        projected = np.empty((len(tris), 3, 3), dtype=tris.dtype)
 
-                # note that dot product must be with two similarly shaped arrays, hence the addition of 1
-                output = np.dot(np.asarray([*point, 1]), proj_mat) 
-                w = point[0]*proj_mat[0][3] + point[1]*proj_mat[1][3] + point[2]*proj_mat[2][3] + proj_mat[3][3]
+        for tri_idx in range(len(tris)):
+            for pnt_idx in range(3):
+                x, y, z, w = tris[tri_idx, pnt_idx]
 
                 if w:
-                    output[0] /= w; output[1] /= w
+                    x /= w; y /= w
 
-                tris[tri_idx][pnt_idx][0] = output[0]
-                tris[tri_idx][pnt_idx][1] = output[1]
-                tris[tri_idx][pnt_idx][2] = output[2]
+                projected[tri_idx, pnt_idx, 0] = x
+                projected[tri_idx, pnt_idx, 1] = y
+                projected[tri_idx, pnt_idx, 2] = z
 
-    @staticmethod
-    @numba.njit()
-    # A LOT of inspirations from https://github.com/FinFetChannel/SimplePython3DEngine 
-    def __draw_triangle(surfarray, z_buffer, triangle, texture, texture_uv):
-        "njit compiled internal function"
-        # start with perspective correct triangle
-        tex_size = np.asarray([len(texture)-1, len(texture[0])-1])
-        surf_width, surf_height = len(surfarray), len(surfarray[0])
-    
-        # normalize pygame coordinates (pygame has (0,0) in top left corner)
-        centered_tri = np.asarray([(int(point[0]+surf_width//2), int(surf_height//2-point[1]), point[2]) for point in triangle])
-    
-        # sort points of triangle by y value (top to botton)
-        #   note this returns sorted INDEXES to be used later
-        sorted_y = centered_tri[:,1].argsort()
-    
-        x_start, y_start, z_start = centered_tri[sorted_y[0]]
-        x_middle, y_middle, z_middle = centered_tri[sorted_y[1]]
-        x_stop, y_stop, z_stop = centered_tri[sorted_y[2]] 
-    
-        x_slope_1 = (x_stop - x_start)/(y_stop - y_start + 1e-32)
-        x_slope_2 = (x_middle - x_start)/(y_middle - y_start + 1e-32)
-        x_slope_3 = (x_stop - x_middle)/(y_stop - y_middle + 1e-32)  
-        
-    
-        # invert z for interpolation
-        z_start, z_middle, z_stop = 1/(z_start +1e-32), 1/(z_middle + 1e-32), 1/(z_stop +1e-32)
-    
-        z_slope_1 = (z_stop - z_start)/(y_stop - y_start + 1e-32) 
-        z_slope_2 = (z_middle - z_start)/(y_middle - y_start + 1e-32) 
-        z_slope_3 = (z_stop - z_middle)/(y_stop - y_middle + 1e-32)  
-    
-        # uv coordinates multiplied by inverted z to account for perspective
-        uv_start = texture_uv[sorted_y[0]]*z_start 
-        uv_middle = texture_uv[sorted_y[1]]*z_middle
-        uv_stop = texture_uv[sorted_y[2]]*z_stop
-    
-        uv_slope_1 = (uv_stop - uv_start)/(y_stop - y_start + 1e-32)  
-        uv_slope_2 = (uv_middle - uv_start)/(y_middle - y_start + 1e-32)  
-        uv_slope_3 = (uv_stop - uv_middle)/(y_stop - y_middle + 1e-32) 
-
-        # min and max used to cut off rows not in screen
-        for y in range(max(0, int(y_start)), min(surf_height, int(y_stop))):
-            # to get start and end of each row, traverse the lines 
-            # of the triangle that make up the row (on either side)
-            # simply use slope to find x limits given y
-    
-            delta_y = y - y_start
-            x1 = x_start + int(delta_y*x_slope_1)
-            z1 = z_start + delta_y*z_slope_1
-            uv1 = uv_start + delta_y*uv_slope_1
-    
-            # y middle is the where the lines that the row is between changes
-            #   ex: above y_middle, the row is between line 1 and line 2, but below it,
-            #       the line is between line 3 and line 2
-            #                O
-            #       line 1  * *
-            #              *   *  line 2
-            #             O—————*—————————————
-            #               **   *    below this line (y-middle), the rows (x vals) of pixels in the triangle
-            #          line 3  ** *    are between line 3 and line 2, as opposed to line 1 and 2
-            #                     *O 
-            if y < y_middle:
-                x2 = x_start + int(delta_y*x_slope_2)
-                z2 = z_start + delta_y*z_slope_2
-                uv2 = uv_start + delta_y*uv_slope_2
-    
-            else:
-                delta_y = y - y_middle
-                x2 = x_middle + int(delta_y*x_slope_3)
-                z2 = z_middle + delta_y*z_slope_3
-                uv2 = uv_middle + delta_y*uv_slope_3
-                
-            # x1 should be smaller
-            if x1 > x2:
-                x1, x2 = x2, x1
-                z1, z2 = z2, z1
-                uv1, uv2 = uv2, uv1
-    
-            uv_slope = (uv2 - uv1)/(x2 - x1 + 1e-32) # 1e-32 to avoid zero division ¯\_(ツ)_/¯
-            z_slope = (z2 - z1)/(x2 - x1 + 1e-32)
-    
-            # min and max used to cut off pixels not in screen
-            for x in range(max(0, int(x1)), min(surf_width, int(x2))):
-                z = 1/(z1 + (x - x1)*z_slope + 1e-32) # retrive z
-    
-                # if pixel's z distance from cam is closer than previous 
-                #   value in z_buf, update z_buf and draw pixel.
-                # Otherwise, the pixel is behind another pixel (don't render)
-                if (z > z_buffer[x, y]):
-                    continue
-                z_buffer[x, y] = z
-    
-                # multiply by z to go back to uv space
-                uv = (uv1 + (x - x1)*uv_slope)*z
-                # for now, shading is determined by distance from cam (farther=darker)
-                shade = max(0, 1 - z/(20))
-                # don't render texture if uv out of bounds
-                if (min(uv) >= 0 and max(uv) <= 1): 
-                    surfarray[x, y] = texture[int(uv[0]*tex_size[0])][int(uv[1]*tex_size[1])]*shade
-    
-    
-    @staticmethod
-    @numba.njit()
-    def __draw_wireframe(surfarray, triangle):
-
-        surf_width, surf_height = len(surfarray), len(surfarray[0])
-        centered_tri = np.asarray([(int(point[0]+surf_width//2), int(surf_height//2-point[1]), point[2]) for point in triangle])
-    
-        sorted_y = centered_tri[:,1].argsort()
-    
-        x_start, y_start, z_start = centered_tri[sorted_y[0]]
-        x_middle, y_middle, z_middle = centered_tri[sorted_y[1]]
-        x_stop, y_stop, z_stop = centered_tri[sorted_y[2]] 
-    
-        x_slope_1 = (x_stop - x_start)/(y_stop - y_start + 1e-32)
-        x_slope_2 = (x_middle - x_start)/(y_middle - y_start + 1e-32)
-        x_slope_3 = (x_stop - x_middle)/(y_stop - y_middle + 1e-32)  
-        
-    
-        # invert z for interpolation
-        z_start, z_middle, z_stop = 1/(z_start +1e-32), 1/(z_middle + 1e-32), 1/(z_stop +1e-32)
-    
-        z_slope_1 = (z_stop - z_start)/(y_stop - y_start + 1e-32) 
-        z_slope_2 = (z_middle - z_start)/(y_middle - y_start + 1e-32) 
-        z_slope_3 = (z_stop - z_middle)/(y_stop - y_middle + 1e-32)  
-        
-        for y in range(max(0, int(y_start)), min(surf_height, int(y_stop))):
-    
-            delta_y = y - y_start
-            x1 = x_start + int(delta_y*x_slope_1)
-            z1 = z_start + delta_y*z_slope_1
-            
-            if y < y_middle:
-                x2 = x_start + int(delta_y*x_slope_2)
-                z2 = z_start + delta_y*z_slope_2 
-                # save right line slope
-                r_slope = x_slope_2
-            else:
-                delta_y = y - y_middle
-                x2 = x_middle + int(delta_y*x_slope_3)
-                z2 = z_middle + delta_y*z_slope_3
-                r_slope = x_slope_3
-                    
-            # x1 should be smaller
-            if x1 > x2:
-                x1, x2 = x2, x1
-                z1, z2 = z2, z1
-        
-            z_slope = (z2 - z1)/(x2 - x1 + 1e-32)
-       
-            # min and max used to cut off pixels not in screen
-            for x in range(max(0, int(x1)), min(surf_width, int(x2))):
-                z = 1/(z1 + (x - x1)*z_slope + 1e-32) # retrive z
-    
-                shade = max(0, 1 - z/(50))
-
-                # stop if too far
-                if (shade == 0):
-                    continue
-                
-                # closest line
-                d = min(
-                    abs(((y_stop-y_start)*x - (x_stop-x_start)*y + x_stop*y_start - y_stop*x_start)/np.sqrt((y_stop-y_start)**2+(x_stop-x_start)**2)),
-                    min(
-                    abs(((y_middle-y_start)*x - (x_middle-x_start)*y + x_middle*y_start - y_middle*x_start)/np.sqrt((y_middle-y_start)**2+(x_middle-x_start)**2)),
-                    abs(((y_stop-y_middle)*x - (x_stop-x_middle)*y + x_stop*y_middle - y_stop*x_middle)/np.sqrt((y_stop-y_middle)**2+(x_stop-x_middle)**2))
-                    )
-                ) 
-
-                # draw pixel if close enough to line
-                if (d < 0.5):
-                    surfarray[x, y] = np.asarray((255,255,255))*shade
-
-           
+        return projected
@@ -0,0 +1,281 @@
+import numpy as np
+
+from bvh import AABBTree
+from meshes import Mesh, MeshData
+
+
+class SceneStore:
+    """
+    Keeps the geometry of every mesh in a scene in contiguous, preallocated arrays,
+    so a frame doesn't need to flatten all meshes again.\n
+    Every distinct MeshData is stored once (in local space, indexes relative to its own range),
+    meshes are stored as instances: the index of their data and their position.\n
+    Arrays are only updated when the scene changes: a mesh is added, removed or moved,
+    or its data is marked as updated.\n
+    Mesh bounds (world space) are kept in an AABBTree (items are indexes into meshes), 
+    which is updated incrementally as meshes are added, removed or moved.
+    Meshes tell the store when they move (see Mesh.position), so syncing only visits the meshes that moved.\n
+    Levels of detail of a data (MeshData.lods) are stored as data of their own, used by the data they simplify
+    """
+
+    __slots__ = [
+        'meshes',
+        'data',
+        'vertices',
+        'uvs',
+        'indices',
+        'uv_indices',
+        'textures',
+        'vertex_count',
+        'uv_count',
+        'triangle_count',
+        'data_offsets',
+        'bounds',
+        'lod_table',
+        'instance_data',
+        'positions',
+        'tree',
+        '__data_ids',
+        '__instances',
+        '__dirty',
+        '__instance_buffers',
+        '__leaves',
+        '__indexes',
+        '__moved',
+    ]
+
+    # data arrays are grouped into pools, each filled up to its own count:
+    #   pool name : (count attribute, arrays in pool)
+    __POOLS = {
+        'vertex'  : ('vertex_count'  , ('vertices',)),
+        'uv'      : ('uv_count'      , ('uvs',)),
+        'triangle': ('triangle_count', ('indices', 'uv_indices', 'textures')),
+    }
+
+    # most levels of detail used per data (including the data itself)
+    MAX_LODS = 8
+
+    def __init__(self, capacity: int = 1024):
+        # meshes in scene (in order of addition), and distinct data they use
+        self.meshes: list[Mesh] = []
+        self.data: list[MeshData] = []
+
+        # buffers of all data, only the first `count` entries of each pool are in use
+        self.vertices  : np.ndarray = np.empty((capacity, 3), dtype=np.double)
+        self.uvs       : np.ndarray = np.empty((capacity, 2), dtype=np.double)
+        self.indices   : np.ndarray = np.empty((capacity, 3), dtype=np.int32)
+        self.uv_indices: np.ndarray = np.empty((capacity, 3), dtype=np.int32)
+        self.textures  : np.ndarray = np.empty((capacity,)  , dtype=np.uint16)
+
+        self.vertex_count: int = 0
+        self.uv_count: int = 0
+        self.triangle_count: int = 0
+
+        # per data (same order as data):
+        #   data_offsets: (start, count) of the data's range in each pool (vertex, uv, triangle)
+        #   bounds:       aabb of the data (local space), see MeshData.aabb
+        #   lod_table:    index of the data used for each level of detail (the data itself first,
+        #                 padded with its last level)
+        self.data_offsets: np.ndarray = np.empty((0, 3, 2), dtype=np.int64)
+        self.bounds      : np.ndarray = np.empty((0, 2, 3), dtype=np.double)
+        self.lod_table   : np.ndarray = np.empty((0, self.MAX_LODS), dtype=np.int64)
+        self.__data_ids: dict[int, int] = {}        # id(MeshData) -> index in data
+        self.__instances: list[int] = []            # amount of meshes (and data, for levels of detail) using data
+        self.__dirty: list[bool] = []               # whether data needs to be rewritten
+
+        # per mesh (same order as meshes):
+        #   instance_data: index of mesh's data
+        #   positions:     mesh positions (updated by sync)
+        # (views of the first len(meshes) entries of larger buffers, so adding a mesh doesn't copy all of them)
+        self.__instance_buffers: tuple = (np.empty((capacity,), dtype=np.int64), np.empty((capacity, 3), dtype=np.double))
+        self.instance_data: np.ndarray = self.__instance_buffers[0][:0]
+        self.positions    : np.ndarray = self.__instance_buffers[1][:0]
+        self.__leaves: list[int] = []               # node of mesh in tree
+        self.__indexes: dict[int, int] = {}         # id(Mesh) -> index in meshes
+        self.__moved: dict[int, Mesh] = {}          # meshes moved since last sync, by id
+
+        self.tree: AABBTree = AABBTree()
+
+    def add(self, mesh: Mesh) -> None:
+        "Add a mesh, its data is appended to the buffers if not already stored"
+        if (id(mesh) in self.__indexes):
+            raise ValueError("mesh is already in the scene (use mesh.instance() for another copy)")
+        if (id(mesh.data) not in self.__data_ids):
+            self.__add_data(mesh.data)
+        data_index = self.__data_ids[id(mesh.data)]
+        self.__instances[data_index] += 1
+
+        count = len(self.meshes)
+        if (count == len(self.__instance_buffers[0])):
+            self.__instance_buffers = tuple(
+                np.concatenate((buffer, np.empty_like(buffer))) for buffer in self.__instance_buffers
+            )
+        self.__instance_buffers[0][count] = data_index
+        self.__instance_buffers[1][count] = mesh.position
+        self.instance_data = self.__instance_buffers[0][:count+1]
+        self.positions = self.__instance_buffers[1][:count+1]
+        self.meshes.append(mesh)
+        self.__indexes[id(mesh)] = count
+        mesh.scenes.append(self)
+
+        self.__leaves.append(self.tree.insert(*self.__world_bounds(count), count))
+
+    def remove(self, mesh: Mesh) -> None:
+        "Remove a mesh, its data is removed from the buffers if no other mesh uses it"
+        index = self.__indexes.pop(id(mesh))
+        data_index = self.instance_data[index]
+        mesh.scenes.remove(self)
+        self.__moved.pop(id(mesh), None)
+
+        # move meshes after it back
+        count = len(self.meshes)
+        for buffer in self.__instance_buffers:
+            buffer[index:count-1] = buffer[index+1:count]
+        self.instance_data = self.__instance_buffers[0][:count-1]
+        self.positions = self.__instance_buffers[1][:count-1]
+        del self.meshes[index]
+        for moved_index in range(index, count-1):
+            self.__indexes[id(self.meshes[moved_index])] = moved_index
+
+        self.tree.remove(self.__leaves.pop(index))
+        self.tree.shift_items(index)
+
+        self.__instances[data_index] -= 1
+        if (not self.__instances[data_index]):
+            self.__remove_data(data_index)
+
+    def update(self, mesh: Mesh) -> None:
+        """Mark a mesh's data to be rewritten on next sync (affects every mesh sharing the data).\n
+        Needed if it was modified in place (array sizes must stay the same)"""
+        self.__dirty[self.__data_ids[id(mesh.data)]] = True
+
+    def moved(self, mesh: Mesh) -> None:
+        "Mark a mesh as moved, its position is read on next sync (called by Mesh when its position is set)"
+        self.__moved[id(mesh)] = mesh
+
+    def sync(self) -> None:
+        "Read positions of meshes that moved, and rewrite data marked dirty (updating tree for meshes that moved or changed)"
+        moved = set()
+        for mesh in self.__moved.values():
+            index = self.__indexes[id(mesh)]
+            self.positions[index] = mesh.position
+            moved.add(index)
+        self.__moved.clear()
+
+        for data_index, dirty in enumerate(self.__dirty):
+            if (dirty):
+                self.__write_data(data_index)
+                moved.update(np.flatnonzero(self.instance_data == data_index).tolist())
+
+        for index in moved:
+            self.tree.move(self.__leaves[index], *self.__world_bounds(index))
+
+    def ray_cast(self, origin, direction, max_distance: float = np.inf) -> list:
+        """Meshes whose bounding box is hit by a ray (as of last sync), nearest first.\n
+        Returns list of (distance along ray in multiples of direction, mesh)"""
+        items, distances = self.tree.ray_cast(origin, direction, max_distance)
+        return [(distance, self.meshes[item]) for item, distance in zip(items, distances)]
+
+    def query_region(self, lo, hi) -> list:
+        "Meshes whose bounding box overlaps the box from lo to hi (as of last sync)"
+        return [self.meshes[item] for item in np.sort(self.tree.query_aabb(lo, hi))]
+
+    def __world_bounds(self, index: int) -> tuple:
+        "(min point, max point) of mesh's bounding box, in world space"
+        aabb = self.bounds[self.instance_data[index]]
+        return aabb[0] + self.positions[index], aabb[1] + self.positions[index]
+
+    def __add_data(self, data: MeshData) -> None:
+        offsets = []
+        for pool, count in zip(self.__POOLS, self.__counts(data)):
+            start = getattr(self, self.__POOLS[pool][0])
+            self.__reserve(pool, start + count)
+            setattr(self, self.__POOLS[pool][0], start + count)
+            offsets.append((start, count))
+
+        data_index = len(self.data)
+        self.data_offsets = np.concatenate((self.data_offsets, (offsets,)))
+        self.bounds = np.concatenate((self.bounds, (data.aabb,)))
+        self.lod_table = np.concatenate((self.lod_table, np.full((1, self.MAX_LODS), data_index)))
+        self.__data_ids[id(data)] = data_index
+        self.__instances.append(0)
+        self.__dirty.append(True)
+        self.data.append(data)
+
+        # levels of detail (added after their data, so they don't change its index)
+        for level, lod in enumerate(data.lods[:self.MAX_LODS-1], 1):
+            if (id(lod) not in self.__data_ids):
+                self.__add_data(lod)
+            lod_index = self.__data_ids[id(lod)]
+            self.__instances[lod_index] += 1
+            self.lod_table[data_index, level:] = lod_index
+
+    def __remove_data(self, data_index: int) -> None:
+        "Remove data (and its levels of detail no other data uses), moving the data after it back to fill the gap (order is kept)"
+        lods = [lod for lod in np.unique(self.lod_table[data_index]) if lod != data_index]
+        for pool_index, (count_attr, arrays) in enumerate(self.__POOLS.values()):
+            start, count = self.data_offsets[data_index, pool_index]
+            size = getattr(self, count_attr)
+
+            for name in arrays:
+                array = getattr(self, name)
+                array[start:size-count] = array[start+count:size]
+            setattr(self, count_attr, size - count)
+
+        self.data_offsets[data_index+1:, :, 0] -= self.data_offsets[data_index, :, 1]
+        self.data_offsets = np.delete(self.data_offsets, data_index, axis=0)
+        self.bounds = np.delete(self.bounds, data_index, axis=0)
+        self.lod_table = np.delete(self.lod_table, data_index, axis=0)
+        self.lod_table[self.lod_table > data_index] -= 1
+        self.instance_data[self.instance_data > data_index] -= 1
+
+        del self.__data_ids[id(self.data[data_index])]
+        for data in self.data[data_index+1:]:
+            self.__data_ids[id(data)] -= 1
+        del self.__instances[data_index]
+        del self.__dirty[data_index]
+        del self.data[data_index]
+
+        # (highest index first, so indexes of the ones left stay valid)
+        for lod in sorted(lods, reverse=True):
+            lod -= lod > data_index
+            self.__instances[lod] -= 1
+            if (not self.__instances[lod]):
+                self.__remove_data(lod)
+
+    def __write_data(self, data_index: int) -> None:
+        data = self.data[data_index]
+        (vtx_start, vtx_count), (uv_start, uv_count), (tri_start, tri_count) = self.data_offsets[data_index]
+
+        if (self.__counts(data) != (vtx_count, uv_count, tri_count)):
+            raise ValueError("size of mesh data changed, remove and add its meshes again instead")
+
+        self.vertices[vtx_start:vtx_start+vtx_count] = data.vertices
+        self.uvs[uv_start:uv_start+uv_count] = data.uvs
+        self.indices[tri_start:tri_start+tri_count] = data.indices
+        self.uv_indices[tri_start:tri_start+tri_count] = data.uv_indices
+        self.textures[tri_start:tri_start+tri_count] = data.textures
+
+        # vertices may have moved
+        data.update_bounds()
+        self.bounds[data_index] = data.aabb
+
+        self.__dirty[data_index] = False
+
+    @staticmethod
+    def __counts(data: MeshData) -> tuple:
+        "size of data in each pool"
+        return (len(data.vertices), len(data.uvs), len(data.indices))
+
+    def __reserve(self, pool: str, capacity: int) -> None:
+        "Grow arrays of pool (doubling capacity) so at least `capacity` entries fit"
+        count_attr, arrays = self.__POOLS[pool]
+        if (capacity <= len(getattr(self, arrays[0]))):
+            return
+        new_capacity = max(capacity, 2*len(getattr(self, arrays[0])))
+
+        for name in arrays:
+            old = getattr(self, name)
+            new = np.empty((new_capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:getattr(self, count_attr)] = old[:getattr(self, count_attr)]
+            setattr(self, name, new)
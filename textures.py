@@ -1,32 +1,133 @@
 import pygame
+import numpy as np
 
 TEXTURE_NOT_FOUND = "./assets/Missing.png"
+# most mip levels a texture can have (enough for 32768 x 32768 textures)
+MIP_LEVELS = 16
 
 class Atlas:
-    __slots__ = ['aliases', 'textures']
+    """
+    Stores textures by alias and index.\n
+    Besides the list of textures, all textures are packed into one contiguous pixel buffer,
+    so compiled functions can sample any texture by index. Each texture is packed with its mip chain
+    (see mip_chain), level 0 being the texture itself:
+        pixels: (n, 3) uint8 array, every level's pixels flattened (column by column, like array3d)
+        table:  (textures, MIP_LEVELS, 3) int64 array of each level's (offset in pixels, width, height),
+                levels past the end of a chain repeat its last (1x1) level
+    pixel (u, v) of level l of texture i is pixels[table[i, l, 0] + u*table[i, l, 2] + v]
+    """
+    __slots__ = ['aliases', 'textures', 'pixels', 'table', '__used', '__holes']
 
     def __init__(self, default=TEXTURE_NOT_FOUND):
         # dict of texture names, mapped to their index in texture list
         self.aliases : dict[str:int] = {'':0}
         # list of actual textures; retrieve with index
-        self.textures: list = [pygame.surfarray.array3d(pygame.image.load(default))]
+        self.textures: list = []
+
+        # packed buffer (only the first `used` pixels are in use, some of which may be holes
+        # left by replaced textures)
+        self.pixels: np.ndarray = np.empty((0, 3), dtype=np.uint8)
+        self.table : np.ndarray = np.empty((0, MIP_LEVELS, 3), dtype=np.int64)
+        self.__used : int = 0
+        self.__holes: int = 0
+
+        self.__pack(0, pygame.surfarray.array3d(pygame.image.load(default)))
 
     def add_tex(self, alias, texture):
         "Adds texture, updating list of textures as needed (duplicates are overwritten)"
         if (alias in self.aliases):
-            self.textures[self.aliases[alias]] = texture
+            self.__pack(self.aliases[alias], texture)
         else:
             self.aliases[alias] = len(self.textures)
-            self.textures.append(texture)
+            self.__pack(len(self.textures), texture)
 
     def alias_lookup(self, alias):
         "Convenience method to lookup a texture given an alias"
         return self.textures[self.aliases[alias]]
-    
+
     def __getitem__(self, key):
         return self.textures[key] if (isinstance(key, int)) else self.aliases[key]
-    
+
     def __contains__(self, item):
         return item in self.aliases
 
+    def __pack(self, index: int, texture) -> None:
+        """Store texture at index (appending or replacing), and update packed buffer:
+        a replacement of the same size is written in place, otherwise the texture is appended"""
+        texture = np.asarray(texture, dtype=np.uint8)
+        width, height = texture.shape[:2]
+        levels = mip_chain(texture)
+        flat = np.concatenate([level.reshape(-1, 3) for level in levels])
+
+        if (index == len(self.textures)):
+            self.textures.append(texture)
+            self.table = np.concatenate((self.table, np.zeros((1, MIP_LEVELS, 3), dtype=np.int64)))
+        else:
+            self.textures[index] = texture
+            if (tuple(self.table[index, 0, 1:]) == (width, height)):
+                offset = self.table[index, 0, 0]
+                self.pixels[offset:offset+len(flat)] = flat
+                return
+            # old pixels become a hole
+            self.__holes += chain_size(*self.table[index, 0, 1:])
+            self.table[index] = 0
+
+        # compact once holes take up most of the buffer
+        if (self.__holes > self.__used//2):
+            self.__compact()
+
+        if (self.__used + len(flat) > len(self.pixels)):
+            grown = np.empty((max(self.__used + len(flat), 2*len(self.pixels)), 3), dtype=np.uint8)
+            grown[:self.__used] = self.pixels[:self.__used]
+            self.pixels = grown
+
+        self.pixels[self.__used:self.__used+len(flat)] = flat
+        offset = self.__used
+        for level in range(MIP_LEVELS):
+            level_width, level_height = levels[min(level, len(levels)-1)].shape[:2]
+            self.table[index, level] = (offset, level_width, level_height)
+            if (level < len(levels)-1):
+                offset += level_width*level_height
+        self.__used += len(flat)
+
+    def __compact(self) -> None:
+        "Repack textures without holes (in order of index)"
+        offset = 0
+        for index in range(len(self.textures)):
+            if (self.table[index, 0, 1] == 0): # being added, not packed yet
+                continue
+            # (chains only move towards the start of the buffer, numpy handles the overlap)
+            start, size = self.table[index, 0, 0], chain_size(*self.table[index, 0, 1:])
+            self.pixels[offset:offset+size] = self.pixels[start:start+size]
+            self.table[index, :, 0] += offset - start
+            offset += size
+        self.__used = offset
+        self.__holes = 0
+
+
+def mip_chain(texture: np.ndarray) -> list[np.ndarray]:
+    """Mip levels of a (width, height, 3) texture: the texture, then each level halved in both
+    dimensions (rounded down, at least 1) until 1x1. Each texel averages the 2x2 texels it covers
+    (when a dimension is odd, its last row or column is dropped)"""
+    levels = [texture]
+    while (levels[-1].shape[0] > 1) or (levels[-1].shape[1] > 1):
+        level = levels[-1].astype(np.uint16)
+        for axis in (0, 1):
+            size = level.shape[axis]//2
+            if (size):
+                # (+1 rounds to nearest)
+                level = (level.take(range(0, 2*size, 2), axis) + level.take(range(1, 2*size, 2), axis) + 1)//2
+        levels.append(level.astype(np.uint8))
+    if (len(levels) > MIP_LEVELS):
+        raise ValueError(f"textures can't be larger than {2**(MIP_LEVELS-1)} pixels in either dimension")
+    return levels
+
+def chain_size(width: int, height: int) -> int:
+    "Amount of pixels in the mip chain of a width x height texture (see mip_chain)"
+    size = width*height
+    while (width > 1) or (height > 1):
+        width, height = max(1, width//2), max(1, height//2)
+        size += width*height
+    return size
+
 # add tests